@@ -1,11 +1,17 @@
 from commands.add_user import AddUser
+from commands.archive import Archive
 from commands.default import Default
+from commands.gc import Gc
+from commands.migrate_solutions import MigrateSolutions
 from commands.submit import Submit
 
 commands = {
     Default.get_name(): Default(),
     Submit.get_name(): Submit(),
     AddUser.get_name(): AddUser(),
+    Gc.get_name(): Gc(),
+    MigrateSolutions.get_name(): MigrateSolutions(),
+    Archive.get_name(): Archive(),
 }
 
 
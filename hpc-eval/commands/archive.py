@@ -0,0 +1,84 @@
+import argparse
+import datetime
+import time
+from loguru import logger
+from typing import override
+from commands.base import BaseCommand
+from components.solutions import Solutions
+
+
+class Archive(BaseCommand):
+    '''
+    Pack old solutions into compressed per-assignment pack files (saves inodes and quota).
+    Packed solutions are extracted on demand when they are needed again.
+    '''
+    @staticmethod
+    def get_name() -> str:
+        return 'archive'
+
+    def __init__(self):
+        super().__init__()
+        self.solutions = Solutions()
+
+    @override
+    def _prepare_args_parser(self) -> argparse.ArgumentParser:
+        parser = super()._prepare_args_parser()
+        parser.add_argument('--before', type=str,
+                            help='Archive solutions submitted before given date (YYYY-MM-DD).')
+        parser.add_argument('--older-than', type=int,
+                            help='Archive solutions submitted more than given number of days ago.')
+        parser.add_argument('--assignment', type=str,
+                            help='Archive only solutions of given assignment.')
+        return parser
+
+    @override
+    def _validate_args(self) -> bool:
+        if (self.args.before is None) == (self.args.older_than is None):
+            print("Exactly one of --before or --older-than must be specified.")
+            return False
+
+        if self.args.before is not None:
+            try:
+                datetime.datetime.strptime(self.args.before, '%Y-%m-%d')
+            except ValueError:
+                print(f"Invalid date '{self.args.before}', YYYY-MM-DD format is expected.")
+                return False
+        return True
+
+    def _get_cutoff(self) -> int:
+        if self.args.before is not None:
+            return int(datetime.datetime.strptime(self.args.before, '%Y-%m-%d').timestamp())
+        return int(time.time()) - self.args.older_than * 86400
+
+    @override
+    def load_state(self) -> None:
+        if self.solutions.serialization_file_exists():
+            self.solutions.load_json(keep_open=True, exclusive=True)  # for update
+
+    @override
+    def execute(self) -> None:
+        cutoff = self._get_cutoff()
+        assignments = {}
+        for solution in self.solutions.solutions.values():
+            if solution.submitted_at >= cutoff:
+                continue
+            if self.args.assignment and solution.assignment_id != self.args.assignment:
+                continue
+            assignments.setdefault(solution.assignment_id, []).append(solution)
+
+        total = {'solutions': 0, 'inodes': 0, 'bytes': 0, 'pack_bytes': 0}
+        for assignment_id, solutions in assignments.items():
+            # records are saved right after the pack is created (before the packed dirs are removed)
+            stats = self.workspace.pack_solution_dirs(
+                assignment_id, solutions, lambda: self.solutions.save_json(keep_open=True))
+            logger.debug(f"Assignment '{assignment_id}': {stats['solutions']} solutions packed.")
+            for key in total:
+                total[key] += stats[key]
+
+        logger.info(f"Packed {total['solutions']} solutions into {total['pack_bytes']} bytes, removed "
+                    f"{total['inodes']} inodes and {total['bytes']} bytes "
+                    f"({total['bytes'] - total['pack_bytes']} bytes saved).")
+
+    @override
+    def save_state(self) -> None:
+        self.solutions.save_json()
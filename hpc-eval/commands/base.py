@@ -2,6 +2,7 @@ import argparse
 import config.descriptors as cd
 from config.loader import ConfigLoader
 from components.workspace import Workspace
+from components.assignments import Assignments
 from components.log_init import LogInit
 from components.users import Users
 
@@ -19,6 +20,7 @@ class BaseCommand:
         self.logger = LogInit()  # initializes loguru logger on construction
         self.workspace = Workspace()
         self.users = Users()
+        self.assignments = Assignments()
         self.args = None  # not loaded yet
 
     def _prepare_args_parser(self) -> argparse.ArgumentParser:
@@ -67,6 +69,11 @@ class BaseCommand:
             if ConfigLoader.is_configurable(val.__class__):
                 self.__dict__[key] = val.__class__(config=config[key])  # replace blank instane with a configured one
 
+        # opportunistic removal of temp data abandoned by failed commands (rate-limited)
+        workspace = self.__dict__.get('workspace')
+        if workspace and workspace.tmp_cleanup:
+            workspace.cleanup_tmp_dirs_if_due()
+
     def load_state(self) -> None:
         '''
         Load states of the components, perform necessary file locking.
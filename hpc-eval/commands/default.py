@@ -1,30 +1,74 @@
 import argparse
+import time
+from loguru import logger
 from typing import override
 from commands.base import BaseCommand
+from components.evaluator import Evaluator
+from components.solutions import Solutions
 
 
 class Default(BaseCommand):
     '''
-    Default command performs all the steps of evaluation (download, build, test, save results).
+    Default command performs all the steps of evaluation (build, test, save results).
+    Solutions that have not been evaluated yet are taken unless explicitly selected.
     '''
     @staticmethod
     def get_name() -> str:
         return 'default'
 
     def __init__(self):
-        pass
+        super().__init__()
+        self.solutions = Solutions()
+        self.evaluator = Evaluator()
+        self.slurm = None  # job dispatching interface override (Evaluator creates its own if None)
 
     @override
     def _prepare_args_parser(self) -> argparse.ArgumentParser:
         parser = super()._prepare_args_parser()
+        parser.add_argument('--assignment', type=str,
+                            help='Evaluate only solutions of given assignment.')
+        parser.add_argument('--solution', type=str, action='append',
+                            help='ID of a solution to be evaluated (may be used multiple times).')
+        parser.add_argument('--reevaluate', action='store_true', default=False,
+                            help='Evaluate selected solutions even if they were evaluated before.')
         return parser
 
     @override
-    def _validate_args(self) -> bool:
-        print("Args are faulty...")
-        return False
+    def load_state(self) -> None:
+        if self.solutions.serialization_file_exists():
+            self.solutions.load_json()  # the lock is not held during the (long) evaluation
+
+    def _select_solutions(self) -> list:
+        if self.args.solution:
+            solutions = []
+            for id in self.args.solution:
+                if self.solutions[id] is None:
+                    logger.warning(f"Solution '{id}' does not exist.")
+                else:
+                    solutions.append(self.solutions[id])
+        else:
+            solutions = list(self.solutions.solutions.values())
+
+        return [solution for solution in solutions
+                if (not self.args.assignment or solution.assignment_id == self.args.assignment)
+                and (self.args.reevaluate or solution.evaluated_at is None)]
 
     @override
     def execute(self) -> None:
-        print("Executing default...")
-        print(self.args)
+        solutions = self._select_solutions()
+        if not solutions:
+            logger.info("No solutions to evaluate.")
+            return
+
+        results = self.evaluator.evaluate(self.workspace, self.assignments, solutions, self.slurm)
+        for result in results.values():
+            result.save_json(self.workspace.get_result_file(self.solutions[result.solution_id]))
+
+        # mark the solutions as evaluated (the records are reloaded, they may have been modified meanwhile)
+        self.solutions.load_json(keep_open=True, exclusive=True)
+        ts = int(time.time())
+        for solution in solutions:
+            if self.solutions[solution.id] is not None:
+                self.solutions[solution.id].evaluated_at = ts
+        self.solutions.save_json()
+        logger.info(f"Evaluation of {len(solutions)} solutions finished, {len(results)} results saved.")
@@ -0,0 +1,40 @@
+import argparse
+from loguru import logger
+from typing import override
+from commands.base import BaseCommand
+
+
+class Gc(BaseCommand):
+    '''
+    Garbage collection of the workspace (removes stale temp dirs and unreferenced objects from the deduplicated
+    solution store).
+    '''
+    @staticmethod
+    def get_name() -> str:
+        return 'gc'
+
+    @override
+    def _prepare_args_parser(self) -> argparse.ArgumentParser:
+        parser = super()._prepare_args_parser()
+        parser.add_argument('--tmp-max-age', type=int,
+                            help='Temp dirs older than this [s] are removed (overrides workspace.tmp_max_age).')
+        return parser
+
+    @override
+    def execute(self) -> None:
+        # temp dirs first, they may hold references to stored objects
+        removed = self.workspace.cleanup_tmp_dirs(self.args.tmp_max_age)
+        logger.info(f"Removed {removed} stale temp dirs.")
+
+        store = self.workspace.object_store
+        if store is None:
+            logger.info("Solution deduplication is not enabled, no objects to collect.")
+            return
+
+        removed, freed = store.gc()
+        logger.info(f"Removed {removed} unreferenced objects ({freed} bytes freed).")
+
+        stats = store.get_stats()
+        logger.info(f"Object store holds {stats['objects']} objects ({stats['physical_bytes']} bytes) referenced "
+                    f"{stats['references']} times ({stats['logical_bytes']} bytes), "
+                    f"dedup ratio is {stats['ratio']:.2f}.")
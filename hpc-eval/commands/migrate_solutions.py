@@ -0,0 +1,49 @@
+import argparse
+from loguru import logger
+from typing import override
+from commands.base import BaseCommand
+from components.solutions import Solutions
+from components.workspace import SolutionLayout
+
+
+class MigrateSolutions(BaseCommand):
+    '''
+    Move existing solution dirs from an old layout of the solutions archive into the currently configured layout.
+    '''
+    @staticmethod
+    def get_name() -> str:
+        return 'migrate_solutions'
+
+    def __init__(self):
+        super().__init__()
+        self.solutions = Solutions()
+
+    @override
+    def _prepare_args_parser(self) -> argparse.ArgumentParser:
+        parser = super()._prepare_args_parser()
+        parser.add_argument('--from-user-shards', type=int, default=0,
+                            help='Number of user hash-prefix levels of the old layout.')
+        parser.add_argument('--from-buckets', type=str, default='none', choices=list(SolutionLayout.bucket_formats),
+                            help='Time buckets of the old layout.')
+        return parser
+
+    @override
+    def load_state(self) -> None:
+        if self.solutions.serialization_file_exists():
+            self.solutions.load_json(keep_open=True, exclusive=True)  # no submits while we move things around
+
+    @override
+    def execute(self) -> None:
+        old_layout = SolutionLayout(self.args.from_user_shards, self.args.from_buckets)
+        moved = 0
+        skipped = 0
+        for solution in self.solutions.solutions.values():
+            if self.workspace.move_solution_dir(solution, old_layout):
+                moved += 1
+            else:
+                skipped += 1
+        logger.info(f"Moved {moved} solution dirs into the current layout ({skipped} were not found or moved already).")
+
+    @override
+    def save_state(self) -> None:
+        self.solutions.close_serialization_file()
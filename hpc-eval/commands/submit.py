@@ -1,12 +1,14 @@
 import os
 import argparse
 import shutil
-import zipfile
 from typing import override
 from loguru import logger
+from helpers.archive import archive_types, get_archive_type
+from helpers.file_copy import walk_tree
 from commands.base import BaseCommand
 from components.solutions import Solution, Solutions
 from components.assignments import Assignment
+from components.manifest import Manifest
 
 
 class Submit(BaseCommand):
@@ -35,7 +37,8 @@ class Submit(BaseCommand):
         parser.add_argument('--assignment', type=str,
                             help='Identification of the assignment being submitted.')
         parser.add_argument('--extract', default=False, action="store_true",
-                            help='Extract a .zip archive into the submit box. Only a sigle file must be given.')
+                            help='Extract an archive (' + ', '.join(archive_types)
+                            + ') into the submit box. Only a sigle file must be given.')
         parser.add_argument('files', type=str, metavar="file", nargs="+",
                             help='File to be copied into submit box.')
         return parser
@@ -51,8 +54,8 @@ class Submit(BaseCommand):
                 print("If --extract option is selected, a single archive file must be given.")
                 return False
 
-            if not self.args.files[0].endswith('.zip'):
-                print("Only .zip archives are supported by the extraction option at the moment.")
+            if get_archive_type(self.args.files[0]) is None:
+                print(f"Only {', '.join(archive_types)} archives are supported by the extraction option.")
                 return False
 
         for file in self.args.files:
@@ -85,27 +88,38 @@ class Submit(BaseCommand):
             return None
         return solution
 
-    def _prepare_temp_dir(self) -> str:
+    def _collect_files(self, tmp_dir: str) -> list[tuple[str, str]]:
+        '''
+        Replicate the directory structure of the submitted files in tmp dir.
+        Returns a list of (source, target) pairs of all files that need to be copied.
+        '''
+        files = []
+        for file in self.args.files:
+            if os.path.isdir(file):  # dirs are copied recursively (symlinks are followed unless they form a loop)
+                logger.trace(f"Copying directory '{file}' recursively.")
+                base = f'{tmp_dir}/{os.path.basename(os.path.normpath(file))}'
+                for dir, names in walk_tree(file):
+                    target_dir = os.path.normpath(f'{base}/{os.path.relpath(dir, file)}')
+                    os.makedirs(target_dir, exist_ok=True)
+                    files.extend([(f'{dir}/{name}', f'{target_dir}/{name}') for name in names])
+            else:
+                logger.trace(f"Copying file '{file}'.")
+                files.append((file, f'{tmp_dir}/{os.path.basename(file)}'))
+        return files
+
+    def _prepare_temp_dir(self, tmp_dir: str) -> dict:
         '''
         Stage a temp dir with a copy of all submitted files.
-        Returns path to the tmp dir.
+        Returns content hashes of staged files (path -> digest) computed while the files were staged.
         '''
-        tmp_dir = self.workspace.create_tmp_dir('submit')
         logger.debug(f'Staging newly submitted files in {tmp_dir}.')
-
         if self.args.extract:
-            logger.trace(f"Extracting ZIP '{self.args.files[0]}'.")
-            with zipfile.ZipFile(self.args.files[0], 'r') as zip_ref:
-                zip_ref.extractall(tmp_dir)
+            stats = self.workspace.extract_archive(self.args.files[0], tmp_dir, compute_digests=True)
         else:
-            for file in self.args.files:
-                if os.path.isdir(file):  # dirs are copied recursively
-                    logger.trace(f"Copying directory '{file}' recursively.")
-                    shutil.copytree(file, f'{tmp_dir}/{os.path.basename(file)}', copy_function=shutil.copy)
-                else:
-                    logger.trace(f"Copying file '{file}'.")
-                    shutil.copy(file, tmp_dir)
-        return tmp_dir
+            files = self._collect_files(tmp_dir)
+            stats = self.workspace.copy_files(files, compute_digests=True)  # the copying is done in parallel
+        logger.info(f"Staged {stats}.")
+        return stats.digests
 
     @override
     def execute(self) -> None:
@@ -127,13 +141,17 @@ class Submit(BaseCommand):
             logger.error("A solution with given ID (or external ID) already exists.")
             return
 
+        tmp_dir = None
         try:
-            tmp_dir = self._prepare_temp_dir()  # staging first
-            self.workspace.save_solution_dir(tmp_dir, solution)
+            tmp_dir = self.workspace.create_tmp_dir('submit')
+            digests = self._prepare_temp_dir(tmp_dir)  # staging first
+            manifest = Manifest.from_dir(tmp_dir, digests)
+            solution.manifest = self.workspace.save_manifest(manifest)
+            self.workspace.save_solution_dir(tmp_dir, solution, digests)
         except Exception as e:
             # undo the solution creation if something fails
             self.solutions.remove_solution(solution.id)
-            if os.path.isdir(tmp_dir):
+            if tmp_dir and os.path.isdir(tmp_dir):
                 shutil.rmtree(tmp_dir, ignore_errors=True)
             raise e
 
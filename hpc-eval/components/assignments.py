@@ -1,24 +1,66 @@
 # from typing import override
+import os
 from loguru import logger
 import config.descriptors as cd
 from helpers.serializable import Serializable
 
 
+def _normalize_command_arg(arg, base_file, _):
+    '''
+    Postprocessor of generator command arguments. An argument referring to an existing file relative to the config
+    file (like a generator script) is made absolute, other arguments (e.g., executables found in PATH) are kept.
+    '''
+    if not base_file or os.path.isabs(arg):
+        return arg
+    path = os.path.normpath(f'{os.path.dirname(base_file)}/{arg}')
+    return path if os.path.isfile(path) else arg
+
+
 class Assignment(Serializable):
+    '''
+    Entity representing one assignment (its builds and tests are loaded from config).
+    '''
+
     def __init__(self, id: str | None = None, config: dict = {}):
         logger.trace(f'Assignment.__init__({config})')
         self.id = id
+        self.builds = config.get('builds', {})
+        self.tests = config.get('tests', {})
+
+    def get_test_build(self, test_name: str) -> dict | None:
+        '''
+        Return build specification referred by given test (None if the test requires no build).
+        '''
+        build = self.tests[test_name].get('build')
+        if not build:
+            return None
+        if build not in self.builds:
+            raise RuntimeError(f"Test '{test_name}' of assignment '{self.id}' refers to unknown build '{build}'.")
+        return self.builds[build]
 
 
 class Assignments:
     _config = cd.NamedList(cd.Dictionary({
         'builds': cd.NamedList(cd.Dictionary({
             'overlay': cd.String(None, 'Path to the directory with build files.').path(),
-            'run': cd.List(cd.List(cd.String()).collapsible(), 'List of commands to execute for build.'),  # TODO slurm
+            'writable': cd.List(cd.String(), description='Overlay files (glob patterns) modified by the build, they '
+                                'keep their modes (other overlay files are copied read-only from a snapshot).'),
+            'run': cd.List(cd.List(cd.String()).collapsible(),
+                           description='List of commands to execute for build.'),  # TODO slurm
         }), description='List of build specifications (a required build is referred from a test).'),
         'tests': cd.NamedList(cd.Dictionary({
             'build': cd.String(None, 'Reference to a build used for this test.'),
             'inputs': cd.List(cd.String().path(), description='List of files required for the test (like input data).'),
+            'generated': cd.List(cd.Dictionary({
+                'name': cd.String(None, 'Name of the generated file (in the box).'),
+                'command': cd.List(cd.String().set_postprocessor(_normalize_command_arg),
+                                   description='Generator command (data are taken from its stdout), arguments '
+                                   'referring to files relative to the config are made absolute.').collapsible(),
+                'params': cd.List(cd.String(), description='Parameters appended to the command.'),
+                'seed': cd.Integer(0, 'Random seed passed to the generator in SEED environment variable.'),
+            }), description='Inputs produced by generators (each distinct generator is executed once and cached).'),
+            'run': cd.List(cd.List(cd.String()).collapsible(), description='List of commands to execute for the test.'),
+            'outputs': cd.List(cd.String(), description='Files (relative to the box) copied back from scratch.'),
         }), description='List of tests to be executed.'),
         # cd.String('_users.json', 'Path to the JSON file where user records are stored.').path(),
     }))
@@ -31,7 +73,7 @@ class Assignments:
         return __class__._config
 
     def __init__(self, config: dict = {}):
-        self.assignments = {}
+        self.assignments = {id: Assignment(id, cfg) for id, cfg in config.items()}
 
     def __getitem__(self, id) -> Assignment | None:
         '''
@@ -41,3 +83,20 @@ class Assignments:
 
     def __len__(self) -> int:
         return len(self.assignments)
+
+    def get_inputs(self) -> list[str]:
+        '''
+        Return list of all distinct input files of all tests.
+        '''
+        inputs = set()
+        for assignment in self.assignments.values():
+            for test in assignment.tests.values():
+                inputs.update(test.get('inputs', []))
+        return sorted(inputs)
+
+    def get_generators(self) -> list[dict]:
+        '''
+        Return list of all input generators of all tests (duplicates are not removed).
+        '''
+        return [generator for assignment in self.assignments.values() for test in assignment.tests.values()
+                for generator in test.get('generated', [])]
@@ -0,0 +1,117 @@
+from loguru import logger
+import config.descriptors as cd
+from evaluation.engine import Engine
+from evaluation.planner import Planner
+from slurm.local import LocalExecutor
+from slurm.slurm import Slurm
+
+
+class Evaluator:
+    '''
+    Component that evaluates solutions. Each solution is expanded into a graph of build and test jobs
+    which are executed via SLURM (or by a local process pool), the results are collected afterwards.
+    '''
+    _config = cd.Dictionary({
+        'max_running': cd.Integer(100, 'Max. number of jobs submitted and not terminated yet (0 = unlimited).'),
+        'poll_interval': cd.Integer(5, 'Interval [s] between two consecutive polls of job states.'),
+        'min_poll_interval': cd.Integer(1, 'Min. interval [s] between polls, the interval backs off up to '
+                                        'poll_interval while no job is submitted or terminates.'),
+        'array_size': cd.Integer(100, 'Max. number of jobs submitted together as one SLURM array job (0 = no arrays).'),
+        'steps': cd.Integer(0, 'Execute jobs of one solution as srun steps of one allocation with given number '
+                            'of tasks (0 = every job is submitted separately).'),
+        'scratch_dir': cd.String(None, 'Node-local scratch dir where tests run, e.g., ${TMPDIR:-/tmp} (shell variables '
+                                 'are expanded on the node, none = tests run in the workspace).'),
+        'node_cache_dir': cd.String(None, 'Node-local dir where inputs are cached across jobs running in scratch '
+                                    '(e.g., /dev/shm/hpc-eval-inputs, none = inputs are staged with the box).'),
+        'completion_markers': cd.Bool(True, 'Jobs write completion markers into their job dirs, terminations '
+                                      'are detected by watching the markers (inotify) instead of polling SLURM.'),
+        'marker_scan_interval': cd.Integer(30, 'Interval [s] of scans of the completion markers (for filesystems '
+                                           'without inotify) and of verification of jobs with markers by SLURM.'),
+        'submit_parallel': cd.Integer(8, 'Max. number of concurrent sbatch invocations.'),
+        'submit_rate': cd.Integer(0, 'Max. number of sbatch invocations per second (0 = unlimited).'),
+        'executor': cd.String('slurm', 'Backend executing the jobs (slurm or local pool of processes).')
+        .enum(['slurm', 'local']),
+        'local_workers': cd.Integer(0, 'Max. number of jobs executed concurrently by the local executor '
+                                    '(0 = number of available CPUs).'),
+        'slurm': cd.Dictionary({
+            'account': cd.String(None, 'SLURM account to be charged.'),
+            'partition': cd.String(None, 'SLURM partition where the jobs are executed.'),
+            'time': cd.String(None, 'Time limit of one job.'),
+            'mem': cd.String(None, 'Memory limit of one job.'),
+            'cpus-per-task': cd.Integer(None, 'Number of CPUs allocated for a job.'),
+        }, description='Default SLURM arguments of all evaluation jobs.'),
+    })
+
+    @staticmethod
+    def get_config_schema():
+        '''
+        Return configuration descriptor for this component.
+        '''
+        return __class__._config
+
+    def __init__(self, config: dict = {}):
+        logger.trace(f'Evaluator.__init__({config})')
+        config = __class__._config.default | config
+        self.max_running = config['max_running']
+        self.poll_interval = config['poll_interval']
+        self.min_poll_interval = config['min_poll_interval']
+        self.array_size = config['array_size']
+        self.steps = config['steps']
+        self.scratch_dir = config['scratch_dir']
+        self.node_cache_dir = config['node_cache_dir']
+        self.completion_markers = config['completion_markers']
+        self.marker_scan_interval = config['marker_scan_interval']
+        self.submit_parallel = config['submit_parallel']
+        self.submit_rate = config['submit_rate']
+        self.executor = config['executor']
+        self.local_workers = config['local_workers']
+        self.slurm_args = {name: value for name, value in (config['slurm'] or {}).items() if value is not None}
+
+    def _create_executor(self) -> Slurm:
+        if self.executor == 'local':
+            return LocalExecutor(self.slurm_args, self.local_workers)
+        return Slurm(self.slurm_args)
+
+    def evaluate(self, workspace, assignments, solutions: list, slurm: Slurm | None = None) -> dict:
+        '''
+        Evaluate given solutions, returns a dict solution ID -> Result.
+        Optionally, an existing job dispatching interface may be given.
+        '''
+        executor = None if slurm else self._create_executor()
+        try:
+            inputs = workspace.input_cache.ingest(assignments.get_inputs()) if workspace.input_cache else {}
+            generated = workspace.input_generator.generate(assignments.get_generators())
+            inputs |= {key: (key, file) for key, file in generated.items()}
+            planner = Planner(workspace, assignments, self.scratch_dir, inputs, self.node_cache_dir)
+            graph = planner.plan(solutions)
+            engine = Engine(slurm or executor, self.max_running, self.poll_interval,
+                            self.array_size, self.steps, self.submit_parallel, self.submit_rate,
+                            self.min_poll_interval, self.completion_markers, self.marker_scan_interval)
+            engine.run(graph)
+        finally:
+            if executor is not None:
+                executor.close()  # the given interface is closed by its owner
+            if workspace.build_cache:  # cached artifacts used by the evaluation may be evicted from now on
+                workspace.build_cache.unpin_all()
+            workspace.input_generator.cache.unpin_all()
+        if workspace.build_cache:
+            stats = workspace.build_cache.get_stats()
+            logger.info(f"Build cache: {stats['hits']} hits, {stats['misses']} misses "
+                        f"(ratio {stats['hit_ratio']:.2f}), {stats['entries']} entries, {stats['size']} bytes.")
+        results = planner.collect_results(graph)
+        setups = [(job['stage'], job['setup_ms']) for result in results.values() for job in result.jobs.values()
+                  if 'setup_ms' in job]
+        for stage in ['build', 'test']:
+            times = [ms for job_stage, ms in setups if job_stage == stage]
+            if times:
+                logger.info(f"Setup of {len(times)} {stage} boxes took {sum(times)}ms "
+                            f"(max. {max(times)}ms per box).")
+        transfers = [job['transfer'] for result in results.values() for job in result.jobs.values()
+                     if 'transfer' in job]
+        if transfers:
+            logger.info(f"Scratch staging of {len(transfers)} jobs: "
+                        f"{sum([t['staged_bytes'] for t in transfers])} bytes in "
+                        f"({sum([t['stage_in_ms'] for t in transfers])}ms), "
+                        f"{sum([t['returned_bytes'] for t in transfers])} bytes out "
+                        f"({sum([t['stage_out_ms'] for t in transfers])}ms).")
+        return results
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import stat
+from helpers.object_store import compute_digest
+from helpers.serializable import Serializable
+
+
+class Manifest(Serializable):
+    '''
+    Entity describing contents of a solution (relative path, size, mode, and content hash of every file).
+    The tree hash aggregates the whole listing, so identical submissions have identical tree hashes
+    (it can be used as a cache key without touching the files).
+    '''
+
+    def __init__(self):
+        self.files = {}  # relative path -> { size, mode, hash }
+        self.tree_hash = None
+
+    def add_file(self, path: str, size: int, mode: int, digest: str) -> None:
+        '''
+        Add a file record (path is relative to the solution root, mode holds permission bits).
+        '''
+        self.files[path] = {'size': size, 'mode': mode, 'hash': digest}
+        self.tree_hash = None  # invalidate
+
+    def get_size(self) -> int:
+        '''
+        Return total size of all files.
+        '''
+        return sum([file['size'] for file in self.files.values()])
+
+    def get_tree_hash(self) -> str:
+        '''
+        Return aggregate hash of the whole listing (computed lazily).
+        '''
+        if self.tree_hash is None:
+            hash = hashlib.sha256()
+            for path in sorted(self.files):
+                file = self.files[path]
+                hash.update(f"{path}\0{file['mode']:o}\0{file['size']}\0{file['hash']}\n".encode('utf-8'))
+            self.tree_hash = hash.hexdigest()
+        return self.tree_hash
+
+    @staticmethod
+    def from_dir(dir: str, digests: dict | None = None):
+        '''
+        Create a manifest of given directory. Digests (full path -> content hash) computed in advance
+        (e.g., while the files were copied) are used, missing digests are computed.
+        '''
+        digests = digests or {}
+        manifest = Manifest()
+        for path, _, files in os.walk(dir):
+            for file in files:
+                file = f'{path}/{file}'
+                st = os.lstat(file)
+                digest = digests.get(file) or compute_digest(file)
+                manifest.add_file(os.path.relpath(file, dir), st.st_size, stat.S_IMODE(st.st_mode), digest)
+        manifest.get_tree_hash()
+        return manifest
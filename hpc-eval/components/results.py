@@ -0,0 +1,33 @@
+import time
+from helpers.serializable import Serializable
+
+
+class Result(Serializable):
+    '''
+    Entity holding evaluation results of one solution (states of all jobs and outcomes of individual tests).
+    '''
+
+    def __init__(self, solution_id: str | None = None, **kwargs):
+        self.assignment_id = None
+        self.user_id = None
+
+        # autoloading from named arguments
+        for k in self.__dict__:
+            self.__dict__[k] = kwargs.get(k)
+
+        super().__init__()
+        self.solution_id = solution_id
+        self.evaluated_at = int(time.time())
+        self.jobs = {}  # job name -> { stage, state, exit_code, duration }
+        self.tests = {}  # test name -> { passed, state, exit_code }
+
+    def add_job(self, name: str, stage: str, state: str, exit_code: int | None, duration: float | None,
+                transfer: dict | None = None, setup_ms: int | None = None) -> None:
+        self.jobs[name] = {'stage': stage, 'state': state, 'exit_code': exit_code, 'duration': duration}
+        if setup_ms is not None:  # time spent preparing the box (before the job was submitted)
+            self.jobs[name]['setup_ms'] = setup_ms
+        if transfer is not None:  # sizes and times of data staging (to and from node-local scratch)
+            self.jobs[name]['transfer'] = transfer
+
+    def add_test(self, name: str, state: str, exit_code: int | None) -> None:
+        self.tests[name] = {'passed': state == 'COMPLETED' and exit_code == 0, 'state': state, 'exit_code': exit_code}
@@ -25,11 +25,15 @@ class Solution(Serializable):
         self.id = id.strip() if id else None
         self.submitted_at = int(time.time())
         self.dir = None
+        self.pack = None  # relative path to a pack file if the solution was archived
+        self.manifest = None  # tree hash of the manifest (listing of files with their hashes)
+        self.evaluated_at = None  # time of the last evaluation (None = not evaluated yet)
 
     def get_dir(self) -> str:
         '''
         Return a directory name used to store solution data in the assignment-user designated box.
-        The dirname comprise submission time and solution ID(s).
+        The dirname comprise submission time and solution ID(s). The full path is resolved by the workspace
+        (see Workspace.get_solution_dir()) according to the configured layout of the solutions archive.
         '''
         if self.dir is None:
             assert self.id, "The solution does not have an ID yet!"
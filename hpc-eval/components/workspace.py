@@ -1,7 +1,67 @@
+import datetime
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from loguru import logger
 import config.descriptors as cd
+from helpers.file_copy import FileCopier, CopyStats, walk_tree
+from helpers.build_cache import BuildCache
+from helpers.input_cache import InputCache
+from helpers.input_generator import InputGenerator
+from helpers.archive import ArchiveExtractor, ExtractionStats, get_member_target
+from helpers.object_store import ObjectStore
 from components.solutions import Solution
+from components.manifest import Manifest
+
+
+class SolutionLayout:
+    '''
+    Describes how the solution dirs are organized in the solutions archive. The path of a solution is
+    `<assignment>/[<user hash prefixes>/]<user>/[<time bucket>/]<solution dir>`. Hash-prefix levels (two hex
+    characters each) spread users over more directories and time buckets split long submission histories,
+    so no directory gets too many entries.
+    '''
+    bucket_formats = {
+        'none': None,
+        'year': '%Y',
+        'month': '%Y-%m',
+        'day': '%Y-%m-%d',
+    }
+
+    def __init__(self, user_shards: int = 0, buckets: str = 'none'):
+        if buckets not in __class__.bucket_formats:
+            raise ValueError(f"Unknown solution bucket type '{buckets}'.")
+        self.user_shards = max(0, min(user_shards, 8))
+        self.buckets = buckets
+
+    def get_user_path(self, assignment_id: str, user_id: str) -> str:
+        '''
+        Return relative path to the directory holding all solutions of given user and assignment.
+        '''
+        parts = [assignment_id]
+        if self.user_shards:
+            digest = hashlib.sha1(user_id.encode('utf-8')).hexdigest()
+            parts.extend([digest[2 * i:2 * i + 2] for i in range(self.user_shards)])
+        parts.append(user_id)
+        return '/'.join(parts)
+
+    def get_path(self, solution: Solution) -> str:
+        '''
+        Return relative path to the solution dir (within the solutions archive).
+        '''
+        parts = [self.get_user_path(solution.assignment_id, solution.user_id)]
+        format = __class__.bucket_formats[self.buckets]
+        if format:
+            # buckets are in UTC, so the path does not depend on the local timezone (or DST) of the host
+            submitted = datetime.datetime.fromtimestamp(solution.submitted_at, datetime.timezone.utc)
+            parts.append(submitted.strftime(format))
+        parts.append(solution.get_dir())
+        return '/'.join(parts)
 
 
 class Workspace:
@@ -14,8 +74,35 @@ class Workspace:
         'jobs_dir': cd.String('jobs', 'Name of the SLURM jobs subdir (_ prefix is added automatically)'),
         'results_dir': cd.String('results', 'Results archive subdir (_ prefix is added automatically)'),
         'tmp_dir': cd.String('tmp', 'Directory for temporary data staging (_ prefix is added automatically)'),
+        'packs_dir': cd.String('packs', 'Compressed packs of archived old solutions (_ prefix is added automatically)'),
+        'manifests_dir': cd.String('manifests', 'Manifests of solution contents (_ prefix is added automatically)'),
+        'objects_dir': cd.String('objects', 'Content-addressed store of deduplicated solution files (_ prefix added)'),
+        'cache_dir': cd.String('cache', 'Caches of build artifacts and other reusable data (_ prefix is added)'),
+        'tmp_max_age': cd.Integer(86400, 'Age [s] after which an abandoned temp dir is considered stale.'),
+        'tmp_cleanup': cd.Bool(True, 'Remove stale temp dirs opportunistically when a command starts.'),
+        'tmp_cleanup_interval': cd.Integer(3600, 'Min. interval [s] between two opportunistic removals of stale '
+                                           'temp dirs (the gc command removes them always).'),
+        'solutions_user_shards': cd.Integer(0, 'Levels of hash-prefix dirs above user dirs in solutions archive.'),
+        'solutions_buckets': cd.String('none', 'Time buckets (subdirs) for submissions of one user.')
+        .enum(list(SolutionLayout.bucket_formats)),
+        'pack_compression': cd.String('deflated', 'Compression method used for packs of archived solutions.')
+        .enum(['stored', 'deflated', 'bzip2', 'lzma']),
+        'dedup': cd.Bool(False, 'Store each distinct solution file only once (files are hardlinked to the store).'),
+        'copy_workers': cd.Integer(4, 'Number of threads used for parallel file copying (when staging data).'),
+        'copy_method': cd.String('auto', 'Preferred copy method (auto selects the cheapest one supported by the fs).')
+        .enum(['auto', 'hardlink', 'reflink', 'copy_file_range', 'copy']),
+        'extract_max_size': cd.Integer(1 << 30, 'Max. total size [bytes] of data extracted from an archive (0 = any).'),
+        'extract_max_files': cd.Integer(10000, 'Max. number of files extracted from an archive (0 = any).'),
+        'extract_max_ratio': cd.Integer(200, 'Max. ratio of extracted data size and archive size (0 = any).'),
+        'input_cache': cd.Bool(True, 'Store test inputs once (content-addressed) and hardlink them into boxes.'),
+        'build_cache_max_size': cd.Integer(8 << 30, 'Max. total size [bytes] of cached build artifacts (0 = off).'),
+        'overlay_cache_max_size': cd.Integer(1 << 30, 'Max. total size [bytes] of read-only overlay snapshots '
+                                             'copied into build boxes (0 = overlays are copied directly).'),
+        'generated_cache_max_size': cd.Integer(8 << 30, 'Max. total size [bytes] of cached generated test inputs '
+                                               '(0 = inputs are kept only while the evaluation runs).'),
     })
     _dir_mode = 0o770
+    _cleanup_stamp = '.last-cleanup'  # file in the temp-dir zone, its mtime is the time of the last cleanup
 
     @staticmethod
     def get_config_schema():
@@ -27,7 +114,7 @@ class Workspace:
     def __init__(self, config: dict = {}):
         logger.trace(f'Workspace.__init__({config})')
 
-        root = os.path.abspath(config.get('root', os.getcwd()))
+        root = os.path.abspath(config.get('root') or os.getcwd())
         if not os.path.isdir(root):
             raise Exception(f"Path {root} is not an existing directory.")
 
@@ -36,6 +123,10 @@ class Workspace:
         self.jobs_dir = None
         self.results_dir = None
         self.tmp_dir = None
+        self.objects_dir = None
+        self.packs_dir = None
+        self.manifests_dir = None
+        self.cache_dir = None
 
         for dir in self.__dict__:  # lets fill previously declared properties from config
             default = __class__._config.items[dir].default
@@ -43,6 +134,28 @@ class Workspace:
 
         self.root = root
 
+        # remaining (non-path) options
+        config = __class__._config.default | config
+        self.tmp_max_age = config['tmp_max_age']
+        self.tmp_cleanup = config['tmp_cleanup']
+        self.tmp_cleanup_interval = config['tmp_cleanup_interval']
+        self.solution_layout = SolutionLayout(config['solutions_user_shards'], config['solutions_buckets'])
+        self.pack_compression = config['pack_compression']
+        self.copy_workers = max(1, config['copy_workers'])
+        self.copier = FileCopier(config['copy_method'])
+        self.object_store = ObjectStore(self.objects_dir, __class__._dir_mode) if config['dedup'] else None
+        self.extractor = ArchiveExtractor(config['extract_max_size'], config['extract_max_files'],
+                                          config['extract_max_ratio'], workers=self.copy_workers)
+        self.input_cache = InputCache(self.cache_dir + '/inputs', __class__._dir_mode) \
+            if config['input_cache'] else None
+        self.build_cache = BuildCache(self.cache_dir + '/builds', config['build_cache_max_size'], __class__._dir_mode) \
+            if config['build_cache_max_size'] else None
+        self.overlay_cache = BuildCache(self.cache_dir + '/overlays', config['overlay_cache_max_size'],
+                                        __class__._dir_mode) if config['overlay_cache_max_size'] else None
+        generated_cache = BuildCache(self.cache_dir + '/generated', config['generated_cache_max_size'],
+                                     __class__._dir_mode)
+        self.input_generator = InputGenerator(generated_cache, self.copy_workers)
+
     def create_tmp_dir(self, prefix: str = '') -> str:
         '''
         Create a new unique tmp dir (as a subdir of our temp-dir zone).
@@ -50,38 +163,323 @@ class Workspace:
         Full path to the temp dir is returned after creation.
         '''
         prefix = prefix or 'tmp'
-        counter = 0
-        tries = 0
-        while True:
-            counter += 1
-            path = f'{self.tmp_dir}/{prefix}{counter}'
-            if not os.path.exists(path):
-                try:
-                    os.makedirs(path, mode=__class__._dir_mode)
-                    return path
-                except OSError as e:
-                    tries += 1
-                    if tries > 3:
-                        raise e
-
-    def save_solution_dir(self, tmp_dir: str, solution: Solution) -> None:
+        os.makedirs(self.tmp_dir, mode=__class__._dir_mode, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f'{prefix}-', dir=self.tmp_dir)  # random name, creation is atomic
+        os.chmod(path, __class__._dir_mode)
+        return path
+
+    @staticmethod
+    def _is_modified_since(entry: os.DirEntry, threshold: float) -> bool:
+        '''
+        Check whether the entry or anything in it (recursively) was modified after the threshold.
+        '''
+        if entry.stat(follow_symlinks=False).st_mtime >= threshold:
+            return True
+        if entry.is_dir(follow_symlinks=False):
+            with os.scandir(entry.path) as it:
+                return any(__class__._is_modified_since(sub, threshold) for sub in it)
+        return False
+
+    def cleanup_tmp_dirs(self, max_age: int | None = None) -> int:
+        '''
+        Remove stale entries of the temp-dir zone (left behind by failed or interrupted commands).
+        An entry is stale if nothing in it was modified for more than max_age seconds (config value is used if None),
+        the whole tree is checked since files are written deep in a dir without touching it.
+        Returns number of removed entries.
+        '''
+        if max_age is None:
+            max_age = self.tmp_max_age
+        if not os.path.isdir(self.tmp_dir):
+            return 0
+
+        threshold = time.time() - max_age
+        removed = 0
+        for entry in os.scandir(self.tmp_dir):
+            if entry.name == __class__._cleanup_stamp:
+                continue
+            try:
+                if __class__._is_modified_since(entry, threshold):
+                    continue
+                logger.debug(f"Removing stale temp entry '{entry.path}'.")
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # removed concurrently
+            except OSError as e:
+                logger.warning(f"Unable to remove stale temp entry '{entry.path}': {e}")
+        return removed
+
+    def cleanup_tmp_dirs_if_due(self) -> int:
+        '''
+        Opportunistic variant of cleanup_tmp_dirs() invoked when a command starts. It runs at most once per cleanup
+        interval (tracked by mtime of a stamp file shared by all processes), so the walk over the temp trees
+        is not paid by every command. Returns number of removed entries.
+        '''
+        stamp = f'{self.tmp_dir}/{__class__._cleanup_stamp}'
+        try:
+            if time.time() - os.stat(stamp).st_mtime < self.tmp_cleanup_interval:
+                return 0
+        except FileNotFoundError:
+            if not os.path.isdir(self.tmp_dir):
+                return 0
+        with open(stamp, 'a'):
+            pass
+        os.utime(stamp)  # claimed before the walk, so concurrently started commands skip it
+        return self.cleanup_tmp_dirs()
+
+    def copy_files(self, files: list[tuple[str, str]], compute_digests: bool = False,
+                   allow_hardlink: bool = False) -> CopyStats:
+        '''
+        Copy a list of (source, target) file pairs using a bounded pool of threads.
+        Every file is copied by the cheapest method supported by the file system (reflinks, hardlinks, ...).
+        Hardlinks are used only if allow_hardlink is set (for read-only sources owned by this tool, like cached inputs),
+        otherwise the targets never share inodes with the sources.
+        Target directories must already exist. The first error encountered is re-raised
+        (after the copying that is already in progress finishes).
+        Returns statistics of the copying (with content hashes of the targets if compute_digests is set).
+        '''
+        stats = CopyStats(compute_digests)
+        if len(files) < 2 or self.copy_workers < 2:
+            for src, dst in files:
+                self.copier.copy(src, dst, stats, allow_hardlink)
+            stats.finish()
+            return stats
+
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as executor:
+            futures = [executor.submit(self.copier.copy, src, dst, stats, allow_hardlink) for src, dst in files]
+            try:
+                for future in as_completed(futures):
+                    future.result()  # re-raises the exception of a failed copy
+            except Exception as e:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise e
+
+        stats.finish()
+        return stats
+
+    def extract_archive(self, archive: str, target_dir: str, compute_digests: bool = False) -> ExtractionStats:
+        '''
+        Safely extract an archive (zip, tar, tar.gz, tar.zst) into an existing directory.
+        The extraction limits are taken from the config, ArchiveError is raised when they are exceeded.
+        Returns statistics of the extraction (with content hashes of the files if compute_digests is set).
+        '''
+        return self.extractor.extract(archive, target_dir, compute_digests)
+
+    def _dedup_dir(self, dir: str, digests: dict) -> None:
+        '''
+        Replace all files in given directory with links to the object store.
+        Digests (path -> content hash) computed during staging are used, missing ones are computed.
+        '''
+        total = 0
+        deduplicated = 0
+        for path, _, files in os.walk(dir):
+            for file in files:
+                file = f'{path}/{file}'
+                total += 1
+                if self.object_store.ingest(file, digests.get(file)):
+                    deduplicated += 1
+        logger.debug(f"{deduplicated} out of {total} files were already present in the object store.")
+
+    def get_solution_dir(self, solution: Solution, layout: SolutionLayout | None = None) -> str:
+        '''
+        Return full path to the directory where the solution files are stored.
+        The current solution layout is used unless another layout is explicitly given.
+        '''
+        layout = layout or self.solution_layout
+        return f'{self.solutions_dir}/{layout.get_path(solution)}'
+
+    def save_manifest(self, manifest: Manifest) -> str:
+        '''
+        Store the manifest (content-addressed by its tree hash, so identical manifests are stored once).
+        Returns the tree hash which identifies the manifest.
+        '''
+        tree_hash = manifest.get_tree_hash()
+        path = f'{self.manifests_dir}/{tree_hash[:2]}/{tree_hash}.json'
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), mode=__class__._dir_mode, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(manifest.serialize(), fp)
+            os.replace(tmp_path, path)
+        return tree_hash
+
+    def load_manifest(self, tree_hash: str) -> Manifest | None:
+        '''
+        Load a manifest by its tree hash. Returns None if no such manifest exists.
+        '''
+        path = f'{self.manifests_dir}/{tree_hash[:2]}/{tree_hash}.json'
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as fp:
+            manifest = Manifest()
+            manifest.deserialize(json.load(fp))
+            return manifest
+
+    def save_solution_dir(self, tmp_dir: str, solution: Solution, digests: dict | None = None) -> None:
         '''
         Take a staged tmp dir and move it as a new solution.
+        If deduplication is enabled, the files are linked to the object store first
+        (optional digests hold content hashes of the staged files computed during staging).
         '''
         assert os.path.dirname(tmp_dir) == self.tmp_dir, f"Given tmp_dir '{
             tmp_dir}' is not located in the local temp area."
 
-        base = f'{self.solutions_dir}/{solution.assignment_id}/{solution.user_id}'
-        os.makedirs(base, mode=__class__._dir_mode, exist_ok=True)
+        if self.object_store:
+            self._dedup_dir(tmp_dir, digests or {})
+
+        target = self.get_solution_dir(solution)
+        os.makedirs(os.path.dirname(target), mode=__class__._dir_mode, exist_ok=True)
 
         # we intentionally do not use shutil.move() to ensure the move will work only on the same fs
         # (this operation should be atomic according to POSIX)
-        os.rename(tmp_dir, f'{base}/{solution.get_dir()}')
+        os.rename(tmp_dir, target)
 
-    def get_slurm_job_dir(self, job_name):
+    def move_solution_dir(self, solution: Solution, old_layout: SolutionLayout) -> bool:
         '''
-        Return path to a working directory of a particular slurm job.
+        Move the solution dir from a location given by old layout to the location given by the current layout.
+        Empty parent dirs left behind are removed. Returns False if there was nothing to move.
         '''
-        dir = self.slurm_jobs_dir + '/' + job_name
-        os.makedirs(dir)
+        source = self.get_solution_dir(solution, old_layout)
+        target = self.get_solution_dir(solution)
+        if source == target or not os.path.isdir(source):
+            return False
+        if os.path.exists(target):
+            raise RuntimeError(f"Unable to move solution '{solution.id}', target '{target}' already exists.")
+
+        os.makedirs(os.path.dirname(target), mode=__class__._dir_mode, exist_ok=True)
+        os.rename(source, target)
+
+        self._prune_empty_dirs(os.path.dirname(source), solution.assignment_id)
+        return True
+
+    def _prune_empty_dirs(self, dir: str, assignment_id: str) -> None:
+        '''
+        Remove given dir and its parents while they are empty (up to the assignment dir in solutions archive).
+        '''
+        stop = f'{self.solutions_dir}/{assignment_id}'
+        while dir != stop and dir.startswith(stop):
+            try:
+                os.rmdir(dir)
+            except OSError:
+                break  # not empty
+            dir = os.path.dirname(dir)
+
+    def pack_solution_dirs(self, assignment_id: str, solutions: list[Solution], persist=None) -> dict:
+        '''
+        Pack dirs of given solutions (of one assignment) into a new compressed pack file and remove the dirs.
+        The pack is a zip file (its central directory is the member index allowing random access), each solution
+        is stored under its dir name (subdirs have their own entries, so empty dirs are preserved). The `pack`
+        property of the solutions is set and the persist callback (saving the records) is invoked before any dir
+        is removed, so the solutions never become unreachable.
+        Solutions already packed earlier (and extracted on demand since) are only removed.
+        Returns statistics (packed solutions, removed files and dirs, bytes removed, size of the pack).
+        '''
+        stats = {'solutions': 0, 'inodes': 0, 'bytes': 0, 'pack_bytes': 0}
+        removed = [solution for solution in solutions if os.path.isdir(self.get_solution_dir(solution))]
+        to_pack = [solution for solution in removed if not solution.pack]
+        if to_pack:
+            timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            pack = f'{assignment_id}/{timestamp}.zip'
+            pack_file = f'{self.packs_dir}/{pack}'
+            os.makedirs(os.path.dirname(pack_file), mode=__class__._dir_mode, exist_ok=True)
+            compression = getattr(zipfile, f'ZIP_{self.pack_compression.upper()}')
+            with zipfile.ZipFile(f'{pack_file}.tmp', 'x', compression=compression) as zip_ref:
+                for solution in to_pack:
+                    dir = self.get_solution_dir(solution)
+                    for path, _, files in os.walk(dir):
+                        if path != dir:
+                            zip_ref.write(path, f'{solution.get_dir()}/{os.path.relpath(path, dir)}/')
+                        for file in files:
+                            file = f'{path}/{file}'
+                            zip_ref.write(file, f'{solution.get_dir()}/{os.path.relpath(file, dir)}')
+            os.rename(f'{pack_file}.tmp', pack_file)  # the pack is complete
+            stats['pack_bytes'] = os.path.getsize(pack_file)
+
+            for solution in to_pack:
+                solution.pack = pack
+                stats['solutions'] += 1
+            if persist:
+                persist()
+
+        for solution in removed:
+            dir = self.get_solution_dir(solution)
+            for path, dirs, files in os.walk(dir):
+                stats['inodes'] += len(files) + 1
+                for file in files:
+                    stats['bytes'] += os.lstat(f'{path}/{file}').st_size
+            shutil.rmtree(dir)
+            self._prune_empty_dirs(os.path.dirname(dir), solution.assignment_id)
+
+        return stats
+
+    def open_solution_dir(self, solution: Solution) -> str:
+        '''
+        Return full path to the solution dir. If the solution was archived in a pack, it is extracted first
+        (only the members of the solution are read from the pack). The extracted dir is kept in place.
+        '''
+        dir = self.get_solution_dir(solution)
+        if os.path.isdir(dir) or not solution.pack:
+            return dir
+
+        logger.debug(f"Extracting solution '{solution.id}' from pack '{solution.pack}'.")
+        tmp_dir = self.create_tmp_dir('unpack')
+        try:
+            prefix = f'{solution.get_dir()}/'
+            with zipfile.ZipFile(f'{self.packs_dir}/{solution.pack}', 'r') as zip_ref:
+                for info in zip_ref.infolist():
+                    if not info.filename.startswith(prefix):
+                        continue
+                    target = get_member_target(tmp_dir, info.filename[len(prefix):])
+                    if info.is_dir():
+                        os.makedirs(target, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zip_ref.open(info, 'r') as source, open(target, 'wb') as fp:
+                        shutil.copyfileobj(source, fp)
+                    mode = (info.external_attr >> 16) & 0o777
+                    if mode:
+                        os.chmod(target, mode)
+
+            os.makedirs(os.path.dirname(dir), mode=__class__._dir_mode, exist_ok=True)
+            os.rename(tmp_dir, dir)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if os.path.isdir(dir):
+                return dir  # extracted concurrently by someone else
+            raise e
         return dir
+
+    def get_job_dir(self, job_name: str, create: bool = True) -> str:
+        '''
+        Return path to a working directory of a particular job (the dir is created if missing).
+        '''
+        dir = f'{self.jobs_dir}/{job_name}'
+        if create:
+            os.makedirs(dir, mode=__class__._dir_mode, exist_ok=True)
+        return dir
+
+    def copy_tree(self, source_dir: str, target_dir: str, select=None, allow_hardlink: bool = False) -> CopyStats:
+        '''
+        Copy contents of the source directory recursively into the target directory (which is created if missing).
+        Files already present in the target are replaced. Files are copied in parallel.
+        Optional select callback gets a path relative to the source dir and decides whether the file is copied.
+        Hardlinks are used only if allow_hardlink is set (see copy_files()). Symlink loops are not followed.
+        Returns statistics of the copying.
+        '''
+        files = []
+        for dir, names in walk_tree(source_dir):
+            rel_dir = os.path.relpath(dir, source_dir)
+            target = os.path.normpath(f'{target_dir}/{rel_dir}')
+            os.makedirs(target, mode=__class__._dir_mode, exist_ok=True)
+            files.extend([(f'{dir}/{name}', f'{target}/{name}') for name in names
+                          if select is None or select(os.path.normpath(f'{rel_dir}/{name}'))])
+        return self.copy_files(files, allow_hardlink=allow_hardlink)
+
+    def get_result_file(self, solution: Solution) -> str:
+        '''
+        Return path to the file with evaluation results of given solution.
+        '''
+        return f'{self.results_dir}/{solution.assignment_id}/{solution.id}.json'
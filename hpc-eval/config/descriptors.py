@@ -396,7 +396,7 @@ class NamedList(Base):
         if not value:
             return merge_with if merge_with else self.default.copy()
 
-        res = merge_with.copy()
+        res = merge_with.copy() if merge_with else {}
         for name, val in value.items():
             self.sub_type.name = name  # bit of a hack actually, we need to smuggle the name into descriptor somehow
             res[name] = self.sub_type.load(val, source)
@@ -0,0 +1,108 @@
+import time
+
+
+class JobNode:
+    '''
+    Node of the evaluation DAG. It represents one job (e.g., a build or a test of one solution).
+    The job is executed after all jobs it depends on; the dependencies are resolved by the scheduler
+    (the job is submitted as soon as all its dependencies are submitted).
+    '''
+    # states of the node
+    PLANNED = 'PLANNED'
+    SUBMITTED = 'SUBMITTED'
+    COMPLETED = 'COMPLETED'
+    FAILED = 'FAILED'
+    SKIPPED = 'SKIPPED'  # not executed at all since a dependency failed
+
+    def __init__(self, name: str, stage: str, solution=None, deps: list | None = None):
+        self.name = name  # unique name of the job
+        self.stage = stage  # name of the evaluation stage (build, test, ...) used for statistics
+        self.solution = solution  # solution being evaluated
+        self.deps = deps or []  # nodes that must successfully finish first
+        self.dependents = []  # reverse edges (filled in by the graph)
+        self.job_dir = None  # directory for job outputs (logs)
+        self.commands = []  # commands of the job script
+        self.prepare = None  # optional callable invoked just before submission (e.g., box preparation)
+        self.finalize = None  # optional callable invoked after the job terminates (e.g., artifacts caching)
+        self.data = {}  # additional planner data (test name, box path, ...)
+
+        self.state = __class__.PLANNED
+        self.job = None  # SLURM job object once submitted
+        self.task = None  # task ID if the job is executed as a task of an array job
+        self.step = False  # whether the job is executed as a step of a shared allocation
+        self.submitted_at = None
+        self.finished_at = None
+        self.exit_code = None
+        self.duration = None  # measured execution time (if known)
+
+    def is_finished(self) -> bool:
+        return self.state in (__class__.COMPLETED, __class__.FAILED, __class__.SKIPPED)
+
+    def get_duration(self) -> float | None:
+        '''
+        Return measured execution time [s] if known, otherwise time between the submission
+        and the (observed) termination of the job.
+        '''
+        if self.duration is not None:
+            return self.duration
+        if self.submitted_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+    def finish(self, ok: bool, exit_code: int | None = None, ts: float | None = None,
+               duration: float | None = None) -> None:
+        self.state = __class__.COMPLETED if ok else __class__.FAILED
+        self.exit_code = exit_code
+        self.finished_at = ts or time.time()
+        self.duration = duration
+
+
+class JobGraph:
+    '''
+    Directed acyclic graph of job nodes. Nodes are kept in the order of insertion
+    (which must be a topological order, dependencies are added first).
+    '''
+
+    def __init__(self):
+        self.nodes = {}  # name -> JobNode
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __getitem__(self, name: str) -> JobNode | None:
+        return self.nodes.get(name)
+
+    def add(self, node: JobNode) -> JobNode:
+        '''
+        Add a node into the graph, its dependencies must be already present.
+        '''
+        if node.name in self.nodes:
+            raise Exception(f"Job node '{node.name}' already exists.")
+        for dep in node.deps:
+            if self.nodes.get(dep.name) is not dep:
+                raise Exception(f"Job node '{node.name}' depends on '{dep.name}' which is not in the graph.")
+            dep.dependents.append(node)
+        self.nodes[node.name] = node
+        return node
+
+    def skip_failed(self) -> list[JobNode]:
+        '''
+        Mark planned nodes with a failed (or skipped) dependency as skipped. Returns list of skipped nodes.
+        '''
+        skipped = []
+        for node in self.nodes.values():  # topological order, so skipping is propagated transitively
+            if node.state == JobNode.PLANNED and any([dep.state in (JobNode.FAILED, JobNode.SKIPPED)
+                                                      for dep in node.deps]):
+                node.state = JobNode.SKIPPED
+                skipped.append(node)
+        return skipped
+
+    def get_ready(self) -> list[JobNode]:
+        '''
+        Return planned nodes that can be submitted (all dependencies are submitted or completed).
+        '''
+        return [node for node in self.nodes.values() if node.state == JobNode.PLANNED
+                and all([dep.state in (JobNode.SUBMITTED, JobNode.COMPLETED) for dep in node.deps])]
+
+    def is_finished(self) -> bool:
+        return all([node.is_finished() for node in self.nodes.values()])
@@ -0,0 +1,306 @@
+import shlex
+import time
+from loguru import logger
+from evaluation.dag import JobGraph, JobNode
+from evaluation.steps import get_allocation_script, get_step_levels, read_step_record, write_step_script
+
+# name of the completion marker file written into the job dir (see SlurmJob.set_marker())
+_marker_file = 'completion.json'
+
+
+class Engine:
+    '''
+    Executes a job graph via SLURM. Jobs are submitted as soon as all their dependencies are submitted
+    (the dependencies are passed to SLURM as `--dependency=afterok:...`, so the cluster pipelines them).
+    Ready jobs with the same dependencies are submitted together as one array job (up to array_size tasks),
+    which saves sbatch invocations. Alternatively, all jobs of one solution may be executed as srun steps
+    of a single allocation (saving scheduling latency of short jobs).
+    The number of jobs submitted and not yet terminated is limited by max_running.
+    Jobs that become ready at the same time are submitted concurrently (see Slurm.run_jobs()).
+    '''
+
+    def __init__(self, slurm, max_running: int = 0, poll_interval: float = 5, array_size: int = 0,
+                 steps: int = 0, submit_parallel: int = 1, submit_rate: float = 0,
+                 min_poll_interval: float | None = None, markers: bool = False, scan_interval: float = 30):
+        '''
+        The slurm is the job dispatching interface (slurm.Slurm instance).
+        Max. running limits the number of jobs in flight (0 = unlimited).
+        Poll interval [s] is the delay between two consecutive job state updates. If min. poll interval is set,
+        the delay adapts to the activity of the queue (it backs off from the min. to the poll interval).
+        If markers are enabled, jobs write completion markers into their job dirs, which are watched
+        (and scanned every scan_interval seconds), so SLURM is queried only for jobs without markers.
+        Array size is the max. number of jobs submitted as one array job (0 or 1 = no arrays).
+        Steps is the number of tasks of an allocation executing jobs of one solution as steps (0 = no steps).
+        Submit parallel is the number of concurrent sbatch invocations, submit rate limits them [jobs/s, 0 = no limit].
+        '''
+        self.slurm = slurm
+        self.max_running = max_running
+        self.poll_interval = poll_interval
+        self.slurm.set_polling(poll_interval if min_poll_interval is None else min_poll_interval, poll_interval)
+        if markers:
+            self.slurm.watch_markers(scan_interval)
+        self.markers = markers
+        self.array_size = max(1, array_size)
+        self.steps = steps
+        self.submit_parallel = submit_parallel
+        self.submit_rate = submit_rate
+        self._running = {}  # node name -> node of all submitted jobs which have not terminated yet
+        self._jobs = {}  # SLURM job name -> list of nodes (tasks of an array job or a single node)
+
+    def _prepare(self, node: JobNode) -> bool:
+        '''
+        Invoke preparation callback of a node. Returns False (and the node fails) if the preparation fails.
+        '''
+        try:
+            if node.prepare:
+                node.prepare(node)
+            return True
+        except Exception as e:
+            logger.error(f"Unable to prepare job '{node.name}': {e}")
+            node.finish(False)
+            self._finalize(node)
+            return False
+
+    def _get_dep_refs(self, node: JobNode) -> list[str]:
+        '''
+        Return SLURM references (job IDs or job_task IDs) of dependencies still in flight
+        (completed jobs may be purged from SLURM records, so they are not referenced).
+        '''
+        refs = []
+        for dep in node.deps:
+            if dep.state == JobNode.SUBMITTED:
+                id = dep.job.get_id()
+                refs.append(f'{id}_{dep.task}' if dep.task is not None else str(id))
+        return refs
+
+    def _create_job(self, nodes: list[JobNode], deps: list[str]) -> tuple | None:
+        '''
+        Prepare nodes and create one job for them (an array job if there are more nodes).
+        Returns the job and the prepared nodes (None if no node was prepared).
+        '''
+        nodes = [node for node in nodes if self._prepare(node)]
+        if not nodes:
+            return None
+
+        name = nodes[0].name if len(nodes) == 1 else f'{nodes[0].name}[{len(nodes)}]'
+        job = self.slurm.create_job(name)
+        job.add_args('job-name', name)
+        if deps:
+            job.add_args('dependency', 'afterok:' + ':'.join(deps))
+            job.add_args('kill-on-invalid-dep', 'yes')  # failure of a dependency cancels the job
+
+        if len(nodes) == 1:
+            node = nodes[0]
+            if node.job_dir:
+                job.add_args('output', f'{node.job_dir}/stdout.log')
+                job.add_args('error', f'{node.job_dir}/stderr.log')
+            job.add_command(node.commands)
+            if node.job_dir and self.markers:
+                job.set_marker(f'{node.job_dir}/{_marker_file}')
+        else:
+            job.add_args('output', '/dev/null')  # each task redirects its outputs into its job dir
+            job.add_args('error', '/dev/null')
+            for node in nodes:
+                commands = node.commands
+                if node.job_dir:
+                    log = shlex.quote(f'{node.job_dir}/stdout.log'), shlex.quote(f'{node.job_dir}/stderr.log')
+                    commands = [f'exec > {log[0]} 2> {log[1]}'] + commands
+                node.task = job.add_task(commands)
+                if node.job_dir and self.markers:
+                    job.set_marker(f'{node.job_dir}/{_marker_file}', node.task)
+        return job, nodes
+
+    def _create_allocation(self, nodes: list[JobNode]) -> tuple | None:
+        '''
+        Prepare nodes and create one allocation which executes them (nodes of one solution) as job steps.
+        Dependencies among the nodes are resolved by the allocation script.
+        Returns the job and the prepared nodes (None if no node was prepared).
+        '''
+        prepared = set()
+        for node in nodes:
+            if any([dep not in prepared for dep in node.deps if dep in nodes]):
+                continue  # a dependency failed to prepare, the node will be skipped
+            if not self._prepare(node):
+                continue
+            try:
+                write_step_script(node)
+            except Exception as e:
+                logger.error(f"Unable to prepare step '{node.name}': {e}")
+                node.finish(False)
+                self._finalize(node)
+                continue
+            prepared.add(node)
+        nodes = [node for node in nodes if node in prepared]
+        if not nodes:
+            return None
+
+        name = f'{nodes[0].name}[steps]'
+        job = self.slurm.create_job(name)
+        job.add_args('job-name', name)
+        job.add_args('ntasks', min(self.steps, max([len(level) for level in get_step_levels(nodes)])))
+        job.add_args('output', f'{nodes[0].job_dir}/allocation.log')
+        job.add_args('error', f'{nodes[0].job_dir}/allocation.log')
+        job.add_command(get_allocation_script(nodes))
+        if self.markers:
+            job.set_marker(f'{nodes[0].job_dir}/{_marker_file}')
+        for node in nodes:
+            node.step = True
+        return job, nodes
+
+    def _submit(self, batch: list[tuple]) -> None:
+        '''
+        Submit created jobs (pairs job, nodes) concurrently and mark their nodes as submitted.
+        Nodes of jobs that could not be submitted fail.
+        '''
+        results = self.slurm.run_jobs([job for job, _ in batch], self.submit_parallel, self.submit_rate)
+        ts = time.time()
+        for job, nodes in batch:
+            name = job.get_name()
+            result = results.get(name)
+            if isinstance(result, Exception) or job.get_id() is None:
+                logger.error(f"Unable to submit job '{name}': {result}")
+                self.slurm.release(name)
+                for node in nodes:
+                    node.finish(False)
+                    self._finalize(node)
+                continue
+
+            for node in nodes:
+                node.job = job
+                node.state = JobNode.SUBMITTED
+                node.submitted_at = ts
+                self._running[node.name] = node
+            self._jobs[name] = nodes
+            if nodes[0].step:
+                logger.debug(f"Allocation '{name}' with {len(nodes)} steps submitted (id {job.get_id()}).")
+            else:
+                logger.debug(f"Job '{name}' submitted (id {job.get_id()}).")
+
+    def _finalize(self, node: JobNode) -> None:
+        '''
+        Invoke finalization callback of a finished node (regardless whether it completed, failed, or was skipped).
+        '''
+        if node.finalize:
+            try:
+                node.finalize(node)
+            except Exception as e:
+                logger.error(f"Finalization of job '{node.name}' failed: {e}")
+
+    def _submit_ready(self, graph: JobGraph) -> None:
+        for node in graph.skip_failed():
+            logger.warning(f"Job '{node.name}' skipped, a job it depends on has failed.")
+            self._finalize(node)
+
+        ready = graph.get_ready()
+        if self.max_running:
+            ready = ready[:max(0, self.max_running - len(self._running))]
+
+        batch = []
+        if self.steps:
+            # all planned jobs of a solution are executed in one allocation
+            # (including dependent jobs which would not be ready otherwise)
+            batches = {}
+            for node in ready:
+                batches.setdefault(id(node.solution), []).append(node)
+            for nodes in batches.values():
+                for node in graph.nodes.values():  # topological order
+                    if node.state == JobNode.PLANNED and node.solution is nodes[0].solution and node not in nodes \
+                            and node.deps and all([dep in nodes for dep in node.deps]):
+                        nodes.append(node)
+                batch.append(self._create_allocation(nodes))
+        else:
+            # nodes with identical dependencies are grouped (into array jobs)
+            groups = {}
+            for node in ready:
+                deps = self._get_dep_refs(node)
+                groups.setdefault(tuple(deps), []).append(node)
+            for deps, nodes in groups.items():
+                for i in range(0, len(nodes), self.array_size):
+                    batch.append(self._create_job(nodes[i:i + self.array_size], list(deps)))
+
+        batch = [item for item in batch if item is not None]
+        if batch:
+            self._submit(batch)
+
+    def _process_terminated(self, jobs: list) -> None:
+        ts = time.time()
+        for job in jobs:
+            nodes = self._jobs.pop(job.get_name(), [])
+            # step records written by the allocation script are sufficient if its completion was reported by a marker
+            use_accounting = any([node.step for node in nodes]) and not (self.markers and job.has_markers())
+            steps = self._get_steps(job) if use_accounting else {}
+            for node in nodes:
+                self._running.pop(node.name, None)
+                if node.step:
+                    step_state = steps.get(node.name) or read_step_record(node)
+                    if step_state is None:  # not executed (a dependency failed or the allocation was killed)
+                        node.state = JobNode.SKIPPED if not job.failed() else JobNode.FAILED
+                        node.finished_at = ts
+                        state = job.state
+                    else:
+                        state = step_state['state']
+                        node.finish(state == 'COMPLETED' and step_state.get('exit_code') == 0,
+                                    step_state.get('exit_code'), ts, step_state.get('elapsed'))
+                elif node.task is None:
+                    node.finish(not job.failed(), job.exit_code, ts)
+                    state = job.state
+                else:
+                    task_state = job.get_task_state(node.task) or {}
+                    state = task_state.get('state')
+                    node.finish(state == 'COMPLETED', task_state.get('exit_code'), ts)
+                self._finalize(node)
+                if node.state == JobNode.FAILED:
+                    logger.warning(f"Job '{node.name}' failed (state {state}, exit code {node.exit_code}).")
+                elif node.state == JobNode.SKIPPED:
+                    logger.warning(f"Job '{node.name}' skipped, a job it depends on has failed.")
+                else:
+                    logger.debug(f"Job '{node.name}' completed in {node.get_duration():.1f}s.")
+
+    def _get_steps(self, job) -> dict:
+        '''
+        Return states of steps of given job from SLURM accounting (empty dict if unavailable).
+        '''
+        try:
+            return self.slurm.get_job_steps(job)
+        except Exception as e:
+            logger.warning(f"Unable to retrieve steps of job '{job.get_name()}': {e}")
+            return {}
+
+    def _log_stats(self, graph: JobGraph, wall_time: float) -> None:
+        '''
+        Log statistics of individual stages (numbers of jobs, their states, and timings).
+        '''
+        stages = {}
+        for node in graph.nodes.values():
+            stages.setdefault(node.stage, []).append(node)
+
+        for stage, nodes in stages.items():
+            states = {}
+            for node in nodes:
+                states[node.state] = states.get(node.state, 0) + 1
+            durations = [node.get_duration() for node in nodes if node.get_duration() is not None]
+            timing = f", avg {sum(durations) / len(durations):.1f}s, max {max(durations):.1f}s" if durations else ''
+            started = [node.submitted_at for node in nodes if node.submitted_at is not None]
+            finished = [node.finished_at for node in nodes if node.finished_at is not None]
+            span = f", span {max(finished) - min(started):.1f}s" if started and finished else ''
+            counts = ', '.join([f'{state.lower()}: {count}' for state, count in states.items()])
+            logger.info(f"Stage '{stage}': {len(nodes)} jobs ({counts}){timing}{span}.")
+        logger.info(f"Evaluation of {len(graph)} jobs took {wall_time:.1f}s.")
+
+    def run(self, graph: JobGraph) -> None:
+        '''
+        Execute all jobs of the graph and wait for their termination.
+        The results are recorded in the graph nodes.
+        '''
+        started = time.time()
+        while True:
+            self._submit_ready(graph)
+            if not self._running:
+                if graph.is_finished():
+                    break
+                raise RuntimeError("Evaluation is stuck, there are unfinished jobs that cannot be submitted.")
+
+            self.slurm.sleep(self.slurm.get_poll_interval())
+            self._process_terminated(self.slurm.update_jobs())
+
+        self._log_stats(graph, time.time() - started)
@@ -0,0 +1,341 @@
+import fnmatch
+import json
+import os
+import shlex
+import shutil
+import time
+from loguru import logger
+from evaluation.dag import JobGraph, JobNode
+from components.manifest import Manifest
+from components.results import Result
+
+
+def format_command(cmd: list[str] | str) -> str:
+    '''
+    Commands in config are either a single string (a shell command line) or a list of arguments.
+    Returns a line of the job script.
+    '''
+    if isinstance(cmd, str):
+        return cmd
+    if len(cmd) == 1:
+        return cmd[0]
+    return shlex.join(cmd)
+
+
+class Planner:
+    '''
+    Expands solutions into a job graph according to the builds and tests of their assignments.
+    Every job gets its own box (working directory), test boxes get a copy of the build artifacts.
+    The boxes are prepared lazily (just before the job is submitted).
+    If the build cache is enabled, builds with cached artifacts are skipped (the box is created from the cache).
+    If a scratch dir is given, tests run in node-local scratch (only declared outputs are copied back to the box).
+    Cached inputs (path -> (digest, object path)) are hardlinked into the boxes, or staged from a node-local cache.
+    Generated inputs are handled the same way (they are registered in the inputs under their generator keys).
+    Overlays are hardlinked into build boxes from read-only snapshots (only files declared writable are copied).
+    '''
+
+    def __init__(self, workspace, assignments, scratch_dir: str | None = None, inputs: dict | None = None,
+                 node_cache_dir: str | None = None):
+        self.workspace = workspace
+        self.assignments = assignments
+        self.scratch_dir = scratch_dir
+        self.inputs = inputs or {}
+        self.node_cache_dir = node_cache_dir if scratch_dir else None
+        self._overlay_hashes = {}  # overlay path -> tree hash (overlays are hashed once per evaluation)
+        self._overlay_snapshots = {}  # overlay path -> snapshot dir
+
+    def _get_name(self, solution, *parts) -> str:
+        return '.'.join([solution.assignment_id, solution.id, *parts])
+
+    def _get_script(self, box: str, commands: list) -> list[str]:
+        script = ['set -e', f'cd {shlex.quote(box)}']
+        script.extend([format_command(cmd) for cmd in commands])
+        return script
+
+    def _get_scratch_script(self, node: JobNode, commands: list, outputs: list) -> list[str]:
+        '''
+        Return a test script that stages the box (and the build artifacts) into node-local scratch, runs the test
+        there, and copies back only the declared outputs. Transfer sizes and times are recorded in the job dir.
+        '''
+        box = shlex.quote(node.data['box'])
+        script = [
+            'set -e',
+            f'scratch=$(mktemp -d "{self.scratch_dir}/hpc-eval.XXXXXX")',
+            'trap \'rm -rf "$scratch"\' EXIT',
+            'now() { echo $(( $(date +%s%N) / 1000000 )); }',
+            't0=$(now)',
+            f'cp -a {box}/. "$scratch"/',
+        ]
+        if node.data['artifacts'] and node.deps:
+            script.append(f'cp -a --reflink=auto {shlex.quote(node.data["artifacts"])}/. "$scratch"/')
+        if node.data['node_inputs']:  # inputs are copied to the node cache once, then hardlinked
+            script.append(f'node_cache="{self.node_cache_dir}"; mkdir -p "$node_cache"')
+        for input, name in node.data['inputs']:
+            if input not in node.data['node_inputs']:
+                continue
+            digest, object = node.data['node_inputs'][input]
+            cached, target = f'"$node_cache"/{digest}', f'"$scratch"/{shlex.quote(name)}'
+            script.extend([
+                f'[ -e {cached} ] || {{ cp {shlex.quote(object)} {cached}.$$ && mv -f {cached}.$$ {cached}; }}',
+                f'ln -f {cached} {target} 2> /dev/null || cp {cached} {target}',
+            ])
+        script.extend(['t1=$(now)', 'staged=$(du -sb "$scratch" | cut -f1)', 'cd "$scratch"',
+                       'set +e', '(', 'set -e'])
+        script.extend([format_command(cmd) for cmd in commands])
+        script.extend([')', 'rc=$?', 'set -e', 't2=$(now)', 'returned=0'])
+        if outputs:
+            script.extend([
+                f'for f in {" ".join([shlex.quote(output) for output in outputs])}; do',
+                '    if [ -e "$f" ]; then',
+                f'        rm -rf {box}/"$f"; mkdir -p {box}/"$(dirname "$f")"; cp -a "$f" {box}/"$f"',
+                '        returned=$(( returned + $(du -sb "$f" | cut -f1) ))',
+                '    fi',
+                'done',
+            ])
+        transfer = shlex.quote(f"{node.data['job_dir']}/transfer.json")
+        script.extend([
+            't3=$(now)',
+            'echo "{\\"staged_bytes\\": $staged, \\"stage_in_ms\\": $((t1 - t0)), '
+            f'\\"returned_bytes\\": $returned, \\"stage_out_ms\\": $((t3 - t2))}}" > {transfer}',
+            'exit $rc',
+        ])
+        return script
+
+    def _get_build_key(self, solution, build: dict) -> str:
+        '''
+        Compute build cache key from contents of the solution, contents of the overlay, and the build commands.
+        '''
+        solution_hash = solution.manifest
+        if solution_hash is None:  # solutions submitted before manifests were introduced
+            solution_hash = Manifest.from_dir(self.workspace.open_solution_dir(solution)).get_tree_hash()
+
+        overlay_hash = self._get_overlay_hash(build['overlay']) if build.get('overlay') else None
+        return self.workspace.build_cache.compute_key(solution_hash, overlay_hash, build.get('run', []))
+
+    def _get_overlay_hash(self, overlay: str) -> str:
+        if overlay not in self._overlay_hashes:
+            self._overlay_hashes[overlay] = Manifest.from_dir(overlay).get_tree_hash()
+        return self._overlay_hashes[overlay]
+
+    def _get_overlay_snapshot(self, overlay: str) -> str:
+        '''
+        Return path to a read-only snapshot of the overlay (kept in the overlay cache and keyed by its tree hash),
+        so the boxes get exactly the overlay the build cache key was computed from. The snapshot is owned by the same
+        user as the jobs, so the files are reflinked (or copied) into the boxes, never hardlinked.
+        '''
+        if overlay not in self._overlay_snapshots:
+            cache = self.workspace.overlay_cache
+            key = self._get_overlay_hash(overlay)
+            dir = cache.lookup(key)
+            if dir is None:
+                staging = cache.get_staging_dir(key, str(os.getpid()))
+                cache.discard(staging)  # leftover of an interrupted evaluation
+                self.workspace.copy_tree(overlay, staging)
+                for path, _, files in os.walk(staging):
+                    for file in files:
+                        mode = os.lstat(f'{path}/{file}').st_mode
+                        os.chmod(f'{path}/{file}', mode & ~0o222)
+                cache.commit(key, staging)
+                dir = cache.get_entry_dir(key)
+            self._overlay_snapshots[overlay] = dir
+        return self._overlay_snapshots[overlay]
+
+    def _apply_overlay(self, node: JobNode) -> None:
+        '''
+        Copy overlay files into the build box. If the overlay cache is enabled, files are reflinked (or copied)
+        from a read-only snapshot, except for the writable ones (which are copied from the overlay with their modes).
+        '''
+        overlay = node.data['overlay']
+        if not self.workspace.overlay_cache:
+            stats = self.workspace.copy_tree(overlay, node.data['box'])
+            logger.debug(f"Overlay of build '{node.data['build']}' applied, {stats}.")
+            return
+
+        writable = node.data['writable']
+
+        def is_writable(path: str) -> bool:
+            return any([fnmatch.fnmatch(path, pattern) for pattern in writable])
+
+        stats = self.workspace.copy_tree(self._get_overlay_snapshot(overlay), node.data['box'],
+                                         lambda path: not is_writable(path))
+        logger.debug(f"Overlay of build '{node.data['build']}' applied from snapshot, {stats}.")
+        if writable:
+            stats = self.workspace.copy_tree(overlay, node.data['box'], is_writable)
+            logger.debug(f"Writable files of overlay of build '{node.data['build']}' copied, {stats}.")
+
+    def _create_box(self, box: str, source_dir: str | None = None) -> None:
+        '''
+        Create a fresh (empty) box, optionally with a copy of the source dir. The box never shares inodes with
+        the source (the jobs could chmod and modify archived or deduplicated files otherwise).
+        '''
+        if os.path.exists(box):
+            shutil.rmtree(box)  # leftover of previous evaluation
+        os.makedirs(box)
+        if source_dir:
+            stats = self.workspace.copy_tree(source_dir, box)
+            logger.debug(f"Box '{box}' created, {stats}.")
+
+    def _prepare_build(self, node: JobNode) -> None:
+        start = time.monotonic()
+        node.job_dir = self.workspace.get_job_dir(node.name)
+        if node.data.get('staging'):
+            self.workspace.build_cache.discard(node.data['staging'])  # leftover of previous evaluation
+        self._create_box(node.data['box'], self.workspace.open_solution_dir(node.solution))
+        if node.data.get('overlay'):
+            self._apply_overlay(node)
+        node.data['setup_ms'] = int((time.monotonic() - start) * 1000)
+
+    def _prepare_test(self, node: JobNode) -> None:
+        start = time.monotonic()
+        node.job_dir = self.workspace.get_job_dir(node.name)
+        if node.deps:
+            self._create_box(node.data['box'])  # artifacts are copied by the job itself (after the build)
+        else:  # no build job, the box is created from the solution (or from cached build artifacts)
+            source_dir = node.data['artifacts'] or self.workspace.open_solution_dir(node.solution)
+            self._create_box(node.data['box'], source_dir)
+
+        cached, inputs = [], []  # node-cached inputs are staged by the job
+        for input, name in node.data['inputs']:
+            if input in node.data['node_inputs']:
+                continue
+            if input in self.inputs:  # objects of our caches (read-only) are hardlinked
+                cached.append((self.inputs[input][1], f"{node.data['box']}/{name}"))
+            else:
+                inputs.append((input, f"{node.data['box']}/{name}"))
+        for files, allow_hardlink in [(cached, True), (inputs, False)]:
+            if files:
+                stats = self.workspace.copy_files(files, allow_hardlink=allow_hardlink)
+                logger.debug(f"Inputs of test '{node.data['test']}' copied, {stats}.")
+        node.data['setup_ms'] = int((time.monotonic() - start) * 1000)
+
+    def _finalize_build(self, node: JobNode) -> None:
+        '''
+        Commit artifacts of a successful build into the cache. The build box is removed
+        if no test depends on it (otherwise, the last test removes it).
+        '''
+        if 'staging' in node.data:
+            if node.state == JobNode.COMPLETED:
+                self.workspace.build_cache.commit(node.data['cache_key'], node.data['staging'])
+            else:
+                self.workspace.build_cache.discard(node.data['staging'])
+        if node.data['refs'] == 0:
+            shutil.rmtree(node.data['box'], ignore_errors=True)
+
+    def _finalize_test(self, node: JobNode) -> None:
+        '''
+        Load transfer statistics (if the test ran in scratch) and release the build artifacts
+        (the last test of the build removes them).
+        '''
+        transfer = f"{node.data['job_dir']}/transfer.json"
+        if self.scratch_dir and os.path.exists(transfer):
+            with open(transfer) as fp:
+                node.data['transfer'] = json.load(fp)
+
+        if not node.deps:
+            return
+        build_node = node.deps[0]
+        build_node.data['refs'] -= 1
+        if build_node.data['refs'] == 0 and build_node.is_finished():
+            shutil.rmtree(build_node.data['box'], ignore_errors=True)
+            logger.debug(f"Artifacts of '{build_node.name}' removed.")
+
+    def _plan_build(self, solution, build_name: str, build: dict, graph: JobGraph) -> tuple[JobNode | None, str]:
+        '''
+        Add build job into the graph (unless the artifacts are cached).
+        Returns a tuple (build node or None, path to the artifacts).
+        '''
+        cache = self.workspace.build_cache
+        key = self._get_build_key(solution, build) if cache else None
+        cached = cache.lookup(key, pin=True) if cache else None  # the tests copy the artifacts later
+        if cached:
+            logger.debug(f"Build '{build_name}' of solution '{solution.id}' found in cache.")
+            return (None, cached)
+
+        node = JobNode(self._get_name(solution, build_name, 'build'), 'build', solution)
+        box = self.workspace.get_job_dir(node.name, create=False) + '/box'
+        node.data = {'box': box, 'build': build_name, 'overlay': build.get('overlay'),
+                     'writable': build.get('writable', []), 'refs': 0}
+        node.commands = self._get_script(box, build.get('run', []))
+        node.prepare = self._prepare_build
+        node.finalize = self._finalize_build
+        if cache:  # successful build stores a snapshot of the box for later commit into the cache
+            staging = cache.get_staging_dir(key, node.name)
+            node.data |= {'cache_key': key, 'staging': staging}
+            node.commands.extend([f'mkdir -p {shlex.quote(staging)}', f'cp -a . {shlex.quote(staging)}/'])
+        graph.add(node)
+        return (node, box)
+
+    def plan_solution(self, solution, graph: JobGraph) -> list[JobNode]:
+        '''
+        Add jobs evaluating given solution into the graph. Returns list of added nodes.
+        Each build is executed once, all tests using the build are executed concurrently afterwards
+        (every test gets its own box with a copy of the build artifacts).
+        '''
+        assignment = self.assignments[solution.assignment_id]
+        if assignment is None:
+            logger.warning(f"Solution '{solution.id}' refers to unknown assignment '{solution.assignment_id}'.")
+            return []
+
+        nodes = []
+        builds = {}  # build name -> (node, artifacts dir)
+        for test_name, test in assignment.tests.items():
+            build_node = artifacts = None
+            build = assignment.get_test_build(test_name)
+            if build is not None:
+                if test['build'] not in builds:
+                    builds[test['build']] = self._plan_build(solution, test['build'], build, graph)
+                    if builds[test['build']][0]:
+                        nodes.append(builds[test['build']][0])
+                build_node, artifacts = builds[test['build']]
+
+            node = JobNode(self._get_name(solution, test_name, 'test'), 'test', solution,
+                           [build_node] if build_node else [])
+            job_dir = self.workspace.get_job_dir(node.name, create=False)
+            inputs = [(input, os.path.basename(input)) for input in test.get('inputs', [])]  # (path or key, name)
+            inputs.extend([(self.workspace.input_generator.get_key(generator), generator['name'])
+                           for generator in test.get('generated', [])])
+            node.data = {'box': job_dir + '/box', 'job_dir': job_dir, 'test': test_name,
+                         'inputs': inputs, 'artifacts': artifacts}
+            node.data['node_inputs'] = {input: self.inputs[input] for input, _ in inputs
+                                        if self.node_cache_dir and input in self.inputs}
+            if self.scratch_dir:
+                node.commands = self._get_scratch_script(node, test.get('run', []), test.get('outputs', []))
+            else:
+                node.commands = self._get_script(node.data['box'], test.get('run', []))
+                if build_node:
+                    node.commands.insert(1, f"cp -a --reflink=auto {shlex.quote(artifacts)}/. "
+                                         f"{shlex.quote(node.data['box'])}/")
+            if build_node:
+                build_node.data['refs'] += 1
+            node.prepare = self._prepare_test
+            node.finalize = self._finalize_test
+            nodes.append(graph.add(node))
+
+        return nodes
+
+    def plan(self, solutions: list) -> JobGraph:
+        '''
+        Create a job graph evaluating given solutions.
+        '''
+        graph = JobGraph()
+        for solution in solutions:
+            self.plan_solution(solution, graph)
+        logger.info(f"Evaluation of {len(solutions)} solutions planned as {len(graph)} jobs.")
+        return graph
+
+    def collect_results(self, graph: JobGraph) -> dict[str, Result]:
+        '''
+        Gather states of the finished jobs into result objects (solution ID -> Result).
+        '''
+        results = {}
+        for node in graph.nodes.values():
+            solution = node.solution
+            if solution.id not in results:
+                results[solution.id] = Result(solution.id, assignment_id=solution.assignment_id,
+                                              user_id=solution.user_id)
+            result = results[solution.id]
+            result.add_job(node.name, node.stage, node.state, node.exit_code, node.get_duration(),
+                           node.data.get('transfer'), node.data.get('setup_ms'))
+            if node.stage == 'test':
+                result.add_test(node.data['test'], node.state, node.exit_code)
+        return results
@@ -0,0 +1,86 @@
+import os
+import shlex
+from evaluation.dag import JobNode
+
+# Shell function that runs one step (args: name, job dir, job dirs of the dependencies).
+# The step is skipped if a dependency has not succeeded. Outside of SLURM allocation, the step is executed directly.
+# The exit code and elapsed time are recorded in the job dir (in case the accounting is not available).
+_run_step_function = [
+    'run_step() {',
+    '    name=$1; dir=$2; shift 2',
+    '    for dep in "$@"; do',
+    '        [ "$(cat "$dep/exit_code" 2> /dev/null)" = 0 ] || return 0',
+    '    done',
+    '    start=$(date +%s)',
+    '    if [ -n "$SLURM_JOB_ID" ] && command -v srun > /dev/null; then',
+    '        srun --exact -N1 -n1 --job-name="$name" --output="$dir/stdout.log" --error="$dir/stderr.log" '
+    'sh "$dir/step.sh"',
+    '    else',
+    '        sh "$dir/step.sh" > "$dir/stdout.log" 2> "$dir/stderr.log"',
+    '    fi',
+    '    echo $? > "$dir/exit_code"',
+    '    echo $(( $(date +%s) - start )) > "$dir/elapsed"',
+    '}',
+]
+
+
+def get_step_levels(nodes: list[JobNode]) -> list[list[JobNode]]:
+    '''
+    Split nodes (in topological order) into levels, nodes of one level depend only on nodes of previous levels
+    (or on nodes outside the list), so they can be executed concurrently.
+    '''
+    levels = {}
+    for node in nodes:
+        levels[node.name] = max([levels[dep.name] + 1 for dep in node.deps if dep.name in levels], default=0)
+
+    res = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+    for node in nodes:
+        res[levels[node.name]].append(node)
+    return res
+
+
+def write_step_script(node: JobNode) -> None:
+    '''
+    Save commands of the node into its job dir and remove records of a previous execution.
+    '''
+    assert node.job_dir, f"Job step '{node.name}' requires a job dir."
+    with open(f'{node.job_dir}/step.sh', 'w') as fp:
+        fp.write('\n'.join(node.commands) + '\n')
+    for file in ['exit_code', 'elapsed']:
+        if os.path.exists(f'{node.job_dir}/{file}'):
+            os.unlink(f'{node.job_dir}/{file}')
+
+
+def get_allocation_script(nodes: list[JobNode]) -> list[str]:
+    '''
+    Return commands of an allocation script that runs the nodes as job steps.
+    Steps of one level are executed concurrently, levels are executed one after another.
+    '''
+    names = set([node.name for node in nodes])
+    script = list(_run_step_function)
+    for level in get_step_levels(nodes):
+        for node in level:
+            deps = [shlex.quote(dep.job_dir) for dep in node.deps if dep.name in names]
+            script.append(' '.join(['run_step', shlex.quote(node.name), shlex.quote(node.job_dir), *deps, '&']))
+        script.append('wait')
+    return script
+
+
+def read_step_record(node: JobNode) -> dict | None:
+    '''
+    Read exit code and elapsed time recorded by the allocation script. Returns None if the step was not executed.
+    '''
+    try:
+        with open(f'{node.job_dir}/exit_code') as fp:
+            exit_code = int(fp.read().strip())
+    except (OSError, ValueError):
+        return None
+
+    try:
+        with open(f'{node.job_dir}/elapsed') as fp:
+            elapsed = int(fp.read().strip())
+    except (OSError, ValueError):
+        elapsed = None
+
+    return {'state': 'COMPLETED' if exit_code == 0 else 'FAILED', 'running': False,
+            'exit_code': exit_code, 'elapsed': elapsed}
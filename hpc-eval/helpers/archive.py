@@ -0,0 +1,259 @@
+import gzip
+import hashlib
+import os
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from loguru import logger
+
+# archive types are detected by file name suffixes
+archive_types = {
+    '.zip': 'zip',
+    '.tar': 'tar',
+    '.tar.gz': 'tar.gz',
+    '.tgz': 'tar.gz',
+    '.tar.zst': 'tar.zst',
+    '.tzst': 'tar.zst',
+}
+
+_chunk_size = 1 << 20
+
+
+def get_archive_type(path: str) -> str | None:
+    '''
+    Return archive type (zip, tar, tar.gz, tar.zst) based on file name, None if the type is not supported.
+    '''
+    for suffix, type in archive_types.items():
+        if path.lower().endswith(suffix):
+            return type
+    return None
+
+
+def _open_zstd_stream(fp):
+    '''
+    Wrap a binary file object with zstd decompressing reader (an optional dependency is required).
+    '''
+    try:
+        from compression import zstd  # python 3.14+
+        return zstd.ZstdFile(fp, 'rb')
+    except ImportError:
+        pass
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError("Package 'zstandard' is required to extract .tar.zst archives.")
+    return zstandard.ZstdDecompressor().stream_reader(fp)
+
+
+def _get_zstd_errors() -> tuple:
+    '''
+    Return exception types raised by the available zstd implementations on corrupted data.
+    '''
+    errors = []
+    try:
+        from compression import zstd  # python 3.14+
+        errors.append(zstd.ZstdError)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        errors.append(zstandard.ZstdError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def get_member_target(target_dir: str, name: str) -> str:
+    '''
+    Sanitize archive member name and return the full path where the member is extracted.
+    ArchiveError is raised if the member would escape the target directory.
+    '''
+    name = name.replace('\\', '/')
+    if '\0' in name or name.startswith('/') or (len(name) > 1 and name[1] == ':'):
+        raise ArchiveError(f"Archive member '{name}' has an absolute path.")
+    parts = [part for part in name.split('/') if part and part != '.']
+    if '..' in parts:
+        raise ArchiveError(f"Archive member '{name}' points outside of the target directory.")
+    if not parts:
+        return target_dir
+    return os.path.join(target_dir, *parts)
+
+
+class ArchiveError(Exception):
+    '''
+    Raised when an archive is malformed, unsupported, or it exceeds extraction limits.
+    '''
+    pass
+
+
+class ExtractionStats:
+    '''
+    Statistics collected during one extraction (shared by all threads).
+    '''
+
+    def __init__(self, archive_size: int, compute_digests: bool = False):
+        self.archive_size = archive_size
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.digests = {} if compute_digests else None  # target path -> content hash
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def finish(self) -> None:
+        self.seconds = time.monotonic() - self._started
+
+    def __str__(self):
+        return f"{self.files} files ({self.bytes} bytes) extracted from {self.archive_size} bytes in " \
+            f"{self.seconds:.3f}s"
+
+
+class ArchiveExtractor:
+    '''
+    Safe extraction of zip and tar archives. Members are streamed into the target directory while the limits on
+    total size, number of files, and compression ratio are enforced (so a decompression bomb is stopped early).
+    Members escaping the target directory (absolute paths, '..', links) are rejected.
+    '''
+
+    def __init__(self, max_size: int = 0, max_files: int = 0, max_ratio: int = 0, workers: int = 1):
+        '''
+        Limits are given in bytes, count of files, and uncompressed-to-compressed ratio (0 = unlimited).
+        Workers define number of threads used for extraction of zip members.
+        '''
+        self.max_size = max_size
+        self.max_files = max_files
+        self.max_ratio = max_ratio
+        self.workers = max(1, workers)
+
+    def _add_file(self, stats: ExtractionStats) -> None:
+        with stats._lock:
+            stats.files += 1
+            if self.max_files and stats.files > self.max_files:
+                raise ArchiveError(f"The archive has more than {self.max_files} files.")
+
+    def _add_bytes(self, stats: ExtractionStats, count: int) -> None:
+        with stats._lock:
+            stats.bytes += count
+            if self.max_size and stats.bytes > self.max_size:
+                raise ArchiveError(f"The extracted data exceed {self.max_size} bytes.")
+            if self.max_ratio and stats.bytes > self.max_ratio * max(stats.archive_size, 1):
+                raise ArchiveError(f"The archive exceeds maximal compression ratio {self.max_ratio}.")
+
+    def _stream(self, source, target: str, stats: ExtractionStats, mode: int | None = None) -> None:
+        '''
+        Copy data from an open member stream into a new file (limits are checked for every chunk).
+        '''
+        if os.path.lexists(target):
+            raise ArchiveError(f"Archive member '{target}' is present multiple times.")
+        hash = hashlib.sha256() if stats.digests is not None else None
+        with open(target, 'xb') as fp:
+            while True:
+                chunk = source.read(_chunk_size)
+                if not chunk:
+                    break
+                self._add_bytes(stats, len(chunk))
+                fp.write(chunk)
+                if hash:
+                    hash.update(chunk)
+        if hash:
+            with stats._lock:
+                stats.digests[target] = hash.hexdigest()
+        if mode is not None:
+            os.chmod(target, mode & 0o777)
+
+    def _extract_zip(self, archive: str, target_dir: str, stats: ExtractionStats) -> None:
+        with zipfile.ZipFile(archive, 'r') as zip_ref:
+            members = []
+            declared = 0
+            for info in zip_ref.infolist():  # the central directory is checked first (cheap early rejection)
+                target = get_member_target(target_dir, info.filename)
+                if info.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                self._add_file(stats)
+                declared += info.file_size
+                members.append((info, target))
+
+            if self.max_size and declared > self.max_size:
+                raise ArchiveError(f"The archive declares {declared} bytes of data (limit is {self.max_size}).")
+            if self.max_ratio and declared > self.max_ratio * max(stats.archive_size, 1):
+                raise ArchiveError(f"The archive exceeds maximal compression ratio {self.max_ratio}.")
+            for _, target in members:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # actual data are streamed in parallel (each worker has its own handle)
+        local = threading.local()
+
+        def extract_member(info, target):
+            if not hasattr(local, 'zip_ref'):
+                local.zip_ref = zipfile.ZipFile(archive, 'r')
+                handles.append(local.zip_ref)
+            with local.zip_ref.open(info, 'r') as source:
+                self._stream(source, target, stats)
+
+        handles = []
+        try:
+            if self.workers < 2 or len(members) < 2:
+                for info, target in members:
+                    extract_member(info, target)
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    futures = [executor.submit(extract_member, info, target) for info, target in members]
+                    try:
+                        for future in as_completed(futures):
+                            future.result()
+                    except Exception as e:
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise e
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def _extract_tar(self, fileobj, target_dir: str, stats: ExtractionStats) -> None:
+        # tar archives are processed sequentially in streaming mode (compressed tars have no random access)
+        with tarfile.open(fileobj=fileobj, mode='r|') as tar:
+            for member in tar:
+                target = get_member_target(target_dir, member.name)
+                if member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                elif member.isreg():
+                    self._add_file(stats)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    self._stream(tar.extractfile(member), target, stats, member.mode | 0o600)
+                else:
+                    raise ArchiveError(f"Archive member '{member.name}' is not a regular file nor a directory.")
+
+    def extract(self, archive: str, target_dir: str, compute_digests: bool = False) -> ExtractionStats:
+        '''
+        Extract given archive into an existing target directory. ArchiveError is raised if the archive is not safe.
+        Returns extraction statistics (including content hashes of extracted files if compute_digests is set).
+        '''
+        type = get_archive_type(archive)
+        if type is None:
+            raise ArchiveError(f"Archive '{archive}' has unsupported type.")
+
+        logger.trace(f"Extracting {type} archive '{archive}' into '{target_dir}'.")
+        stats = ExtractionStats(os.path.getsize(archive), compute_digests)
+        try:
+            if type == 'zip':
+                self._extract_zip(archive, target_dir, stats)
+            else:
+                with open(archive, 'rb') as fp:
+                    if type == 'tar':
+                        self._extract_tar(fp, target_dir, stats)
+                    elif type == 'tar.gz':
+                        with gzip.GzipFile(fileobj=fp, mode='rb') as gz:
+                            self._extract_tar(gz, target_dir, stats)
+                    else:
+                        with _open_zstd_stream(fp) as zst:
+                            self._extract_tar(zst, target_dir, stats)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, gzip.BadGzipFile, zlib.error,
+                *(_get_zstd_errors() if type == 'tar.zst' else ())) as e:
+            raise ArchiveError(f"Archive '{archive}' is corrupted: {e}")
+
+        stats.finish()
+        return stats
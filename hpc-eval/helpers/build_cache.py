@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from loguru import logger
+from helpers.serializable import Serializable
+
+
+class BuildCacheIndex(Serializable):
+    '''
+    Persistent index of the build cache (entry sizes and last use times, hit/miss counters).
+    '''
+
+    def __init__(self, file: str | None = None):
+        super().__init__(file)
+        self.entries = {}  # key -> { size, created, last_used }
+        self.hits = 0
+        self.misses = 0
+
+    def get_size(self) -> int:
+        return sum([entry['size'] for entry in self.entries.values()])
+
+
+class BuildCache:
+    '''
+    Content-addressed cache of build artifacts. The key combines the content hash of the solution,
+    the content hash of the build overlay, and the build commands, so a hit can reuse the artifacts
+    (a snapshot of the box after a successful build) and skip the build job entirely.
+    The total size is bounded, least recently used entries are evicted first. Entries pinned by this process
+    (still needed by the running evaluation) are never evicted by it.
+    The same structure memoizes outputs of input generators (see InputGenerator).
+    '''
+
+    def __init__(self, root: str, max_size: int, dir_mode: int = 0o770):
+        self.root = root
+        self.max_size = max_size
+        self.dir_mode = dir_mode
+        self._index_file = f'{root}/index.json'
+        self._index = BuildCacheIndex(self._index_file)
+        self._pinned = set()  # keys of entries which must not be evicted (until unpin_all())
+
+    @staticmethod
+    def compute_key(solution_hash: str, overlay_hash: str | None, commands: list) -> str:
+        '''
+        Compute the cache key from the solution tree hash, the overlay tree hash, and the build commands.
+        '''
+        data = json.dumps([solution_hash, overlay_hash, commands])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _lock_index(self) -> BuildCacheIndex:
+        '''
+        Lock the index exclusively and load it (the caller must save or close it to release the lock).
+        '''
+        self._index.open_serialization_file(exclusive=True)
+        if os.path.getsize(self._index_file) > 0:  # empty file has just been created
+            self._index.load_json(keep_open=True, exclusive=True)
+        return self._index
+
+    def get_entry_dir(self, key: str) -> str:
+        return f'{self.root}/entries/{key}'
+
+    def get_staging_dir(self, key: str, name: str) -> str:
+        '''
+        Return path where a build job stores its artifacts before they are committed to the cache.
+        '''
+        return f'{self.root}/staging/{key}.{name}'
+
+    def lookup(self, key: str, pin: bool = False) -> str | None:
+        '''
+        Return path to the cached artifacts (a directory) or None on a miss.
+        If pin is set, the entry is not evicted until unpin_all() is called (it is used later).
+        '''
+        index = self._lock_index()
+        dir = self.get_entry_dir(key)
+        if key in index.entries and os.path.isdir(dir):
+            index.entries[key]['last_used'] = int(time.time())
+            index.hits += 1
+            if pin:
+                self._pinned.add(key)
+        else:
+            index.entries.pop(key, None)
+            index.misses += 1
+            dir = None
+        index.save_json()
+        return dir
+
+    def unpin_all(self) -> None:
+        '''
+        Release all pinned entries (when the evaluation which uses them is finished).
+        Entries kept over the size limit only because they were pinned are evicted right away.
+        '''
+        if not self._pinned:
+            return
+        self._pinned.clear()
+        index = self._lock_index()
+        self._evict(index)
+        index.save_json()
+
+    def _remove_dir(self, dir: str) -> None:
+        # rename first, so the removal is atomic from the perspective of cache readers
+        trash = f'{dir}.{os.getpid()}.trash'
+        try:
+            os.rename(dir, trash)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def _evict(self, index: BuildCacheIndex) -> None:
+        size = index.get_size()
+        for key in sorted(index.entries, key=lambda key: index.entries[key]['last_used']):
+            if size <= self.max_size:
+                break
+            if key in self._pinned:
+                continue
+            size -= index.entries.pop(key)['size']
+            self._remove_dir(self.get_entry_dir(key))
+            logger.debug(f"Build cache entry '{key}' evicted.")
+
+    def commit(self, key: str, staging_dir: str, pin: bool = False) -> bool:
+        '''
+        Move artifacts from the staging dir into the cache under given key and evict old entries if necessary.
+        Returns False if the entry already existed (the staging dir is discarded).
+        If pin is set, the entry is not evicted until unpin_all() is called.
+        '''
+        if pin:
+            self._pinned.add(key)
+        size = 0
+        for path, _, files in os.walk(staging_dir):
+            size += sum([os.lstat(f'{path}/{file}').st_size for file in files])
+
+        index = self._lock_index()
+        dir = self.get_entry_dir(key)
+        os.makedirs(os.path.dirname(dir), mode=self.dir_mode, exist_ok=True)
+        try:
+            os.rename(staging_dir, dir)
+        except OSError:  # the entry already exists
+            index.close_serialization_file()
+            self.discard(staging_dir)
+            return False
+
+        ts = int(time.time())
+        index.entries[key] = {'size': size, 'created': ts, 'last_used': ts}
+        self._evict(index)
+        index.save_json()
+        return True
+
+    def discard(self, staging_dir: str) -> None:
+        '''
+        Remove artifacts of a failed (or redundant) build.
+        '''
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def get_stats(self) -> dict:
+        '''
+        Return the number of entries, their total size, number of hits and misses, and the hit ratio.
+        '''
+        index = self._lock_index()
+        index.close_serialization_file()
+        total = index.hits + index.misses
+        return {'entries': len(index.entries), 'size': index.get_size(), 'hits': index.hits,
+                'misses': index.misses, 'hit_ratio': index.hits / total if total else 0.0}
@@ -0,0 +1,228 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import stat
+import threading
+import time
+from helpers.object_store import compute_digest
+
+FICLONE = 0x40049409  # ioctl request code for cloning a file (reflink), see ioctl_ficlone(2)
+
+# errors indicating the method is not supported by the file system (or across file systems)
+_unsupported_errors = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS,
+                       errno.EBADF}
+
+_chunk_size = 1 << 20
+
+
+def _reflink(src: str, dst: str) -> int:
+    '''
+    Clone the file data by FICLONE ioctl (the data blocks are shared until modified).
+    Returns number of bytes physically written (zero).
+    '''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError as e:
+            fdst.close()
+            os.unlink(dst)
+            raise e
+    shutil.copymode(src, dst)
+    return 0
+
+
+def _copy_file_range(src: str, dst: str) -> int:
+    '''
+    Copy the file data inside the kernel (no round trip through user-space buffers).
+    Returns number of bytes written.
+    '''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        try:
+            while True:
+                count = os.copy_file_range(fsrc.fileno(), fdst.fileno(), max(size - copied, 1 << 20))
+                if count == 0:
+                    break
+                copied += count
+        except OSError as e:
+            fdst.close()
+            os.unlink(dst)
+            raise e
+    shutil.copymode(src, dst)
+    return copied
+
+
+def _hardlink(src: str, dst: str) -> int:
+    '''
+    Create a hardlink (only for read-only sources, since the data are shared).
+    Returns number of bytes written (zero).
+    '''
+    os.link(src, dst)
+    return 0
+
+
+def _copy(src: str, dst: str, hash=None) -> int:
+    '''
+    Regular copy (the fallback that always works). If a hash object is given, the data are hashed while being copied.
+    Returns number of bytes written.
+    '''
+    if hash is None:
+        shutil.copy(src, dst)
+        return os.path.getsize(dst)
+
+    written = 0
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while chunk := fsrc.read(_chunk_size):
+            hash.update(chunk)
+            fdst.write(chunk)
+            written += len(chunk)
+    shutil.copymode(src, dst)
+    return written
+
+
+def walk_tree(top: str):
+    '''
+    Variant of os.walk() which follows symlinks to dirs, yields (dir, file names) pairs.
+    A dir symlink pointing to one of its own ancestors (a loop) is skipped, so the walk always terminates.
+    '''
+    st = os.stat(top)
+    ancestors = {top: {(st.st_dev, st.st_ino)}}
+    for dir, dirs, names in os.walk(top, followlinks=True):
+        chain = ancestors.pop(dir)
+        kept = []
+        for name in dirs:
+            path = os.path.join(dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) not in chain:
+                ancestors[path] = chain | {(st.st_dev, st.st_ino)}
+                kept.append(name)
+        dirs[:] = kept
+        yield dir, names
+
+
+def _is_read_only(st: os.stat_result) -> bool:
+    return stat.S_ISREG(st.st_mode) and (st.st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)) == 0
+
+
+class CopyStats:
+    '''
+    Statistics collected while copying files (shared by all threads of one copying operation).
+    '''
+
+    def __init__(self, compute_digests: bool = False):
+        '''
+        If compute_digests is set, content hashes of all copied files are collected (target path -> digest).
+        '''
+        self.files = 0
+        self.bytes = 0  # logical size of copied files
+        self.bytes_written = 0  # bytes actually written (cloned and linked files are not counted)
+        self.methods = {}  # method name -> number of files
+        self.seconds = 0.0  # wall time of the whole operation
+        self.digests = {} if compute_digests else None
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def add(self, method: str, size: int, written: int) -> None:
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.bytes_written += written
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    def add_digest(self, path: str, digest: str) -> None:
+        with self._lock:
+            self.digests[path] = digest
+
+    def finish(self) -> None:
+        self.seconds = time.monotonic() - self._started
+
+    def __str__(self):
+        methods = ', '.join([f'{method}: {count}' for method, count in self.methods.items()])
+        return f"{self.files} files ({self.bytes} bytes) in {self.seconds:.3f}s, {self.bytes_written} bytes written" \
+            + (f" ({methods})" if methods else '')
+
+
+class FileCopier:
+    '''
+    Copy strategy that picks the cheapest correct method for every file.
+    Capabilities of the file systems are probed once for each (source device, target device) pair
+    (by the first file being copied) and the results are cached.
+    '''
+    methods = {
+        'hardlink': _hardlink,
+        'reflink': _reflink,
+        'copy_file_range': _copy_file_range,
+        'copy': _copy,
+    }
+
+    def __init__(self, method: str = 'auto'):
+        '''
+        The method is either 'auto' (try all methods in the order of preference) or one of the method names
+        (this method is tried first, the regular copy is the fallback).
+        Hardlinks are never used for files which are writable (modification would affect both copies),
+        and only if the caller allows them (see copy()).
+        '''
+        if method != 'auto' and method not in __class__.methods:
+            raise ValueError(f"Unknown copy method '{method}'.")
+        self.method = method
+        self._unsupported = {}  # (src_dev, dst_dev) -> set of methods known not to work
+        self._lock = threading.Lock()
+
+    def _candidates(self, src_st: os.stat_result, dst_dev: int, allow_hardlink: bool) -> list[str]:
+        if self.method == 'auto':
+            methods = list(__class__.methods)
+        else:
+            methods = [self.method, 'copy'] if self.method != 'copy' else ['copy']
+
+        if not allow_hardlink or src_st.st_dev != dst_dev or not _is_read_only(src_st):
+            methods = [m for m in methods if m != 'hardlink']
+        if not stat.S_ISREG(src_st.st_mode):
+            methods = ['copy']
+
+        with self._lock:
+            unsupported = self._unsupported.get((src_st.st_dev, dst_dev), set())
+        return [m for m in methods if m not in unsupported]
+
+    def _mark_unsupported(self, method: str, src_dev: int, dst_dev: int) -> None:
+        with self._lock:
+            self._unsupported.setdefault((src_dev, dst_dev), set()).add(method)
+
+    def copy(self, src: str, dst: str, stats: CopyStats | None = None, allow_hardlink: bool = False) -> str:
+        '''
+        Copy a single file (dst is the target file path or an existing directory), existing target file is replaced.
+        Hardlinks are used only if allowed, i.e., for read-only sources owned by this tool (like cached inputs).
+        A hardlink shares the inode, so whoever can chmod the target can modify the source.
+        Returns name of the method that was used.
+        '''
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        src_st = os.stat(src)
+        dst_dev = os.stat(os.path.dirname(os.path.abspath(dst))).st_dev
+        if os.path.lexists(dst):
+            os.unlink(dst)  # existing file is replaced (it may be read-only or shared by hardlinks)
+
+        hash = hashlib.sha256() if stats is not None and stats.digests is not None else None
+        for method in self._candidates(src_st, dst_dev, allow_hardlink):
+            try:
+                written = _copy(src, dst, hash) if method == 'copy' else __class__.methods[method](src, dst)
+            except OSError as e:
+                if method == 'copy':
+                    raise e
+                if e.errno in _unsupported_errors:
+                    self._mark_unsupported(method, src_st.st_dev, dst_dev)
+                continue  # other errors (e.g., EPERM for hardlinks) are related to the file, not the fs
+
+            if stats is not None:
+                stats.add(method, src_st.st_size, written)
+                if hash is not None:
+                    # regular copies are hashed on the fly, other methods do not pass the data through user space
+                    stats.add_digest(dst, hash.hexdigest() if method == 'copy' else compute_digest(dst))
+            return method
+
+        raise RuntimeError(f"No copy method was able to copy '{src}'.")  # should not happen (copy is the last)
@@ -0,0 +1,52 @@
+import os
+from loguru import logger
+from helpers.object_store import ObjectStore, compute_digest
+from helpers.serializable import Serializable
+
+
+class InputIndex(Serializable):
+    '''
+    Persistent index of hashed input files (path -> mtime, size, and digest), so unchanged files are not rehashed.
+    '''
+
+    def __init__(self, file: str | None = None):
+        super().__init__(file)
+        self.files = {}  # absolute path -> { mtime_ns, size, digest }
+
+
+class InputCache:
+    '''
+    Content-addressed cache of test inputs (e.g., large datasets). Each distinct input is stored once
+    as a read-only object, so it can be hardlinked into the boxes instead of being copied.
+    '''
+
+    def __init__(self, root: str, dir_mode: int = 0o770):
+        self.store = ObjectStore(f'{root}/objects', dir_mode)
+        self._index_file = f'{root}/index.json'
+        self._index = InputIndex(self._index_file)
+
+    def ingest(self, paths: list[str]) -> dict[str, tuple[str, str]]:
+        '''
+        Make sure given input files are stored in the cache. Files are rehashed only if their mtime or size changed.
+        Returns a dict path -> (digest, object path).
+        '''
+        self._index.open_serialization_file(exclusive=True)
+        if os.path.getsize(self._index_file) > 0:  # empty file has just been created
+            self._index.load_json(keep_open=True, exclusive=True)
+
+        res = {}
+        hashed = 0
+        try:
+            for path in paths:
+                st = os.stat(path)
+                record = self._index.files.get(os.path.abspath(path))
+                if record is None or record['mtime_ns'] != st.st_mtime_ns or record['size'] != st.st_size:
+                    record = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'digest': compute_digest(path)}
+                    self._index.files[os.path.abspath(path)] = record
+                    hashed += 1
+                res[path] = (record['digest'], self.store.add_copy(path, record['digest']))
+        finally:
+            self._index.save_json()
+
+        logger.debug(f"Input cache: {len(res)} inputs ready ({hashed} hashed).")
+        return res
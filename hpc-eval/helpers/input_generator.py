@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from helpers.build_cache import BuildCache
+from helpers.object_store import compute_digest
+
+
+class InputGenerator:
+    '''
+    Runs generators of test inputs (a command with parameters and a seed, the data are taken from its stdout).
+    Every distinct generator is executed once, the output is memoized in a size-bounded cache (keyed by a hash
+    of the command, the contents of files it refers to, the parameters, and the seed), so it is reused across
+    tests, solutions, and evaluations.
+    '''
+
+    def __init__(self, cache: BuildCache, workers: int = 4):
+        self.cache = cache
+        self.workers = max(1, workers)
+        self._keys = {}  # serialized generator -> key (executables are hashed once)
+
+    @staticmethod
+    def _resolve_command(command: list[str]) -> list[str]:
+        '''
+        Make arguments referring to existing files absolute (the generator is executed in a staging dir).
+        '''
+        return [os.path.abspath(arg) if os.path.isfile(arg) else arg for arg in command]
+
+    def get_key(self, generator: dict) -> str:
+        '''
+        Compute the cache key of a generator (contents of all files referred by the command are hashed).
+        '''
+        command = self._resolve_command(generator['command'])
+        data = json.dumps([command, generator.get('params', []), generator.get('seed', 0)])
+        if data not in self._keys:
+            file_hashes = [compute_digest(arg) if os.path.isfile(arg) else None for arg in command]
+            self._keys[data] = hashlib.sha256(json.dumps([file_hashes, data]).encode('utf-8')).hexdigest()
+        return self._keys[data]
+
+    def get_output_file(self, key: str) -> str:
+        return f'{self.cache.get_entry_dir(key)}/output'
+
+    def _generate(self, key: str, generator: dict) -> str:
+        staging = self.cache.get_staging_dir(key, str(os.getpid()))
+        os.makedirs(staging, exist_ok=True)
+        env = os.environ | {'SEED': str(generator.get('seed', 0))}
+        try:
+            with open(f'{staging}/output', 'wb') as fp:
+                command = self._resolve_command(generator['command']) + generator.get('params', [])
+                subprocess.run(command, stdout=fp, stderr=subprocess.PIPE, env=env, cwd=staging, check=True)
+            os.chmod(f'{staging}/output', 0o444)  # the output is hardlinked into the boxes
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.cache.discard(staging)
+            stderr = e.stderr.decode('utf-8', errors='replace').strip() if hasattr(e, 'stderr') else ''
+            raise RuntimeError(f"Input generator {generator['command']} failed: {e} {stderr}".strip())
+        return staging
+
+    def generate(self, generators: list[dict]) -> dict[str, str]:
+        '''
+        Make sure outputs of all given generators are cached (missing ones are generated in parallel).
+        The outputs stay pinned in the cache until the evaluation calls cache.unpin_all().
+        Returns a dict key -> path to the generated file.
+        '''
+        distinct = {self.get_key(generator): generator for generator in generators}
+        # the outputs are pinned, so generating the others cannot evict them (see BuildCache.unpin_all())
+        missing = {key: generator for key, generator in distinct.items() if self.cache.lookup(key, pin=True) is None}
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {key: executor.submit(self._generate, key, gen) for key, gen in missing.items()}
+                committed = set()
+                try:
+                    for key, future in futures.items():  # the cache index is updated sequentially
+                        self.cache.commit(key, future.result(), pin=True)  # re-raises the exception of a generator
+                        committed.add(key)
+                except Exception as e:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    for key, future in futures.items():  # outputs of the other generators are not committed
+                        if key not in committed and not future.cancelled() and future.exception() is None:
+                            self.cache.discard(future.result())
+                    raise e
+
+        res = {key: self.get_output_file(key) for key in distinct}
+        evicted = [key for key, file in res.items() if not os.path.exists(file)]
+        if evicted:
+            raise RuntimeError(f"{len(evicted)} generated inputs were evicted by a concurrent evaluation, "
+                               "the size limit of the generated inputs cache is too small.")
+        logger.debug(f"Generated inputs: {len(distinct)} ready ({len(missing)} generated).")
+        return res
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import shutil
+import stat
+
+_read_only_mode = 0o444
+_executable_mode = 0o555
+
+
+def compute_digest(path: str) -> str:
+    '''
+    Compute content hash (hex sha256 digest) of a file.
+    '''
+    with open(path, 'rb') as fp:
+        return hashlib.file_digest(fp, 'sha256').hexdigest()
+
+
+class ObjectStore:
+    '''
+    Content-addressed store of files. Every distinct content is stored once (under its digest) and the files
+    in the workspace are hardlinked to the stored objects. Objects are read-only (they are shared).
+    The store must reside on the same file system as the files being stored.
+    An object with no other hardlinks than the one in the store is not referenced and can be garbage-collected.
+    '''
+
+    def __init__(self, root: str, dir_mode: int = 0o770):
+        self.root = root
+        self.dir_mode = dir_mode
+
+    def get_object_path(self, digest: str, executable: bool = False) -> str:
+        '''
+        Return path to an object of given digest (executable files are stored separately since the mode is shared).
+        '''
+        suffix = '.x' if executable else ''
+        return f'{self.root}/{digest[:2]}/{digest[2:]}{suffix}'
+
+    def ingest(self, path: str, digest: str | None = None) -> bool:
+        '''
+        Replace given file with a hardlink to a stored object. If the object does not exist yet, the file itself
+        becomes the object. The digest is computed if not given.
+        Returns True if the content was already present in the store (the file was deduplicated).
+        '''
+        digest = digest or compute_digest(path)
+        st = os.stat(path)
+        executable = bool(st.st_mode & stat.S_IXUSR)
+        object = self.get_object_path(digest, executable)
+        os.makedirs(os.path.dirname(object), mode=self.dir_mode, exist_ok=True)
+
+        tmp_path = f'{path}.{digest[:16]}.tmp'
+        try:
+            os.link(object, tmp_path)
+        except FileNotFoundError:
+            # new content, the file itself becomes the object
+            if st.st_nlink > 1:  # the file is linked from elsewhere, the object must have its own inode
+                shutil.copy(path, tmp_path)
+                os.replace(tmp_path, path)
+            os.chmod(path, _executable_mode if executable else _read_only_mode)
+            try:
+                os.link(path, object)
+                return False
+            except FileExistsError:  # a concurrent process was faster
+                os.link(object, tmp_path)
+
+        os.replace(tmp_path, path)  # atomic replacement of the file with a link to existing object
+        return True
+
+    def add_copy(self, path: str, digest: str | None = None) -> str:
+        '''
+        Store a copy of given file (the file itself is left intact) unless the content is already present.
+        Returns path to the object.
+        '''
+        digest = digest or compute_digest(path)
+        executable = bool(os.stat(path).st_mode & stat.S_IXUSR)
+        object = self.get_object_path(digest, executable)
+        if os.path.exists(object):
+            return object
+
+        os.makedirs(os.path.dirname(object), mode=self.dir_mode, exist_ok=True)
+        tmp_path = f'{object}.{os.getpid()}.tmp'
+        shutil.copy(path, tmp_path)
+        os.chmod(tmp_path, _executable_mode if executable else _read_only_mode)
+        try:
+            os.link(tmp_path, object)
+        except FileExistsError:  # a concurrent process was faster
+            pass
+        os.unlink(tmp_path)
+        return object
+
+    def _objects(self):
+        '''
+        Generator that yields (path, stat) of all stored objects.
+        '''
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_file(follow_symlinks=False):
+                    yield (entry.path, entry.stat(follow_symlinks=False))
+
+    def gc(self) -> tuple[int, int]:
+        '''
+        Remove all objects which are not referenced (have no other hardlinks).
+        Returns a tuple (number of removed objects, bytes freed).
+        '''
+        removed = 0
+        freed = 0
+        for path, st in self._objects():
+            if st.st_nlink <= 1:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return (removed, freed)
+
+    def get_stats(self) -> dict:
+        '''
+        Compute deduplication statistics. Returns a dict with the number of objects, number of references
+        (hardlinks outside the store), physical bytes (stored once), logical bytes (as if every reference
+        was a separate copy), and the dedup ratio (logical / physical).
+        '''
+        stats = {'objects': 0, 'references': 0, 'physical_bytes': 0, 'logical_bytes': 0}
+        for _, st in self._objects():
+            stats['objects'] += 1
+            stats['references'] += st.st_nlink - 1
+            stats['physical_bytes'] += st.st_size
+            stats['logical_bytes'] += st.st_size * (st.st_nlink - 1)
+        stats['ratio'] = stats['logical_bytes'] / stats['physical_bytes'] if stats['physical_bytes'] else 1.0
+        return stats
@@ -0,0 +1,238 @@
+import asyncio
+import time
+import slurm.api as api
+from slurm.args import SlurmArgs
+from slurm.job import SlurmJob
+from slurm.slurm import Slurm
+
+
+async def _run(name: str, args: list, input: str | None = None) -> str:
+    '''
+    Asynchronous counterpart of api._run(), the command is executed without blocking the event loop.
+    '''
+    binary = api.get_binary(name)
+    if binary is None:
+        raise api.SlurmError(f"SLURM command '{name}' not found")
+
+    cmd = [binary, *args]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except OSError as e:
+        raise api.SlurmError(f"Unable to execute '{name}'", cmd, None, str(e))
+    stdout, stderr = await process.communicate(input.encode('utf-8') if input is not None else None)
+    if process.returncode != 0:
+        raise api.SlurmError(f"Command '{name}' failed with exit code {process.returncode}", cmd, process.returncode,
+                             stderr.decode('utf-8', errors='replace'))
+    return stdout.decode('utf-8')
+
+
+async def sbatch(args: SlurmArgs, commands: list) -> int:
+    '''
+    Submit a job script via sbatch, returns the job ID (see api.sbatch()).
+    '''
+    return api.parse_sbatch_output(await _run('sbatch', ['--parsable'], api.get_sbatch_script(args, commands)))
+
+
+async def scancel(job_id: int) -> None:
+    await _run('scancel', [str(job_id)])
+
+
+async def get_job_states(job_ids: list) -> dict:
+    '''
+    Return state information for given set of jobs (see api.get_job_states()).
+    '''
+    res = {}
+    for chunk in api.split_ids(job_ids):
+        output = await _run('sacct', ['-bnPX', '-j', ','.join(map(str, chunk))])
+        res |= api.parse_job_states(output, chunk)
+    return res
+
+
+async def get_queue_states(job_ids: list) -> dict:
+    '''
+    Return states of given jobs which are still in the queue (see api.get_queue_states()).
+    '''
+    res = {}
+    for chunk in api.split_ids(job_ids):
+        output = await _run('squeue', ['-h', '-r', '-o', '%i|%T', '-j', ','.join(map(str, chunk))])
+        res |= api.parse_queue_states(output, chunk)
+    return res
+
+
+async def poll_job_states(job_ids: list) -> dict:
+    '''
+    Return state information for given set of jobs, squeue is asked about active jobs and sacct
+    only about jobs that vanished from the queue (see api.poll_job_states()).
+    '''
+    if api.get_binary('squeue') is None:
+        return await get_job_states(job_ids)
+    try:
+        res = await get_queue_states(job_ids)
+    except api.SlurmError:  # squeue failed or its output is not understood, sacct knows all the jobs
+        return await get_job_states(job_ids)
+
+    finished = [id for id, state in res.items() if state is None]
+    if finished:
+        res |= await get_job_states(finished)
+    return res
+
+
+class AsyncSlurmJob(SlurmJob):
+    '''
+    Job of the AsyncSlurm interface, it can be awaited.
+    '''
+
+    def __init__(self, name: str | None = None, args: SlurmArgs | None = None, slurm=None):
+        super().__init__(name, args)
+        self._slurm = slurm
+
+    async def submit(self) -> int:
+        '''
+        Submit the job via sbatch (without blocking the event loop), returns the job ID.
+        '''
+        return await self._slurm.submit(self)
+
+    async def wait(self) -> str | None:
+        '''
+        Wait until the job terminates, returns its final SLURM state.
+        '''
+        return await self._slurm.wait(self)
+
+
+class AsyncSlurm(Slurm):
+    '''
+    Asynchronous counterpart of the Slurm interface for applications driven by asyncio.
+    SLURM commands are executed as subprocesses without blocking the event loop. A single poller task
+    (running only while some jobs are active) updates states of all active jobs by one batched query per
+    poll interval and wakes up all coroutines waiting for them (wait() and completions()).
+    '''
+
+    def __init__(self, default_args: SlurmArgs | dict | None = None, poll_interval: float = 5):
+        '''
+        The poll interval [s] is the delay between two consecutive state updates of the active jobs.
+        '''
+        super().__init__(default_args)
+        self._poll_interval = poll_interval
+        self._active = {}  # job ID -> job (submitted and not terminated yet)
+        self._waiters = {}  # job ID -> list of futures resolved when the job terminates
+        self._queues = []  # queues of running completions() iterators
+        self._poller = None
+
+    def create_job(self, name: str) -> AsyncSlurmJob:
+        if name in self.jobs:
+            raise Exception(f"Job with name {name} already exists.")
+        job = AsyncSlurmJob(name, self.default_args, self)
+        self.jobs[name] = job
+        return job
+
+    def _ensure_poller(self) -> None:
+        if self._active and (self._poller is None or self._poller.done()):
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self) -> None:
+        while self._active:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                await self.poll()
+            except api.SlurmError:
+                pass  # transient failure of sacct, the states are updated in the next round
+            except Exception as e:
+                self._fail(e)
+                return
+
+    def _fail(self, error: Exception) -> None:
+        '''
+        Pass an unexpected error of the poller to all waiting coroutines (so they do not hang).
+        '''
+        for futures in self._waiters.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+        self._waiters = {}
+        for queue in self._queues:
+            queue.put_nowait(error)
+
+    async def poll(self) -> list:
+        '''
+        Update states of all active jobs (by batched squeue/sacct calls) and notify the coroutines waiting for them.
+        Returns list of jobs that just terminated.
+        '''
+        if not self._active:
+            return []
+        states = await poll_job_states(list(self._active))
+        ts = time.time()
+        terminated = []
+        for id, state in states.items():
+            job = self._active.get(id)
+            if job is None:
+                continue
+            job._process_update(state, ts)
+            if job.running:
+                continue
+
+            del self._active[id]
+            terminated.append(job)
+            for future in self._waiters.pop(id, []):
+                if not future.done():
+                    future.set_result(job)
+            for queue in self._queues:
+                queue.put_nowait(job)
+        return terminated
+
+    async def submit(self, job: SlurmJob) -> int:
+        '''
+        Submit a job (created by create_job()) via sbatch, returns the job ID.
+        '''
+        if job.id is not None:
+            raise Exception("Sbatch job was already submitted.")
+
+        job._prepare_array()
+        job.id = await sbatch(job.args, job.get_script())
+        job.running = True
+        self._active[job.id] = job
+        self._ensure_poller()
+        return job.id
+
+    async def cancel(self, job: SlurmJob) -> bool:
+        '''
+        Try to cancel an active job by scancel (the termination is reported by the poller).
+        '''
+        if job.id is None:
+            raise Exception("The job has not been started yet.")
+        if job.id not in self._active:
+            return False  # cannot cancel anymore
+
+        await scancel(job.id)
+        return True
+
+    async def wait(self, job: SlurmJob) -> str | None:
+        '''
+        Wait until given job terminates, returns its final SLURM state (an unexpected error of the poller is raised).
+        '''
+        if job.id is None:
+            raise Exception("The job has not been started yet.")
+        if job.id in self._active:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(job.id, []).append(future)
+            self._ensure_poller()
+            await future
+        return job.state
+
+    async def completions(self):
+        '''
+        Asynchronously iterate over jobs as they terminate, until no submitted job is active
+        (jobs submitted during the iteration are included). An unexpected error of the poller is raised.
+        '''
+        queue = asyncio.Queue()
+        self._queues.append(queue)
+        try:
+            while self._active or not queue.empty():
+                self._ensure_poller()
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._queues.remove(queue)
@@ -1,24 +1,92 @@
 from slurm.args import SlurmArgs
+import os
+import shutil
 import subprocess
 
 
-def is_slurm_available() -> bool:
+class SlurmError(Exception):
     '''
-    Check whether a slurm client (CLI commands) is available.
+    Failure of a SLURM client command (or an unexpected output of the command).
     '''
-    result = subprocess.run('which sbatch', shell=True, stdout=subprocess.PIPE)
-    if result.returncode != 0:
-        return False
 
-    result = subprocess.run('which scancel', shell=True, stdout=subprocess.PIPE)
-    if result.returncode != 0:
-        return False
+    def __init__(self, message: str, command: list | None = None, returncode: int | None = None,
+                 stderr: str = ''):
+        super().__init__(f'{message}: {stderr.strip()}' if stderr.strip() else message)
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+_binaries = {}  # (name, PATH) -> resolved path or None
+
 
-    result = subprocess.run('which sacct', shell=True, stdout=subprocess.PIPE)
+def get_binary(name: str) -> str | None:
+    '''
+    Resolve path to a SLURM client binary (the result is cached for the current PATH).
+    '''
+    key = (name, os.environ.get('PATH'))
+    if key not in _binaries:
+        _binaries[key] = shutil.which(name)
+    return _binaries[key]
+
+
+def _run(name: str, args: list, input: str | None = None) -> str:
+    '''
+    Execute a SLURM client command directly (without a shell), returns its stdout.
+    SlurmError is raised if the command is missing or fails.
+    '''
+    binary = get_binary(name)
+    if binary is None:
+        raise SlurmError(f"SLURM command '{name}' not found")
+
+    cmd = [binary, *args]
+    try:
+        result = subprocess.run(cmd, input=input, capture_output=True, text=True)
+    except OSError as e:
+        raise SlurmError(f"Unable to execute '{name}'", cmd, None, str(e))
     if result.returncode != 0:
-        return False
+        raise SlurmError(f"Command '{name}' failed with exit code {result.returncode}", cmd, result.returncode,
+                         result.stderr)
+    return result.stdout
+
+
+def get_arg_limit() -> int:
+    '''
+    Return max. length of a single command line argument (list of job IDs passed to sacct).
+    It is limited by MAX_ARG_STRLEN (128 KiB on Linux) and by ARG_MAX minus the size of the environment.
+    '''
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (ValueError, OSError):
+        arg_max = 128 * 1024
+    env_size = sum([len(name) + len(value) + 2 for name, value in os.environ.items()])
+    return max(1024, min(128 * 1024, arg_max - env_size) - 4096)  # reserve for the other args
+
 
-    return True
+def split_ids(job_ids: list, limit: int | None = None) -> list[list]:
+    '''
+    Split job IDs into chunks whose comma-separated list fits into one command line argument
+    (limit is the max. length, see get_arg_limit()).
+    '''
+    limit = limit or get_arg_limit()
+    chunks, chunk, length = [], [], 0
+    for id in job_ids:
+        size = len(str(id)) + 1
+        if chunk and length + size > limit:
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(id)
+        length += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def is_slurm_available() -> bool:
+    '''
+    Check whether a slurm client (CLI commands) is available.
+    '''
+    return all([get_binary(name) is not None for name in ['sbatch', 'scancel', 'sacct']])
 
 
 def sbatch(args: SlurmArgs, commands: list) -> int:
@@ -27,49 +95,79 @@ def sbatch(args: SlurmArgs, commands: list) -> int:
     Slurm args and list of commands (a script) are used as input.
     Job id is returned.
     '''
+    # the script is passed on stdin (no shell is involved, so it is not expanded)
+    stdout = _run('sbatch', ['--parsable'], get_sbatch_script(args, commands))
+    return parse_sbatch_output(stdout)
+
 
-    # assemble the script
-    cmd = ['sbatch << EOF', '#!/bin/sh']
-    cmd.extend(args.generate_sbatch_directives())
-    cmd.extend(commands)
-    cmd.append('EOF')
+def get_sbatch_script(args: SlurmArgs, commands: list) -> str:
+    '''
+    Assemble the job script (sbatch directives followed by the commands).
+    '''
+    script = ['#!/bin/sh']
+    script.extend(args.generate_sbatch_directives())
+    script.extend(commands)
+    return '\n'.join(script) + '\n'
 
-    # execute and verify sbatch response
-    result = subprocess.run('\n'.join(cmd), shell=True, stdout=subprocess.PIPE)
-    assert result.returncode == 0, result.stderr
-    stdout = result.stdout.decode('utf-8')
-    assert 'Submitted batch job' in stdout, result.stderr
 
-    return int(stdout.split(' ')[3])  # return job id
+def parse_sbatch_output(stdout: str) -> int:
+    '''
+    Parse job ID from the output of `sbatch --parsable` (`<id>[;<cluster>]`).
+    '''
+    id = stdout.strip().split(';')[0]
+    if not id.isdigit():
+        raise SlurmError(f'Unexpected sbatch output "{stdout.strip()}"')
+    return int(id)
 
 
 def scancel(job_id: int) -> None:
-    result = subprocess.run(
-        f'scancel {job_id}', shell=True, stdout=subprocess.PIPE)
-    assert result.returncode == 0, result.stderr
+    _run('scancel', [str(job_id)])
 
 
-def get_job_states(job_ids: list) -> dict:
+def _parse_state(state: str, exit_code_and_signal: str) -> dict:
+    running = state in ['PENDING', 'RUNNING', 'REQUEUED', 'RESIZING', 'SUSPENDED']
+
+    res_state = {"state": state, "running": running}
+    if not running:
+        res_state["exit_code"], res_state["signal"] = exit_code_and_signal.split(':')
+        if res_state["exit_code"].isdigit():
+            res_state["exit_code"] = int(res_state["exit_code"])
+        if res_state["signal"].isdigit():
+            res_state["signal"] = int(res_state["signal"])
+    return res_state
+
+
+def _parse_task_range(tasks: str) -> list[int]:
     '''
-    Return state information for given set of jobs.
-    Return dict (key is job id), each value is dict containing
-    state, running, [exit_code], and [signal]
+    Parse array task specification like `[0-3,5,7-9%2]` into a list of task IDs (the limit is ignored).
     '''
-    # -b brief (staus+exit code), -n no header, -P parseable output
-    # -X only the main job (no steps), -j job id
-    cmd = f'sacct -bnPX -j {','.join(map(str, job_ids))}'
-    result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE)
-    assert result.returncode == 0, result.stderr
+    res = []
+    for part in tasks.strip('[]').split('%')[0].split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            res.extend(range(int(first), int(last) + 1))
+        elif part.isdigit():
+            res.append(int(part))
+    return res
+
 
+def parse_job_states(output: str, job_ids: list) -> dict:
+    '''
+    Parse output of `sacct -bnPX`. Returns the same structure as get_job_states().
+    Array tasks are reported as `<jobid>_<taskid>` lines, tasks which have not started yet
+    are reported together as `<jobid>_[<ranges>]`. States of the tasks are gathered in `tasks` dict
+    (task ID -> state) of the array job.
+    '''
     res = {id: None for id in job_ids}
-    output = result.stdout.decode('utf-8').strip().split('\n')
-    for line in output:
+    for line in output.strip().split('\n'):
         if not line:
             continue
 
         tokens = line.split('|')
-        assert len(tokens) == 3, f'Unexpected sacct output "{line}"'
+        if len(tokens) != 3:
+            raise SlurmError(f'Unexpected sacct output "{line}"')
         id, state, exit_code_and_signal = tokens
+        id, _, tasks = id.partition('_')
 
         # id needs to be converted to int
         if not id.isdigit():
@@ -79,18 +177,146 @@ def get_job_states(job_ids: list) -> dict:
         if id not in res:
             continue
 
-        running = state in ['PENDING', 'RUNNING', 'REQUEUED', 'RESIZING', 'SUSPENDED']
+        res_state = _parse_state(state, exit_code_and_signal)
+        if not tasks:
+            res[id] = res_state
+            continue
+
+        if res[id] is None:
+            res[id] = {"state": None, "running": False, "tasks": {}}
+        task_ids = [int(tasks)] if tasks.isdigit() else _parse_task_range(tasks)
+        for task_id in task_ids:
+            res[id]["tasks"][task_id] = res_state
+        if res_state["running"]:
+            res[id]["running"] = True
+
+    return res
+
+
+def get_job_states(job_ids: list) -> dict:
+    '''
+    Return state information for given set of jobs.
+    Return dict (key is job id), each value is dict containing
+    state, running, [exit_code], and [signal]; array jobs have also [tasks]
+    (task ID -> dict with the same structure).
+    '''
+    # -b brief (staus+exit code), -n no header, -P parseable output
+    # -X only the main job (no steps), -j job id
+    res = {}
+    for chunk in split_ids(job_ids):
+        output = _run('sacct', ['-bnPX', '-j', ','.join(map(str, chunk))])
+        res |= parse_job_states(output, chunk)
+    return res
+
+
+def parse_job_steps(output: str, job_ids: list) -> dict:
+    '''
+    Parse output of `sacct -nP -o JobID,JobName,State,ExitCode,ElapsedRaw` (without -X, so steps are listed).
+    Returns the same structure as get_job_steps().
+    '''
+    res = {id: {} for id in job_ids}
+    for line in output.strip().split('\n'):
+        if not line:
+            continue
+
+        tokens = line.split('|')
+        if len(tokens) != 5:
+            raise SlurmError(f'Unexpected sacct output "{line}"')
+        id, name, state, exit_code_and_signal, elapsed = tokens
+        id, _, step = id.partition('.')
+        id = id.partition('_')[0]
+        if not step.isdigit() or not id.isdigit() or int(id) not in res:
+            continue  # not a regular step (the main job, batch, or extern step)
+
+        res_state = _parse_state(state, exit_code_and_signal)
+        res_state["elapsed"] = int(elapsed) if elapsed.isdigit() else None
+        res[int(id)][name] = res_state
+
+    return res
+
+
+def get_job_steps(job_ids: list) -> dict:
+    '''
+    Return state information of steps (executed by srun) of given jobs.
+    Return dict (key is job id), each value is dict (key is step name) with
+    state, running, [exit_code], [signal], and elapsed (seconds).
+    '''
+    res = {}
+    for chunk in split_ids(job_ids):
+        output = _run('sacct', ['-nP', '-o', 'JobID,JobName,State,ExitCode,ElapsedRaw',
+                                '-j', ','.join(map(str, chunk))])
+        res |= parse_job_steps(output, chunk)
+    return res
 
-        res_state = {"state": state, "running": running}
-        if not running:
-            res_state["exit_code"], res_state["signal"] = exit_code_and_signal.split(':')
-            if res_state["exit_code"].isdigit():
-                res_state["exit_code"] = int(res_state["exit_code"])
-            if res_state["signal"].isdigit():
-                res_state["signal"] = int(res_state["signal"])
 
-        res[id] = res_state
+# states of jobs (tasks) still managed by slurmctld, i.e., listed by squeue and not terminated yet
+queue_states = ['PENDING', 'RUNNING', 'CONFIGURING', 'COMPLETING', 'SUSPENDED', 'REQUEUED', 'REQUEUE_HOLD',
+                'REQUEUE_FED', 'RESIZING', 'SIGNALING', 'STAGE_OUT', 'STOPPED']
+
+
+def parse_queue_states(output: str, job_ids: list) -> dict:
+    '''
+    Parse output of `squeue -h -r -o %i|%T`. Returns the same structure as get_job_states(), but only active jobs
+    (and tasks) are included, jobs not present in the queue (or already terminated) are None.
+    '''
+    res = {id: None for id in job_ids}
+    for line in output.strip().split('\n'):
+        if not line:
+            continue
+
+        tokens = line.strip().split('|')
+        if len(tokens) != 2:
+            raise SlurmError(f'Unexpected squeue output "{line}"')
+        id, state = tokens
+        id, _, tasks = id.partition('_')
+        state = state.split(' ')[0]
+        if not id.isdigit() or int(id) not in res or state not in queue_states:
+            continue
+        id = int(id)
+
+        res_state = {"state": state, "running": True}
+        if not tasks:
+            res[id] = res_state
+            continue
+
+        if res[id] is None:
+            res[id] = {"state": None, "running": True, "tasks": {}}
+        task_ids = [int(tasks)] if tasks.isdigit() else _parse_task_range(tasks)
+        for task_id in task_ids:
+            res[id]["tasks"][task_id] = res_state
+
+    return res
+
+
+def get_queue_states(job_ids: list) -> dict:
+    '''
+    Return states of given jobs which are still in the queue (see parse_queue_states()).
+    Squeue talks to slurmctld only, so it is much cheaper than sacct (which queries slurmdbd).
+    '''
+    res = {}
+    for chunk in split_ids(job_ids):
+        output = _run('squeue', ['-h', '-r', '-o', '%i|%T', '-j', ','.join(map(str, chunk))])
+        res |= parse_queue_states(output, chunk)
+    return res
+
+
+def poll_job_states(job_ids: list) -> dict:
+    '''
+    Return state information for given set of jobs (the same structure as get_job_states()).
+    Active jobs are resolved by squeue, a single batched sacct is used only for jobs that vanished
+    from the queue (to get their final states and exit codes). If squeue is not available or fails
+    (e.g., when none of the jobs is known to slurmctld anymore), sacct is used for all jobs.
+    '''
+    if get_binary('squeue') is None:
+        return get_job_states(job_ids)
+    try:
+        res = get_queue_states(job_ids)
+    except SlurmError:
+        return get_job_states(job_ids)
 
+    finished = [id for id, state in res.items() if state is None]
+    if finished:
+        res |= get_job_states(finished)
     return res
 
 
@@ -98,5 +324,5 @@ def get_job_state(job_id: int) -> dict | None:
     '''
     Shorthand for retrieving state of a single job.
     '''
-    res = get_job_states([job_id])
+    res = poll_job_states([job_id])
     return res.get(job_id)
@@ -6,10 +6,15 @@ class SlurmArgs(Serializable):
     # the sbatch subset of known args will be extended as needed
     known_args = {
         'account': str,
+        'array': str,
+        'chdir': str,
         'cpus-per-task': int,
+        'dependency': str,
         'exclusive': None,
         'gpus': int,
         'gres': str,
+        'job-name': str,
+        'kill-on-invalid-dep': str,
         'mem': str,
         'nodelist': str,
         'ntasks': int,
@@ -20,9 +25,13 @@ class SlurmArgs(Serializable):
     }
     short_args = {
         'A': 'account',
+        'a': 'array',
         'c': 'cpus-per-task',
         'e': 'error',
+        'd': 'dependency',
+        'D': 'chdir',
         'G': 'gpus',
+        'J': 'job-name',
         'n': 'ntasks',
         'w': 'nodelist',
         'o': 'output',
@@ -0,0 +1,237 @@
+import argparse
+import os
+import shlex
+import sys
+import time
+from slurm.fake.cluster import FakeCluster, active_states, format_ranges
+
+# short sbatch options (slurm.args is not imported, it would slow down the start of the commands)
+_short_options = {'A': 'account', 'a': 'array', 'c': 'cpus-per-task', 'D': 'chdir', 'd': 'dependency', 'e': 'error',
+                  'G': 'gpus', 'J': 'job-name', 'n': 'ntasks', 'o': 'output', 'p': 'partition', 't': 'time',
+                  'w': 'nodelist'}
+
+# sbatch options without a value
+_flag_options = ['exclusive', 'parsable', 'wait', 'hold']
+
+# fields of sacct output (-o) supported by the fake implementation
+_sacct_fields = ['JobID', 'JobIDRaw', 'JobName', 'State', 'ExitCode', 'ElapsedRaw']
+
+# headers of squeue columns (format codes)
+_squeue_headers = {'i': 'JOBID', 'A': 'ARRAY_JOB_ID', 'a': 'ARRAY_TASK_ID', 'j': 'NAME', 'T': 'STATE', 't': 'ST',
+                   'M': 'TIME', '%': '%'}
+
+# short states used by squeue (%t)
+_compact_states = {'PENDING': 'PD', 'RUNNING': 'R', 'COMPLETED': 'CD', 'FAILED': 'F', 'CANCELLED': 'CA',
+                   'NODE_FAIL': 'NF', 'TIMEOUT': 'TO'}
+
+
+def _parse_options(tokens: list[str]) -> tuple[dict, list[str]]:
+    '''
+    Parse sbatch options (`--name=value`, `--name value`, `--flag`, `-X value`) into a dict (long name -> value).
+    Returns the options and the remaining (positional) tokens.
+    '''
+    options = {}
+    tokens = list(tokens)
+    while tokens and tokens[0].startswith('-'):
+        token = tokens.pop(0)
+        if token.startswith('--'):
+            name, eq, value = token[2:].partition('=')
+        else:
+            name, value = _short_options.get(token[1:2], token[1:2]), token[2:]
+            eq = '=' if value else ''
+        if not eq:
+            value = tokens.pop(0) if name not in _flag_options and tokens else None
+        options[name] = value
+    return options, tokens
+
+
+def sbatch(argv: list[str], cluster: FakeCluster) -> int:
+    options, positional = _parse_options(argv)
+    if positional:
+        with open(positional[0]) as fp:
+            script = fp.read()
+    else:
+        script = sys.stdin.read()
+
+    directives = {}
+    for line in script.split('\n'):
+        if line.startswith('#SBATCH'):
+            directives.update(_parse_options(shlex.split(line[len('#SBATCH'):]))[0])
+    args = directives | options  # command line overrides the directives
+    parsable = 'parsable' in args
+    args.pop('parsable', None)
+
+    time.sleep(cluster.config['submit_latency'])
+    if cluster.inject_failure('submit'):
+        print('sbatch: error: Batch job submission failed: Socket timed out on send/recv operation', file=sys.stderr)
+        return 1
+
+    job_id = cluster.submit(args.get('job-name', 'sbatch'), args, script, os.getcwd())
+    print(job_id if parsable else f'Submitted batch job {job_id}')
+    return 0
+
+
+def scancel(argv: list[str], cluster: FakeCluster) -> int:
+    time.sleep(cluster.config['cancel_latency'])
+    cluster.cancel([ref for ref in argv if not ref.startswith('-')])
+    return 0
+
+
+def _get_job_ids(jobs: str | None) -> list[str] | None:
+    return [job.strip() for job in jobs.split(',') if job.strip()] if jobs else None
+
+
+def _get_rows(cluster: FakeCluster, job_ids: list[str] | None, active_only: bool, compact_pending: bool) -> list:
+    '''
+    Return rows (job ID string, job record, task record or None for compacted pending tasks) of given jobs.
+    Pending tasks of array jobs are compacted into one row (`<id>_[<ranges>]`) if compact_pending is set.
+    '''
+    rows = []
+    jobs = cluster.get_jobs()
+    now = time.time()
+    for job_id, job in sorted(jobs.items(), key=lambda item: int(item[0])):
+        if job_ids is not None and job_id not in job_ids:
+            continue
+        visible = [task for task in (job['tasks'] if job['tasks'] is not None else [job['task']])
+                   if not active_only or task['state'] in active_states
+                   or now - task['ended'] < cluster.config['min_job_age']]
+        if job['tasks'] is None:
+            rows.extend([(job_id, job, task) for task in visible])
+            continue
+
+        pending = [task for task in visible if task['state'] == 'PENDING']
+        rows.extend([(f"{job_id}_{task['id']}", job, task) for task in visible
+                     if task['state'] != 'PENDING' or not compact_pending])
+        if compact_pending and pending:
+            limit = f"%{job['array_limit']}" if job['array_limit'] else ''
+            rows.append((f"{job_id}_[{format_ranges([task['id'] for task in pending])}{limit}]", job, pending[0]))
+    return rows
+
+
+def _get_sacct_value(field: str, row: tuple) -> str:
+    id, job, task = row
+    if field == 'JobID':
+        return id
+    if field == 'JobIDRaw':
+        return id.partition('_')[0]
+    if field == 'JobName':
+        return job['name']
+    if field == 'State':
+        return task['state']
+    if field == 'ExitCode':
+        return f"{task['exit_code']}:{task['signal']}"
+    if field == 'ElapsedRaw':
+        end = task['ended'] or time.time()
+        return str(int(end - task['started'])) if task['started'] else '0'
+
+
+def sacct(argv: list[str], cluster: FakeCluster) -> int:
+    parser = argparse.ArgumentParser(prog='sacct')
+    parser.add_argument('-b', '--brief', action='store_true')
+    parser.add_argument('-n', '--noheader', action='store_true')
+    parser.add_argument('-P', '--parsable2', action='store_true')
+    parser.add_argument('-X', '--allocations', action='store_true')
+    parser.add_argument('-j', '--jobs', type=str)
+    parser.add_argument('-o', '--format', type=str)
+    args, _ = parser.parse_known_args(argv)
+
+    fields = ['JobID', 'State', 'ExitCode'] if args.brief or not args.format else args.format.split(',')
+    unknown = [field for field in fields if field not in _sacct_fields]
+    if unknown:
+        print(f"sacct: error: Invalid field requested: \"{unknown[0]}\"", file=sys.stderr)
+        return 1
+
+    time.sleep(cluster.config['query_latency'])
+    if cluster.inject_failure('query'):
+        print('sacct: error: slurmdbd: Connection refused', file=sys.stderr)
+        return 1
+
+    lines = [] if args.noheader else [fields]
+    for row in _get_rows(cluster, _get_job_ids(args.jobs), False, True):
+        lines.append([_get_sacct_value(field, row) for field in fields])
+        if not args.allocations and row[2]['started']:  # the batch step (steps are not listed with -X)
+            batch = (f'{row[0]}.batch', {'name': 'batch'}, row[2])
+            lines.append([_get_sacct_value(field, batch) for field in fields])
+
+    for line in lines:
+        print('|'.join(line) if args.parsable2 else ' '.join([value.ljust(12) for value in line]).rstrip())
+    return 0
+
+
+def _get_squeue_value(code: str, row: tuple) -> str:
+    id, job, task = row
+    values = {
+        'i': id,
+        'A': id.partition('_')[0],
+        'a': str(task['id']) if '_' in id and '[' not in id else 'N/A',
+        'j': job['name'],
+        'T': task['state'],
+        't': _compact_states.get(task['state'].split(' ')[0], task['state']),
+        'M': str(int((task['ended'] or time.time()) - task['started'])) if task['started'] else '0',
+        '%': '%',
+    }
+    return values.get(code, '')
+
+
+def squeue(argv: list[str], cluster: FakeCluster) -> int:
+    parser = argparse.ArgumentParser(prog='squeue', add_help=False)
+    parser.add_argument('-h', '--noheader', action='store_true')
+    parser.add_argument('-j', '--jobs', type=str)
+    parser.add_argument('-o', '--format', type=str, default='%.18i %.9j %.2t %.10M')
+    parser.add_argument('-r', '--array', action='store_true')
+    parser.add_argument('-t', '--states', type=str)
+    args, _ = parser.parse_known_args(argv)
+
+    time.sleep(cluster.config['query_latency'])
+    if cluster.inject_failure('query'):
+        print('squeue: error: Unable to contact slurm controller (connect failure)', file=sys.stderr)
+        return 1
+
+    rows = _get_rows(cluster, _get_job_ids(args.jobs), True, not args.array)
+    if args.states and args.states.upper() != 'ALL':
+        states = args.states.upper().split(',')
+        rows = [row for row in rows if row[2]['state'] in states or _get_squeue_value('t', row) in states]
+
+    def format(row: tuple | None) -> str:
+        res = []
+        tokens = args.format.split('%')
+        res.append(tokens[0])
+        for token in tokens[1:]:
+            width = ''
+            while token and (token[0].isdigit() or token[0] == '.'):
+                width, token = width + token[0], token[1:]
+            if not token:
+                continue
+            code, rest = token[0], token[1:]
+            value = _get_squeue_value(code, row) if row else _squeue_headers.get(code, '')
+            res.append(value.rjust(int(width.lstrip('.'))) if width.lstrip('.') else value)
+            res.append(rest)
+        return ''.join(res)
+
+    if not args.noheader:
+        print(format(None))
+    for row in rows:
+        print(format(row))
+    return 0
+
+
+commands = {'sbatch': sbatch, 'scancel': scancel, 'sacct': sacct, 'squeue': squeue}
+
+
+def main(argv: list[str]) -> int:
+    '''
+    Entry point of the fake SLURM commands (the first argument is the command name).
+    The state dir of the fake cluster is taken from FAKE_SLURM_DIR environment variable.
+    '''
+    if not argv or argv[0] not in commands:
+        print(f"Usage: python -m slurm.fake {{{','.join(commands)}}} [args]", file=sys.stderr)
+        return 2
+    dir = os.environ.get('FAKE_SLURM_DIR')
+    if not dir:
+        print(f"{argv[0]}: error: FAKE_SLURM_DIR is not set", file=sys.stderr)
+        return 1
+    return commands[argv[0]](argv[1:], FakeCluster(dir))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import slurm.api as api
+from slurm.args import SlurmArgs
+from slurm.fake.cluster import FakeCluster
+from slurm.slurm import Slurm
+
+bin_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+
+
+def activate(dir: str) -> None:
+    '''
+    Put the fake commands on PATH (of this process and its children) and point them to given state dir.
+    '''
+    os.environ['FAKE_SLURM_DIR'] = dir
+    os.environ['FAKE_SLURM_PYTHON'] = sys.executable
+    if not os.environ.get('PATH', '').startswith(bin_dir + os.pathsep):
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+
+
+def run_benchmark(dir: str, jobs: int, poll_interval: float = 0.1, max_parallel: int = 1, **config) -> dict:
+    '''
+    Submit given number of (simulated) jobs through the Slurm interface (by max_parallel concurrent sbatch calls)
+    and track them until they terminate. Remaining keyword args configure the fake cluster.
+    Returns the measured times and rates.
+    '''
+    activate(dir)
+    FakeCluster(dir).configure(**({'execute': False} | config))
+    slurm = Slurm({'output': '/dev/null'})
+
+    start = time.monotonic()
+    slurm.run_jobs([slurm.create_job(f'job{i}').add_command('true') for i in range(jobs)], max_parallel)
+    submitted = time.monotonic()
+
+    polls = 0
+    terminated = 0
+    while terminated < jobs:
+        time.sleep(poll_interval)
+        terminated += len(slurm.update_jobs())
+        polls += 1
+    finished = time.monotonic()
+
+    return {
+        'jobs': jobs,
+        'submit_s': submitted - start,
+        'submit_rate': jobs / max(submitted - start, 1e-9),
+        'track_s': finished - submitted,
+        'polls': polls,
+        'poll_s': (finished - submitted) / max(polls, 1),
+        'total_rate': jobs / max(finished - start, 1e-9),
+    }
+
+
+def _measure(calls: int, fn) -> float:
+    '''
+    Return average duration [ms] of one call of fn.
+    '''
+    start = time.monotonic()
+    for _ in range(calls):
+        fn()
+    return (time.monotonic() - start) * 1000 / max(calls, 1)
+
+
+def run_call_benchmark(dir: str, calls: int) -> dict:
+    '''
+    Compare per-call overhead of the argv-based SLURM calls (slurm.api) with the former shell-based invocation
+    (a heredoc passed to sbatch and sacct/which executed via `sh -c`). Returns average durations [ms].
+    '''
+    activate(dir)
+    FakeCluster(dir).configure(execute=False)
+    script = ['#!/bin/sh', *SlurmArgs({'output': '/dev/null'}).generate_sbatch_directives(), 'true']
+    job_id = api.sbatch(SlurmArgs({'output': '/dev/null'}), ['true'])
+
+    def shell(cmd: str) -> None:
+        subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, check=True)
+
+    api._binaries.clear()
+    return {
+        'calls': calls,
+        'shell_sbatch_ms': _measure(calls, lambda: shell('\n'.join(["sbatch << 'EOF'", *script, 'EOF']))),
+        'argv_sbatch_ms': _measure(calls, lambda: api.sbatch(SlurmArgs({'output': '/dev/null'}), ['true'])),
+        'shell_sacct_ms': _measure(calls, lambda: shell(f'sacct -bnPX -j {job_id}')),
+        'argv_sacct_ms': _measure(calls, lambda: api.get_job_states([job_id])),
+        'shell_which_ms': _measure(calls, lambda: subprocess.run('which sbatch', shell=True, stdout=subprocess.PIPE)),
+        'cached_which_ms': _measure(calls, lambda: api.get_binary('sbatch')),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure how many jobs per second hpc-eval can submit and track '
+                                     '(using the fake SLURM commands).')
+    parser.add_argument('--jobs', type=int, default=200, help='Number of submitted jobs.')
+    parser.add_argument('--poll-interval', type=float, default=0.1, help='Interval [s] between state updates.')
+    parser.add_argument('--run-time', type=float, default=0.0, help='Duration [s] of one simulated job.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency [s] added to every SLURM command.')
+    parser.add_argument('--max-running', type=int, default=0, help='Capacity of the fake cluster (0 = unlimited).')
+    parser.add_argument('--parallel', type=int, default=1, help='Number of concurrent sbatch invocations.')
+    parser.add_argument('--calls', type=int, default=0,
+                        help='Measure per-call overhead of shell-based vs. argv-based commands instead (N calls each).')
+    args = parser.parse_args()
+
+    if args.calls:
+        with tempfile.TemporaryDirectory() as dir:
+            res = run_call_benchmark(dir, args.calls)
+        for name in ['sbatch', 'sacct', 'which']:
+            base, fast = ('shell', 'cached') if name == 'which' else ('shell', 'argv')
+            print(f"{name}: {res[f'{base}_{name}_ms']:.3f}ms ({base}) vs. {res[f'{fast}_{name}_ms']:.3f}ms ({fast})")
+        return
+
+    with tempfile.TemporaryDirectory() as dir:
+        res = run_benchmark(dir, args.jobs, args.poll_interval, args.parallel, run_time=args.run_time,
+                            submit_latency=args.latency, query_latency=args.latency, max_running=args.max_running)
+    print(f"{res['jobs']} jobs submitted in {res['submit_s']:.3f}s ({res['submit_rate']:.1f} jobs/s), "
+          f"tracked in {res['track_s']:.3f}s by {res['polls']} polls ({res['poll_s'] * 1000:.1f}ms per poll), "
+          f"{res['total_rate']:.1f} jobs/s overall.")
+
+
+if __name__ == '__main__':
+    main()
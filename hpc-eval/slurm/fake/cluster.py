@@ -0,0 +1,297 @@
+import contextlib
+import fcntl
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import time
+
+# states in which the job (task) is still active (listed by squeue)
+active_states = ['PENDING', 'RUNNING']
+
+# behavior of the fake cluster (overridden by `config.json` in the state dir)
+default_config = {
+    'submit_latency': 0.0,  # [s] added to every sbatch call
+    'query_latency': 0.0,  # [s] added to every sacct and squeue call
+    'cancel_latency': 0.0,  # [s] added to every scancel call
+    'pending_time': 0.0,  # [s] a job stays pending at least this long after submission
+    'run_time': 0.0,  # [s] duration of a simulated job (when scripts are not executed)
+    'execute': True,  # whether job scripts are actually executed (otherwise they are only simulated)
+    'max_running': 0,  # capacity of the cluster (max. simultaneously running tasks, 0 = unlimited)
+    'min_job_age': 0.0,  # [s] how long a terminated job is still listed by squeue
+    'fail_rate': 0.0,  # probability of a node failure of a job (injected when the job starts)
+    'submit_fail_rate': 0.0,  # probability that sbatch fails
+    'query_fail_rate': 0.0,  # probability that sacct or squeue fails
+    'seed': 0,  # seed of the failure injection
+}
+
+
+class FakeCluster:
+    '''
+    Simulator of a small SLURM cluster used by the fake sbatch, sacct, scancel, and squeue commands.
+    There is no daemon, the state is advanced lazily (based on the current time) whenever a command is invoked.
+    The state dir holds the state file (guarded by flock), the configuration, and the job scripts and records.
+    Only the standard library is used, so the commands start quickly (their overhead should not skew benchmarks).
+    '''
+
+    def __init__(self, dir: str):
+        self.dir = os.path.abspath(dir)
+        self._config_file = f'{self.dir}/config.json'
+        self._state_file = f'{self.dir}/state.json'
+        self.config = dict(default_config)
+        if os.path.exists(self._config_file):
+            with open(self._config_file) as fp:
+                self.config |= json.load(fp)
+
+    def configure(self, **kwargs) -> None:
+        '''
+        Modify the configuration of the cluster (and save it).
+        '''
+        for name, value in kwargs.items():
+            if name not in default_config:
+                raise ValueError(f"Unknown fake cluster option '{name}'.")
+            self.config[name] = value
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self._config_file, 'w') as fp:
+            json.dump(self.config, fp)
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        '''
+        Lock the state file exclusively, load the state, and advance the simulation.
+        The (modified) state is saved when the context is left.
+        '''
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self._state_file, 'a+') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            fp.seek(0)
+            data = fp.read()
+            state = json.loads(data) if data else {'last_id': 0, 'jobs': {}}
+            self._advance(state)
+            yield state
+            fp.seek(0)
+            fp.truncate()
+            json.dump(state, fp)
+
+    def _get_rng(self, *parts) -> random.Random:
+        return random.Random(':'.join(map(str, [self.config['seed'], *parts])))
+
+    def inject_failure(self, operation: str) -> bool:
+        '''
+        Decide (randomly) whether given operation (submit or query) fails. The decisions are reproducible,
+        the n-th invocation of an operation is decided by the seed and n (counted in the state).
+        '''
+        rate = self.config['submit_fail_rate' if operation == 'submit' else 'query_fail_rate']
+        if rate <= 0:
+            return False
+        with self._locked_state() as state:
+            counters = state.setdefault('operations', {})
+            counters[operation] = counters.get(operation, 0) + 1
+            return self._get_rng(operation, counters[operation]).random() < rate
+
+    def _get_record_file(self, job_id: str, task_id: int | None, ext: str) -> str:
+        return f"{self.dir}/jobs/{job_id}{f'_{task_id}' if task_id is not None else ''}.{ext}"
+
+    @staticmethod
+    def _get_tasks(job: dict) -> list[tuple[int | None, dict]]:
+        return [(None, job['task'])] if job['tasks'] is None else list(enumerate(job['tasks']))
+
+    def submit(self, name: str, args: dict, script: str, cwd: str) -> int:
+        '''
+        Enqueue a new job (an array job, if the array arg is given) and return its ID.
+        '''
+        task_ids = None
+        limit = None
+        if 'array' in args:
+            spec, _, limit = str(args['array']).partition('%')
+            task_ids = parse_ranges(spec)
+            limit = int(limit) if limit else None
+
+        def create_task(task_id: int | None) -> dict:
+            rng = self._get_rng(job_id, task_id)
+            return {'id': task_id, 'state': 'PENDING', 'exit_code': 0, 'signal': 0, 'submitted': time.time(),
+                    'started': None, 'ended': None, 'pid': None, 'node_fail': rng.random() < self.config['fail_rate']}
+
+        with self._locked_state() as state:
+            state['last_id'] += 1
+            job_id = str(state['last_id'])
+            os.makedirs(f'{self.dir}/jobs', exist_ok=True)
+            with open(self._get_record_file(job_id, None, 'sh'), 'w') as fp:
+                fp.write(script)
+            state['jobs'][job_id] = {
+                'name': name, 'args': args, 'cwd': cwd, 'array_limit': limit,
+                'task': create_task(None) if task_ids is None else None,
+                'tasks': [create_task(task_id) for task_id in task_ids] if task_ids is not None else None,
+            }
+            self._advance(state)
+        return int(job_id)
+
+    def cancel(self, refs: list[str]) -> None:
+        '''
+        Cancel jobs (or individual array tasks given as `<id>_<task>`), running scripts are killed.
+        '''
+        with self._locked_state() as state:
+            for ref in refs:
+                job_id, _, task_id = ref.partition('_')
+                job = state['jobs'].get(job_id)
+                if job is None:
+                    continue
+                for _, task in self._get_tasks(job):
+                    if (not task_id or str(task['id']) == task_id) and task['state'] in active_states:
+                        if task['pid']:
+                            try:
+                                os.killpg(task['pid'], signal.SIGTERM)
+                            except ProcessLookupError:
+                                pass
+                        self._end(task, f'CANCELLED by {os.getuid()}', 0, signal.SIGTERM if task['started'] else 0)
+
+    def get_jobs(self) -> dict:
+        '''
+        Return current state of all jobs (advanced to the current time), job ID (str) -> job record.
+        '''
+        with self._locked_state() as state:
+            return state['jobs']
+
+    @staticmethod
+    def _end(task: dict, state: str, exit_code: int, signal: int = 0) -> None:
+        task |= {'state': state, 'exit_code': exit_code, 'signal': signal, 'ended': time.time(), 'pid': None}
+
+    def _get_dependency_state(self, state: dict, job: dict) -> str:
+        '''
+        Return 'ok' if all afterok dependencies completed, 'failed' if any of them failed, 'wait' otherwise.
+        '''
+        res = 'ok'
+        for ref in str(job['args'].get('dependency', 'afterok')).split(':')[1:]:
+            job_id, _, task_id = ref.partition('_')
+            dep = state['jobs'].get(job_id)
+            if dep is None:
+                return 'failed'
+            for _, task in self._get_tasks(dep):
+                if task_id and str(task['id']) != task_id:
+                    continue
+                if task['state'] in active_states:
+                    res = 'wait'
+                elif task['state'] != 'COMPLETED':
+                    return 'failed'
+        return res
+
+    def _start(self, job_id: str, job: dict, task: dict) -> None:
+        task |= {'state': 'RUNNING', 'started': time.time()}
+        if task['node_fail']:
+            self._end(task, 'NODE_FAIL', 0)
+            return
+        if not self.config['execute']:
+            return
+
+        def get_output(arg: str, default: str) -> str:
+            path = str(job['args'].get(arg, default))
+            path = path.replace('%A', job_id).replace('%a', str(task['id'])).replace('%j', job_id)
+            return os.path.join(job['cwd'], path)
+
+        output = get_output('output', 'slurm-%j.out' if task['id'] is None else 'slurm-%A_%a.out')
+        error = get_output('error', output)
+        rc = self._get_record_file(job_id, task['id'], 'rc')
+        redirect = f'> {shlex.quote(output)} 2>&1' if error == output \
+            else f'> {shlex.quote(output)} 2> {shlex.quote(error)}'
+        runner = f'sh {shlex.quote(self._get_record_file(job_id, None, "sh"))} {redirect}; ' \
+            f'echo $? > {shlex.quote(rc)}.tmp && mv {shlex.quote(rc)}.tmp {shlex.quote(rc)}'
+        env = os.environ | {'SLURM_JOB_ID': job_id, 'SLURM_JOB_NAME': job['name']}
+        if task['id'] is not None:
+            env |= {'SLURM_ARRAY_JOB_ID': job_id, 'SLURM_ARRAY_TASK_ID': str(task['id'])}
+        process = subprocess.Popen(['/bin/sh', '-c', runner], cwd=job['args'].get('chdir', job['cwd']), env=env,
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   start_new_session=True)
+        task['pid'] = process.pid
+
+    def _check_finished(self, job_id: str, task: dict) -> None:
+        if not self.config['execute']:
+            if time.time() >= task['started'] + self.config['run_time']:
+                self._end(task, 'COMPLETED', 0)
+            return
+
+        rc_file = self._get_record_file(job_id, task['id'], 'rc')
+        if os.path.exists(rc_file):
+            with open(rc_file) as fp:
+                rc = parse_exit_code(fp.read())
+            if rc > 128:  # terminated by a signal
+                self._end(task, 'FAILED', 0, rc - 128)
+            else:
+                self._end(task, 'COMPLETED' if rc == 0 else 'FAILED', rc)
+
+    def _advance(self, state: dict) -> None:
+        '''
+        Move the simulation to the current time (finish terminated tasks and start pending ones).
+        '''
+        running = 0
+        for job_id, job in state['jobs'].items():
+            for _, task in self._get_tasks(job):
+                if task['state'] == 'RUNNING':
+                    self._check_finished(job_id, task)
+                    running += 1 if task['state'] == 'RUNNING' else 0
+
+        now = time.time()
+        for job_id in sorted(state['jobs'], key=int):  # the oldest jobs are started first
+            job = state['jobs'][job_id]
+            tasks = [task for _, task in self._get_tasks(job)]
+            pending = [task for task in tasks if task['state'] == 'PENDING'
+                       and now >= task['submitted'] + self.config['pending_time']]
+            if not pending:
+                continue
+
+            dependency = self._get_dependency_state(state, job)
+            if dependency == 'failed':  # as if kill-on-invalid-dep was set
+                for task in pending:
+                    self._end(task, 'CANCELLED', 0)
+                continue
+            if dependency == 'wait':
+                continue
+
+            job_running = len([task for task in tasks if task['state'] == 'RUNNING'])
+            for task in pending:
+                if self.config['max_running'] and running >= self.config['max_running']:
+                    return
+                if job['array_limit'] and job_running >= job['array_limit']:
+                    break
+                self._start(job_id, job, task)
+                if task['state'] == 'RUNNING':
+                    running += 1
+                    job_running += 1
+
+
+def parse_ranges(spec: str) -> list[int]:
+    '''
+    Parse a list of ranges like `0-3,5,7-9` into a list of numbers.
+    '''
+    res = []
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            res.extend(range(int(first), int(last) + 1))
+        elif part.strip():
+            res.append(int(part))
+    return res
+
+
+def parse_exit_code(value: str) -> int:
+    '''
+    Parse exit code recorded by the job runner, an empty or garbled record counts as a failure (1).
+    '''
+    try:
+        return int(value.strip())
+    except ValueError:
+        return 1
+
+
+def format_ranges(numbers: list[int]) -> str:
+    '''
+    Inverse of parse_ranges(), consecutive numbers are collapsed into ranges.
+    '''
+    res = []
+    for number in sorted(numbers):
+        if res and res[-1][1] == number - 1:
+            res[-1][1] = number
+        else:
+            res.append([number, number])
+    return ','.join([f'{first}-{last}' if first != last else str(first) for first, last in res])
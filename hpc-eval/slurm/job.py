@@ -1,8 +1,10 @@
 from slurm.args import SlurmArgs
+from slurm.markers import get_marker_script
 import slurm.api as api
 from helpers.serializable import Serializable
 
 from typing import Self
+import os
 import time
 
 
@@ -17,6 +19,10 @@ class SlurmJob(Serializable):
         self.name = name
         self.args = SlurmArgs(args)
         self.commands = []
+        self.tasks = []  # command lists of individual array tasks (empty for regular jobs)
+        self.array_limit = None  # max. number of simultaneously running array tasks
+        self.marker = None  # file where the script writes its completion marker (None = no marker)
+        self.task_markers = []  # completion marker files of individual array tasks (None = no marker)
 
         # running/termination state
         self.id = None  # assigned by sbatch when the job is started
@@ -25,6 +31,7 @@ class SlurmJob(Serializable):
         self.last_update = None  # when the state was last read from SLURM
         self.exit_code = None  # exit code of the terminated sbatch script
         self.signal = None  # signal that terminted the sbatch script
+        self.task_states = []  # state dicts of individual array tasks (None = not known yet)
 
     def _process_update(self, result: dict | None, ts: int | None = None
                         ) -> None:
@@ -35,7 +42,12 @@ class SlurmJob(Serializable):
         if ts is None:
             ts = time.time()
 
-        if result is not None:
+        if result is not None and self.tasks and result.get('tasks') is not None:
+            for task_id, task_state in result['tasks'].items():
+                if task_id < len(self.task_states):
+                    self.task_states[task_id] = task_state
+            self._aggregate_task_states()
+        elif result is not None:
             # copy the resutl to internal properties
             for key in ['state', 'running', 'exit_code', 'signal']:
                 self.__dict__[key] = result.get(key)
@@ -44,6 +56,23 @@ class SlurmJob(Serializable):
 
         self.last_update = ts
 
+    def _aggregate_task_states(self) -> None:
+        '''
+        Derive state of the whole array job from the states of its tasks. The job is running until all tasks
+        terminate, then it is COMPLETED if all tasks completed (otherwise it takes the state of the first failed task).
+        '''
+        known = [state for state in self.task_states if state is not None]
+        self.running = len(known) < len(self.task_states) or any([state['running'] for state in known])
+        if self.running:
+            self.state = 'RUNNING' if any([state['state'] == 'RUNNING' for state in known]) else 'PENDING'
+            return
+
+        failed = [state for state in known if state['state'] != 'COMPLETED']
+        self.state = failed[0]['state'] if failed else 'COMPLETED'
+        exit_codes = [state.get('exit_code') for state in known if isinstance(state.get('exit_code'), int)]
+        self.exit_code = max(exit_codes) if exit_codes else None
+        self.signal = failed[0].get('signal') if failed else 0
+
     def _update_state(self, state_timeout: int | None = 5) -> bool:
         '''
         Use sacct tool to load current state of the job.
@@ -97,6 +126,77 @@ class SlurmJob(Serializable):
             self.commands.append(cmd)
         return self
 
+    def add_task(self, cmd: str | list) -> int:
+        '''
+        Add a task (one or more commands) turning the job into an array job.
+        Returns ID of the task (index in the array).
+        '''
+        self.tasks.append(cmd if type(cmd) is list else [cmd])
+        return len(self.tasks) - 1
+
+    def set_array_limit(self, limit: int | None) -> Self:
+        '''
+        Limit number of simultaneously running tasks of an array job (None = no limit).
+        '''
+        self.array_limit = limit
+        return self
+
+    def set_marker(self, file: str, task_id: int | None = None) -> Self:
+        '''
+        Let the script of the job (or of an array task) write a completion marker (exit code and timestamps)
+        into given file as its last step (see slurm.markers). A stale marker of a previous run is removed.
+        '''
+        if os.path.exists(file):
+            os.unlink(file)
+        if task_id is None:
+            self.marker = file
+        else:
+            self.task_markers.extend([None] * (task_id + 1 - len(self.task_markers)))
+            self.task_markers[task_id] = file
+        return self
+
+    def get_markers(self) -> list[tuple]:
+        '''
+        Return list of (marker file, task ID or None) of the job.
+        '''
+        res = [(self.marker, None)] if self.marker else []
+        res.extend([(file, task_id) for task_id, file in enumerate(self.task_markers) if file])
+        return res
+
+    def has_markers(self) -> bool:
+        '''
+        Whether the termination of the job is reported by completion markers (of the job or of all its tasks).
+        '''
+        if self.tasks:
+            return len(self.task_markers) >= len(self.tasks) and all(self.task_markers[:len(self.tasks)])
+        return self.marker is not None
+
+    def get_script(self) -> list:
+        '''
+        Return the commands of the job script. Array jobs get a table of tasks
+        indexed by the array task ID after the common commands.
+        '''
+        if not self.tasks:
+            return get_marker_script(self.commands, self.marker) if self.marker else self.commands
+
+        script = self.commands + ['case "$SLURM_ARRAY_TASK_ID" in']
+        for task_id, commands in enumerate(self.tasks):
+            marker = self.task_markers[task_id] if task_id < len(self.task_markers) else None
+            script.append(f'{task_id})')
+            script.extend(get_marker_script(commands, marker) if marker else commands)
+            script.append(';;')
+        script.extend(['*)', 'echo "Unknown array task $SLURM_ARRAY_TASK_ID" >&2', 'exit 1', ';;', 'esac'])
+        return script
+
+    def _prepare_array(self) -> None:
+        '''
+        Set the array argument and reset task states before submission of an array job.
+        '''
+        if self.tasks:
+            limit = f'%{self.array_limit}' if self.array_limit else ''
+            self.args.add_arg('array', f'0-{len(self.tasks) - 1}{limit}')
+            self.task_states = [None] * len(self.tasks)
+
     def run(self) -> int:
         '''
         Execute the job via sbatch and return the job ID.
@@ -104,7 +204,8 @@ class SlurmJob(Serializable):
         if self.id is not None:
             raise Exception("Sbatch job was already submitted.")
 
-        self.id = api.sbatch(self.args, self.commands)
+        self._prepare_array()
+        self.id = api.sbatch(self.args, self.get_script())
         self.running = True
         return self.id
 
@@ -142,6 +243,19 @@ class SlurmJob(Serializable):
         self._update_state(state_timeout)
         return self.state
 
+    def get_task_state(self, task_id: int) -> dict | None:
+        '''
+        Return the last known state of an array task (dict with state, running, exit_code, and signal).
+        '''
+        return self.task_states[task_id] if task_id < len(self.task_states) else None
+
+    def task_failed(self, task_id: int) -> bool:
+        '''
+        Checks whether an array task terminated unsuccessfully (the state is not refreshed).
+        '''
+        state = self.get_task_state(task_id)
+        return state is not None and not state['running'] and state['state'] != 'COMPLETED'
+
     def failed(self) -> bool:
         '''
         Checks whether the completion of the job was ok or not.
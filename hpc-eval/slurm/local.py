@@ -0,0 +1,352 @@
+import os
+import resource
+import signal
+import subprocess
+import time
+from slurm.args import SlurmArgs
+from slurm.job import SlurmJob
+from slurm.slurm import Slurm
+
+
+def parse_time_limit(value: str) -> int | None:
+    '''
+    Parse SLURM time limit (minutes, MM:SS, HH:MM:SS, D-HH, D-HH:MM, or D-HH:MM:SS) into seconds.
+    None is returned for unlimited time.
+    '''
+    value = str(value).strip()
+    if value.upper() in ['', 'UNLIMITED', 'INFINITE', '-1']:
+        return None
+
+    days = 0
+    if '-' in value:
+        days, value = value.split('-', 1)
+        hours, minutes, seconds = ([int(part) for part in value.split(':')] + [0, 0])[:3]
+        days = int(days)
+    else:
+        parts = [int(part) for part in value.split(':')]
+        if len(parts) == 1:
+            hours, minutes, seconds = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, minutes, seconds = 0, parts[0], parts[1]
+        else:
+            hours, minutes, seconds = parts[:3]
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def parse_memory(value: str) -> int:
+    '''
+    Parse SLURM memory specification (number with optional K, M, G, or T suffix, megabytes by default) into bytes.
+    '''
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    value = str(value).strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value) << 20
+
+
+def _apply_limits(pid: int, cpus: list[int], mem: int | None, cpu_time: int | None) -> None:
+    '''
+    Pin CPUs and set resource limits of a started process (no code is executed in the forked child,
+    which would not be safe in a multi-threaded parent).
+    '''
+    os.sched_setaffinity(pid, cpus)
+    if mem:
+        resource.prlimit(pid, resource.RLIMIT_AS, (mem, mem))
+    if cpu_time:
+        resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+
+
+def parse_count(value) -> int:
+    '''
+    Parse a count argument given as a number or a string (like '4' or '--cpus-per-task=4'), 1 is the default.
+    '''
+    try:
+        return max(1, int(str(value).rpartition('=')[2].strip()))
+    except ValueError:
+        return 1
+
+
+# the script waits until the limits are applied (the gate is opened by closing its stdin)
+_gate = 'read _gate || :'
+
+
+class LocalProcess:
+    '''
+    One running process of the local executor (a regular job or one task of an array job).
+    '''
+
+    def __init__(self, job: SlurmJob, task_id: int | None, process: subprocess.Popen, cpus: list[int],
+                 deadline: float | None):
+        self.job = job
+        self.task_id = task_id
+        self.process = process
+        self.cpus = cpus
+        self.deadline = deadline
+        self.killed_state = None  # TIMEOUT or CANCELLED if the process was killed by the executor
+
+
+class LocalJob(SlurmJob):
+    '''
+    Job executed by the LocalExecutor. It has the same interface as SlurmJob, the state is taken
+    from the executor instead of sacct. State queries only collect terminated processes, queued processes
+    are started by the executor (see LocalExecutor.update_jobs()).
+    '''
+
+    def __init__(self, name: str | None = None, args: SlurmArgs | None = None, executor=None):
+        super().__init__(name, args)
+        self._executor = executor
+
+    def _update_state(self, state_timeout: int | None = 5) -> bool:
+        if self.id is None or state_timeout is None:
+            return False
+        self._executor._reap()
+        return True
+
+    def run(self) -> int:
+        '''
+        Queue the job in the executor and return the job ID.
+        '''
+        if self.id is not None:
+            raise Exception("The job was already submitted.")
+
+        self._prepare_array()
+        self.id = self._executor.submit(self)
+        return self.id
+
+    def cancel(self) -> bool:
+        '''
+        Cancel a queued or running job (running processes are killed).
+        '''
+        if self.id is None:
+            raise Exception("The job has not been started yet.")
+        if not self.is_running():
+            return False
+
+        self._executor.cancel(self)
+        return True
+
+
+class LocalExecutor(Slurm):
+    '''
+    Drop-in replacement of the Slurm interface that executes job scripts on the local machine
+    by a bounded pool of processes. The time, mem, and cpus-per-task arguments are enforced by
+    rlimits (the time also by a wall-clock deadline) and the processes are pinned to dedicated CPUs.
+    Unlike SLURM cgroups, the rlimits apply to each process of the job script separately (not to the job total).
+    Dependencies (afterok) and array jobs (including the limit of simultaneously running tasks) are supported.
+    The processes are started and reaped when the states are updated (see update_jobs()).
+    '''
+
+    def __init__(self, default_args: SlurmArgs | dict | None = None, workers: int = 0):
+        '''
+        The workers is the max. number of simultaneously running processes (0 = number of available CPUs).
+        '''
+        super().__init__(default_args)
+        self._cpus = sorted(os.sched_getaffinity(0))
+        self._free_cpus = list(self._cpus)
+        self._workers = workers or len(self._cpus)
+        self._queue = []  # (job, task_id) waiting for start
+        self._running = []  # LocalProcess instances
+        self._terminated = []  # jobs terminated since the last update_jobs()
+        self._jobs_by_id = {}
+        self._last_id = 0
+
+    def create_job(self, name: str) -> LocalJob:
+        if name in self.jobs:
+            raise Exception(f"Job with name {name} already exists.")
+        job = LocalJob(name, self.default_args, self)
+        self.jobs[name] = job
+        return job
+
+    def get_job_by_id(self, id: int) -> LocalJob | None:
+        return self._jobs_by_id.get(id)
+
+    def _set_state(self, job: LocalJob, task_id: int | None, state: dict) -> None:
+        was_running = job.running
+        job._process_update({'tasks': {task_id: state}} if task_id is not None else state)
+        if was_running and not job.running:
+            self._terminated.append(job)
+
+    def submit(self, job: LocalJob) -> int:
+        '''
+        Enqueue all processes of the job (one per array task), returns the job ID.
+        '''
+        self._last_id += 1
+        self._jobs_by_id[self._last_id] = job
+        job.id = self._last_id
+        job.running = True
+        job.state = 'PENDING'
+        self._queue.extend([(job, task_id) for task_id in range(len(job.tasks))] if job.tasks else [(job, None)])
+        self._polling.update(True)
+        self.schedule()
+        return job.id
+
+    def watch_markers(self, scan_interval: float = 30, use_inotify: bool = True) -> None:
+        '''
+        Markers are not watched, terminations are known right away when the processes are reaped
+        (the job scripts still write their markers).
+        '''
+        pass
+
+    def run_jobs(self, jobs: list[SlurmJob], max_parallel: int = 1, submit_rate: float = 0, retries: int = 3,
+                 retry_delay: float = 1.0) -> dict:
+        '''
+        Enqueue multiple jobs, the submit rate and retries are honoured like in Slurm.run_jobs(). The jobs are
+        always enqueued sequentially (max_parallel is only an upper bound), the queue is not thread-safe.
+        '''
+        return super().run_jobs(jobs, 1, submit_rate, retries, retry_delay)
+
+    def cancel(self, job: LocalJob) -> None:
+        '''
+        Remove queued processes of the job and kill the running ones.
+        '''
+        cancelled = {'state': 'CANCELLED', 'running': False, 'exit_code': 0, 'signal': 0}
+        for entry in [entry for entry in self._queue if entry[0] is job]:
+            self._queue.remove(entry)
+            self._set_state(job, entry[1], cancelled)
+        for process in self._running:
+            if process.job is job:
+                self._kill(process, 'CANCELLED')
+        self.schedule()
+
+    def _kill(self, process: LocalProcess, state: str) -> None:
+        process.killed_state = state
+        try:
+            os.killpg(process.process.pid, signal.SIGKILL)  # the whole process group (session) of the script
+        except ProcessLookupError:
+            pass
+
+    def _get_dependency_state(self, job: LocalJob) -> str:
+        '''
+        Return 'ok' if all dependencies completed, 'failed' if any of them failed, 'wait' otherwise.
+        '''
+        if not job.args.has_arg('dependency'):
+            return 'ok'
+
+        res = 'ok'
+        for ref in job.args.get_arg_value('dependency').split(':')[1:]:
+            id, _, task = ref.partition('_')
+            dep = self._jobs_by_id.get(int(id))
+            if dep is None:
+                return 'failed'  # invalid dependency
+            state = dep.get_task_state(int(task)) if task else {'state': dep.state, 'running': dep.running}
+            if state is None or state['running']:
+                res = 'wait'
+            elif state['state'] != 'COMPLETED':
+                return 'failed'
+        return res
+
+    def _get_cpu_count(self, job: LocalJob) -> int:
+        ntasks = parse_count(job.args.get_arg_value('ntasks')) if job.args.has_arg('ntasks') else 1
+        cpus = parse_count(job.args.get_arg_value('cpus-per-task')) if job.args.has_arg('cpus-per-task') else 1
+        return min(ntasks * cpus, len(self._cpus))
+
+    def _get_output(self, job: LocalJob, task_id: int | None, arg: str, default: str) -> str:
+        path = job.args.get_arg_value(arg) if job.args.has_arg(arg) else default
+        return path.replace('%A', str(job.id)).replace('%j', str(job.id)).replace('%a', str(task_id))
+
+    def _start(self, job: LocalJob, task_id: int | None, cpus: list[int]) -> None:
+        env = os.environ | {'SLURM_CPUS_PER_TASK': str(len(cpus))}
+        if task_id is not None:
+            env['SLURM_ARRAY_TASK_ID'] = str(task_id)
+        time_limit = parse_time_limit(job.args.get_arg_value('time')) if job.args.has_arg('time') else None
+        # RLIMIT_AS is per process, so a job script running several processes may use more memory in total
+        mem = parse_memory(job.args.get_arg_value('mem')) if job.args.has_arg('mem') else None
+        output = self._get_output(job, task_id, 'output', '/dev/null')
+        error = self._get_output(job, task_id, 'error', output)
+        cwd = job.args.get_arg_value('chdir') if job.args.has_arg('chdir') else None
+
+        stdout = open(output, 'ab')
+        stderr = open(error, 'ab') if error != output else stdout
+        try:
+            process = subprocess.Popen(
+                ['/bin/sh', '-c', '\n'.join([_gate, *job.get_script()])], stdin=subprocess.PIPE, stdout=stdout,
+                stderr=stderr, cwd=cwd, env=env, start_new_session=True)
+        finally:
+            stdout.close()
+            stderr.close()
+        try:
+            _apply_limits(process.pid, cpus, mem, time_limit * len(cpus) if time_limit else None)
+        except OSError as e:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            raise e
+        finally:
+            process.stdin.close()  # the script continues (the job has no input, like with /dev/null)
+        deadline = time.monotonic() + time_limit if time_limit else None
+        self._running.append(LocalProcess(job, task_id, process, cpus, deadline))
+        self._set_state(job, task_id, {'state': 'RUNNING', 'running': True})
+
+    def _reap(self) -> None:
+        '''
+        Collect terminated processes and kill the ones that exceeded their time limit.
+        '''
+        now = time.monotonic()
+        for process in list(self._running):
+            if process.process.poll() is None:
+                if process.deadline is not None and now > process.deadline and process.killed_state is None:
+                    self._kill(process, 'TIMEOUT')
+                continue
+
+            self._running.remove(process)
+            self._free_cpus.extend(process.cpus)
+            rc = process.process.returncode
+            if process.killed_state:
+                state = {'state': process.killed_state, 'running': False, 'exit_code': 0, 'signal': signal.SIGKILL}
+            elif rc < 0:  # terminated by a signal (e.g., SIGXCPU when the CPU time limit is exceeded)
+                state = {'state': 'FAILED', 'running': False, 'exit_code': 0, 'signal': -rc}
+            else:
+                state = {'state': 'COMPLETED' if rc == 0 else 'FAILED', 'running': False, 'exit_code': rc,
+                         'signal': 0}
+            self._set_state(process.job, process.task_id, state)
+
+    def schedule(self) -> None:
+        '''
+        Reap terminated processes and start queued ones (in the order of submission) while there are free
+        workers and CPUs. Jobs with a failed dependency are cancelled.
+        '''
+        self._reap()
+        for job, task_id in list(self._queue):
+            if len(self._running) >= self._workers:
+                break
+
+            dependency = self._get_dependency_state(job)
+            if dependency == 'failed':
+                self._queue.remove((job, task_id))
+                self._set_state(job, task_id, {'state': 'CANCELLED', 'running': False, 'exit_code': 0, 'signal': 0})
+                continue
+            if dependency == 'wait':
+                continue
+            if job.array_limit and len([p for p in self._running if p.job is job]) >= job.array_limit:
+                continue
+
+            count = self._get_cpu_count(job)
+            if len(self._free_cpus) < count:
+                break  # keep the order, the job waits for CPUs
+            cpus, self._free_cpus = self._free_cpus[:count], self._free_cpus[count:]
+            self._queue.remove((job, task_id))
+            try:
+                self._start(job, task_id, cpus)
+            except OSError:
+                self._free_cpus.extend(cpus)
+                self._set_state(job, task_id, {'state': 'FAILED', 'running': False, 'exit_code': 1, 'signal': 0})
+
+    def update_jobs(self) -> list:
+        '''
+        Advance the execution and return jobs that terminated since the last call.
+        '''
+        self.schedule()
+        terminated, self._terminated = self._terminated, []
+        self._polling.update(bool(terminated))
+        return terminated
+
+    def get_job_steps(self, job: SlurmJob) -> dict:
+        return {}  # no accounting, steps are resolved from the records in job dirs
+
+    def wait(self, poll_interval: float = 0.05) -> None:
+        '''
+        Block until all submitted jobs terminate.
+        '''
+        self.schedule()
+        while self._queue or self._running:
+            time.sleep(poll_interval)
+            self.schedule()
@@ -0,0 +1,197 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import shlex
+import struct
+import time
+
+# inotify constants (see inotify(7))
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_event = struct.Struct('iIII')  # wd, mask, cookie, len (followed by the name)
+
+
+def get_marker_script(commands: list, file: str) -> list[str]:
+    '''
+    Wrap commands (executed in a subshell) so that a completion marker (exit code and timestamps)
+    is written into given file when they terminate. The marker is written atomically (by rename).
+    '''
+    file = shlex.quote(file)
+    return [
+        '_marker_started=$(date +%s)',
+        '(',
+        *commands,
+        ')',
+        '_marker_rc=$?',
+        'printf \'{"exit_code": %d, "started": %s, "finished": %s}\\n\' "$_marker_rc" "$_marker_started" '
+        f'"$(date +%s)" > {file}.tmp && mv -f {file}.tmp {file}',
+        'exit $_marker_rc',
+    ]
+
+
+def read_marker(file: str) -> dict | None:
+    '''
+    Read a completion marker, returns a state dict (like api.get_job_states()) extended with started and
+    finished timestamps, or None if the marker does not exist (yet). The exit code is kept as reported by
+    the shell, the signal is only derived from it (codes above 128 mean the commands were killed by a signal).
+    '''
+    try:
+        with open(file) as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+    exit_code = data.get('exit_code')
+    if not isinstance(exit_code, int):
+        return None
+    state = 'COMPLETED' if exit_code == 0 else 'FAILED'
+    signal = exit_code - 128 if exit_code > 128 else 0
+    return {'state': state, 'running': False, 'exit_code': exit_code, 'signal': signal,
+            'started': data.get('started'), 'finished': data.get('finished')}
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class CompletionWatcher:
+    '''
+    Watches completion markers of jobs. Directories holding the markers are watched by inotify (via libc), so
+    the markers are collected as soon as they are written. Inotify does not report changes made by other hosts
+    on network filesystems, so all pending markers are also checked periodically (every scan_interval seconds).
+    If inotify is not available (or a dir cannot be watched), the markers are checked on every collect().
+    '''
+
+    def __init__(self, scan_interval: float = 30, use_inotify: bool = True):
+        self.scan_interval = scan_interval
+        self._pending = {}  # marker file -> key
+        self._dirs = {}  # watched dir -> watch descriptor
+        self._wds = {}  # watch descriptor -> dir
+        self._counts = {}  # dir -> number of pending markers in it
+        self._ready = set()  # marker files to be checked by the next collect()
+        self._unwatched = set()  # marker files in dirs that could not be watched
+        self._last_scan = time.monotonic()
+        self._libc = _load_libc() if use_inotify else None
+        self._fd = None
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            self._fd = fd if fd >= 0 else None
+
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def add(self, file: str, key) -> None:
+        '''
+        Start watching a marker file, the key is returned by collect() together with the marker.
+        '''
+        file = os.path.abspath(file)
+        if file in self._pending:
+            self.remove(file)
+        self._pending[file] = key
+        self._ready.add(file)  # the marker might have been written before the watch was set up
+        dir = os.path.dirname(file)
+        self._counts[dir] = self._counts.get(dir, 0) + 1
+        if self._fd is None:
+            self._unwatched.add(file)
+        elif dir not in self._dirs:
+            wd = self._libc.inotify_add_watch(self._fd, dir.encode(), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+            if wd < 0:
+                self._unwatched.add(file)
+            else:
+                self._dirs[dir] = wd
+                self._wds[wd] = dir
+
+    def remove(self, file: str) -> None:
+        '''
+        Stop watching a marker file.
+        '''
+        file = os.path.abspath(file)
+        if file not in self._pending:
+            return
+        del self._pending[file]
+        self._ready.discard(file)
+        self._unwatched.discard(file)
+        dir = os.path.dirname(file)
+        self._counts[dir] -= 1
+        if self._counts[dir] == 0:
+            del self._counts[dir]
+        if dir in self._dirs and dir not in self._counts:
+            wd = self._dirs.pop(dir)
+            self._wds.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _read_events(self) -> None:
+        while self._fd is not None:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset + _event.size <= len(data):
+                wd, mask, _, length = _event.unpack_from(data, offset)
+                name = data[offset + _event.size:offset + _event.size + length].rstrip(b'\0').decode()
+                offset += _event.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    self._ready.update(self._pending)  # events were lost
+                elif mask & _IN_IGNORED:
+                    dir = self._wds.pop(wd, None)  # the dir was removed (or unmounted)
+                    self._dirs.pop(dir, None)
+                    self._unwatched.update([file for file in self._pending if os.path.dirname(file) == dir])
+                elif wd in self._wds and f'{self._wds[wd]}/{name}' in self._pending:
+                    self._ready.add(f'{self._wds[wd]}/{name}')
+
+    def wait(self, timeout: float) -> None:
+        '''
+        Sleep for given time [s], return earlier if a marker appears (only when inotify is used).
+        '''
+        if self._fd is None:
+            if not self._ready:
+                time.sleep(timeout)
+            return
+
+        deadline = time.monotonic() + timeout
+        while not self._ready:  # events of other files in the watched dirs (e.g., logs) are ignored
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if readable:
+                self._read_events()
+
+    def collect(self) -> list[tuple]:
+        '''
+        Return list of (key, marker state) of markers written since the last call, they are no longer watched.
+        '''
+        self._read_events()
+        if time.monotonic() - self._last_scan >= self.scan_interval:
+            self._ready.update(self._pending)
+            self._last_scan = time.monotonic()
+        self._ready.update(self._unwatched)
+
+        res = []
+        for file in list(self._ready):
+            state = read_marker(file)
+            if state is not None:
+                res.append((self._pending[file], state))
+                self.remove(file)
+        self._ready.clear()
+        return res
+
+    def close(self) -> None:
+        '''
+        Release the inotify descriptor (the pending markers are still checked by collect()).
+        '''
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._dirs, self._wds = {}, {}
+            self._unwatched.update(self._pending)
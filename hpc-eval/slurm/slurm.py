@@ -1,9 +1,16 @@
 from slurm.job import SlurmJob
 from slurm.args import SlurmArgs
+from slurm.markers import CompletionWatcher
+from slurm.tracker import AdaptivePolling, JobTracker
 import slurm.api as api
 from helpers.serializable import Serializable
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 
+# stderr messages of sbatch failures worth retrying (the controller is temporarily overloaded)
+transient_errors = ['Socket timed out', 'Resource temporarily unavailable']
+
 
 class Slurm(Serializable):
     '''
@@ -15,6 +22,10 @@ class Slurm(Serializable):
         super().__init__()
         self.jobs = {}
         self.default_args = SlurmArgs(default_args)
+        self._tracker = JobTracker()
+        self._polling = AdaptivePolling(1, 30)
+        self._watcher = None  # CompletionWatcher of job markers (None = the markers are not watched)
+        self._last_verify = 0.0  # when jobs with markers were last verified by SLURM
 
     def create_job(self, name: str) -> SlurmJob:
         '''
@@ -22,8 +33,9 @@ class Slurm(Serializable):
         '''
         if name in self.jobs:
             raise Exception(f"Job with name {name} already exists.")
-        job = SlurmJob(name)
+        job = SlurmJob(name, self.default_args)
         self.jobs[name] = job
+        self._tracker.add(job)
         return job
 
     def get_job(self, name: str) -> SlurmJob | None:
@@ -32,28 +44,154 @@ class Slurm(Serializable):
         '''
         return self.jobs.get(name, None)
 
+    def run_jobs(self, jobs: list[SlurmJob], max_parallel: int = 1, submit_rate: float = 0, retries: int = 3,
+                 retry_delay: float = 1.0) -> dict:
+        '''
+        Submit multiple jobs concurrently (by max_parallel threads). The submit rate [jobs/s] limits
+        how fast sbatch is invoked (0 = unlimited). Submissions failing on transient errors are retried
+        (at most `retries` times, the delay doubles after each attempt).
+        Returns a dict job name -> job ID, or the exception if the submission failed.
+        '''
+        lock = threading.Lock()
+        next_slot = [time.monotonic()]
+
+        def wait_for_slot() -> None:
+            if not submit_rate:
+                return
+            with lock:
+                slot = max(next_slot[0], time.monotonic())
+                next_slot[0] = slot + 1.0 / submit_rate
+            time.sleep(max(0.0, slot - time.monotonic()))
+
+        def submit(job: SlurmJob) -> int | Exception:
+            delay = retry_delay
+            for attempt in range(retries + 1):
+                wait_for_slot()
+                try:
+                    return job.run()
+                except api.SlurmError as e:
+                    if attempt == retries or not any([msg in e.stderr for msg in transient_errors]):
+                        return e
+                except Exception as e:
+                    return e
+                time.sleep(delay)
+                delay *= 2
+
+        if max_parallel <= 1 or len(jobs) <= 1:
+            return {job.get_name(): submit(job) for job in jobs}
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(jobs))) as executor:
+            results = list(executor.map(submit, jobs))
+        return {job.get_name(): result for job, result in zip(jobs, results)}
+
+    def get_job_by_id(self, id: int) -> SlurmJob | None:
+        '''
+        Return a submitted job by its SLURM ID.
+        '''
+        self._tracker.sync(self.jobs)
+        return self._tracker.by_id.get(id)
+
+    def set_polling(self, min_interval: float, max_interval: float, backoff: float = 2.0) -> None:
+        '''
+        Configure the adaptive poll interval (see get_poll_interval()).
+        '''
+        self._polling = AdaptivePolling(min_interval, max_interval, backoff)
+
+    def get_poll_interval(self) -> float:
+        '''
+        Return recommended delay [s] before the next update_jobs(). It is short while jobs are being
+        submitted or terminating, and it backs off while the queue is quiet.
+        '''
+        return self._polling.interval
+
+    def watch_markers(self, scan_interval: float = 30, use_inotify: bool = True) -> None:
+        '''
+        Learn about job terminations from completion markers (see SlurmJob.set_marker()) instead of polling SLURM.
+        The markers are watched by inotify and scanned every scan_interval seconds (on every update if inotify
+        is not available). Jobs with markers are verified by SLURM only once per scan interval
+        (to detect jobs killed before they could write their markers).
+        '''
+        self._watcher = CompletionWatcher(scan_interval, use_inotify)
+        self._last_verify = time.monotonic()
+
+    def close(self) -> None:
+        '''
+        Stop watching the completion markers (releases the inotify descriptor).
+        '''
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+    def sleep(self, timeout: float) -> None:
+        '''
+        Wait for given time [s] before the next update_jobs(). If the markers are watched by inotify,
+        it returns as soon as a marker is written.
+        '''
+        if self._watcher is not None:
+            self._watcher.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def _collect_markers(self, submitted: list) -> list:
+        '''
+        Start watching markers of newly submitted jobs and process the markers written since the last call.
+        Returns list of jobs that just terminated.
+        '''
+        for job in submitted:
+            for file, task_id in job.get_markers():
+                self._watcher.add(file, (job.get_id(), task_id))
+
+        states = {}
+        for (id, task_id), state in self._watcher.collect():
+            if task_id is None:
+                states[id] = state
+            else:
+                states.setdefault(id, {'state': None, 'running': False, 'tasks': {}})['tasks'][task_id] = state
+        return self._tracker.process(states, time.time())
+
     def update_jobs(self) -> list:
         '''
         Perform a collective update of all running jobs (more efficient).
+        Only the running jobs are queried, by squeue (sacct only for jobs that left the queue).
+        Jobs reporting their termination by watched markers are queried only once per scan interval.
         Return list of SlurmJobs that just turned into a non-running state.
         '''
-        running = {job.get_id(): job for job in self.jobs.values()
-                   if job.running}
-        if not running:
-            return []
-        ids = [job.get_id() for job in running.values()]
+        submitted = self._tracker.sync(self.jobs)
+        terminated = self._collect_markers(submitted) if self._watcher is not None else []
 
-        states = api.get_job_states(ids)
-        ts = time.time()
-        for id, state in states.items():
-            self.jobs[id]._process_update(state, ts)
+        running = list(self._tracker.running.values())
+        if self._watcher is not None:
+            if time.monotonic() - self._last_verify >= self._watcher.scan_interval:
+                self._last_verify = time.monotonic()
+            else:
+                running = [job for job in running if not job.has_markers()]
+        if running:
+            states = api.poll_job_states([job.get_id() for job in running])
+            terminated.extend(self._tracker.process(states, time.time()))
 
-        # return jobs that just terminated
-        return [job for job in running if not job.running]
+        if self._watcher is not None:
+            for job in terminated:
+                for file, _ in job.get_markers():
+                    self._watcher.remove(file)
+        self._polling.update(bool(submitted or terminated))
+        return terminated
+
+    def get_job_steps(self, job: SlurmJob) -> dict:
+        '''
+        Return states of the steps (executed by srun) of given job (step name -> state dict).
+        '''
+        if job.get_id() is None:
+            return {}
+        return api.get_job_steps([job.get_id()]).get(job.get_id(), {})
 
     def release(self, name: str) -> SlurmJob | None:
         '''
         Remove job by its name from internal job list.
         Returns the job removed, or None if no such job exists.
         '''
-        return self.jobs.pop(name, None)
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            self._tracker.remove(job)
+            if self._watcher is not None:
+                for file, _ in job.get_markers():
+                    self._watcher.remove(file)
+        return job
@@ -0,0 +1,97 @@
+from slurm.job import SlurmJob
+
+
+class JobTracker:
+    '''
+    Index of jobs of one Slurm interface that keeps the costs of state updates proportional to the number
+    of active jobs (not to the whole job history). It maps SLURM IDs to jobs and holds the set of running jobs.
+    Jobs are submitted by SlurmJob.run() (the tracker is not notified), so the jobs created but not submitted
+    yet are kept aside and checked for an ID on every sync().
+    '''
+
+    def __init__(self):
+        self._source = None  # jobs dict (name -> job) of the Slurm interface the index was built from
+        self._jobs = {}  # name -> job as known to the index (compared with the source to detect changes)
+        self._created = {}  # name -> job created but not submitted yet
+        self.by_id = {}  # SLURM ID -> job
+        self.running = {}  # SLURM ID -> job which has not terminated yet
+
+    def _index(self, job: SlurmJob) -> bool:
+        self._jobs[job.get_name()] = job
+        if job.get_id() is None:
+            self._created[job.get_name()] = job
+            return False
+        self.by_id[job.get_id()] = job
+        if job.running:
+            self.running[job.get_id()] = job
+        return True
+
+    def add(self, job: SlurmJob) -> None:
+        '''
+        Register a newly created job.
+        '''
+        self._index(job)
+
+    def remove(self, job: SlurmJob) -> None:
+        '''
+        Forget a released job.
+        '''
+        self._jobs.pop(job.get_name(), None)
+        self._created.pop(job.get_name(), None)
+        self.by_id.pop(job.get_id(), None)
+        self.running.pop(job.get_id(), None)
+
+    def sync(self, jobs: dict) -> list:
+        '''
+        Bring the index up to date with given jobs (name -> job). The index is rebuilt only if the dict
+        was replaced (e.g., by deserialization) or modified behind the tracker's back (a job was added,
+        removed, or replaced by another job object, the jobs are compared by identity).
+        Returns list of newly submitted jobs (all running jobs if the index was rebuilt).
+        '''
+        if self._source is not jobs or self._jobs != jobs:
+            self._source = jobs
+            self._jobs, self._created, self.by_id, self.running = {}, {}, {}, {}
+            return [job for job in jobs.values() if self._index(job) and job.running]
+
+        created, self._created = self._created, {}
+        return [job for job in created.values() if self._index(job)]
+
+    def process(self, states: dict, ts: float) -> list:
+        '''
+        Integrate states (SLURM ID -> state dict, see api.get_job_states()) of running jobs.
+        Returns list of jobs that just terminated.
+        '''
+        terminated = []
+        for id, state in states.items():
+            job = self.running.get(id)
+            if job is None:
+                continue
+            job._process_update(state, ts)
+            if not job.running:
+                del self.running[id]
+                terminated.append(job)
+        return terminated
+
+
+class AdaptivePolling:
+    '''
+    Poll interval adapting to the activity of the queue. The interval drops to the minimum whenever a job
+    is submitted or terminates, and it grows exponentially (by the backoff factor) up to the maximum
+    while nothing happens (a zero minimum means polling without any delay).
+    '''
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0):
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = self.min_interval
+
+    def update(self, active: bool) -> float:
+        '''
+        Record outcome of one poll (whether any activity was observed), returns the next interval.
+        '''
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, max(self.interval * self.backoff, self.min_interval))
+        return self.interval
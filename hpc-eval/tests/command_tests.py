@@ -27,6 +27,17 @@ class CommandTestsBase(unittest.TestCase):
 
         os.chdir(self.rootdir)
 
+    def update_config(self, section: str, values: dict) -> None:
+        '''
+        Helper method that modifies (adds/replaces) values of one section in the config file.
+        '''
+        yaml = YAML()
+        with open(self.config_file, 'r') as fp:
+            config = yaml.load(fp)
+        config.setdefault(section, {}).update(values)
+        with open(self.config_file, 'w') as fp:
+            yaml.dump(config, fp)
+
     def tearDown(self) -> None:
         for tempdir in self.tempdirs:
             tempdir.cleanup()
@@ -0,0 +1,127 @@
+import unittest
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+from helpers.archive import ArchiveExtractor, ArchiveError, get_archive_type
+
+
+class TestArchive(unittest.TestCase):
+    files = {
+        'solution.hpp': '#define N 42',
+        'src/solution.cpp': '#include "solution.hpp";\nint main() { return N; }',
+        'src/lib/helper.cpp': 'void helper() {}',
+    }
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.target = self.tmpdir.name + '/target'
+        os.makedirs(self.target)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+        return super().tearDown()
+
+    def create_zip(self, files: dict, name: str = 'archive.zip') -> str:
+        path = f'{self.tmpdir.name}/{name}'
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            for file, content in files.items():
+                z.writestr(file, content)
+        return path
+
+    def create_tar(self, files: dict, name: str = 'archive.tar.gz') -> str:
+        path = f'{self.tmpdir.name}/{name}'
+        with tarfile.open(path, 'w:gz' if name.endswith('.gz') else 'w') as tar:
+            for file, content in files.items():
+                data = content.encode('utf-8')
+                info = tarfile.TarInfo(file)
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+        return path
+
+    def check_target(self, files: dict):
+        for file, content in files.items():
+            with open(f'{self.target}/{file}', 'r') as fp:
+                self.assertEqual(fp.read(), content)
+
+    def test_archive_types(self):
+        self.assertEqual(get_archive_type('a.zip'), 'zip')
+        self.assertEqual(get_archive_type('a.tar'), 'tar')
+        self.assertEqual(get_archive_type('a.TAR.GZ'), 'tar.gz')
+        self.assertEqual(get_archive_type('a.tgz'), 'tar.gz')
+        self.assertEqual(get_archive_type('a.tar.zst'), 'tar.zst')
+        self.assertIsNone(get_archive_type('a.rar'))
+
+    def test_zip(self):
+        stats = ArchiveExtractor(workers=4).extract(self.create_zip(self.files), self.target)
+        self.check_target(self.files)
+        self.assertEqual(stats.files, len(self.files))
+        self.assertEqual(stats.bytes, sum([len(content) for content in self.files.values()]))
+
+    def test_tar(self):
+        ArchiveExtractor().extract(self.create_tar(self.files, 'archive.tar'), self.target)
+        self.check_target(self.files)
+
+    def test_tar_gz(self):
+        ArchiveExtractor().extract(self.create_tar(self.files), self.target)
+        self.check_target(self.files)
+
+    def test_corrupted_tar_gz(self):
+        path = f'{self.tmpdir.name}/bad.tar.gz'
+        with open(path, 'wb') as fp:
+            fp.write(b'not a gzip stream')
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor().extract(path, self.target)
+
+        with open(self.create_tar(self.files), 'rb') as fp:
+            data = bytearray(fp.read())
+        data[20:40] = b'\xff' * 20  # damaged deflate stream
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor().extract(path, self.target)
+
+    def test_zip_bomb(self):
+        archive = self.create_zip({'zeros.bin': '\0' * (1 << 22)})
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor(max_ratio=100).extract(archive, self.target)
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor(max_size=1 << 20).extract(archive, self.target)
+        self.assertFalse(os.path.exists(f'{self.target}/zeros.bin'))
+
+    def test_tar_bomb(self):
+        archive = self.create_tar({'zeros.bin': '\0' * (1 << 22)})
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor(max_ratio=100).extract(archive, self.target)
+
+    def test_too_many_files(self):
+        files = {f'file{i}.txt': str(i) for i in range(20)}
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor(max_files=10).extract(self.create_zip(files), self.target)
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor(max_files=10).extract(self.create_tar(files), self.target)
+
+    def test_path_traversal(self):
+        for files in [{'../evil.txt': 'evil'}, {'/tmp/evil.txt': 'evil'}, {'a/../../evil.txt': 'evil'}]:
+            with self.assertRaises(ArchiveError):
+                ArchiveExtractor().extract(self.create_zip(files), self.target)
+            with self.assertRaises(ArchiveError):
+                ArchiveExtractor().extract(self.create_tar(files), self.target)
+        self.assertFalse(os.path.exists(f'{self.tmpdir.name}/evil.txt'))
+
+    def test_tar_symlink(self):
+        path = f'{self.tmpdir.name}/links.tar'
+        with tarfile.open(path, 'w') as tar:
+            info = tarfile.TarInfo('link')
+            info.type = tarfile.SYMTYPE
+            info.linkname = '/etc/passwd'
+            tar.addfile(info)
+        with self.assertRaises(ArchiveError):
+            ArchiveExtractor().extract(path, self.target)
+        self.assertFalse(os.path.lexists(f'{self.target}/link'))
+
+
+if __name__ == '__main__':
+    unittest.main()
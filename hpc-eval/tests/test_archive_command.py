@@ -0,0 +1,89 @@
+import contextlib
+import datetime
+import io
+import os
+import stat
+import unittest
+from unittest import mock
+from components.solutions import Solutions
+from commands.archive import Archive
+from commands.submit import Submit
+from tests.command_tests import CommandTestsBase
+
+
+class TestArchiveCommand(CommandTestsBase):
+    def test_archive_and_restore(self):
+        self.add_dummy_users(3)
+        files = {
+            'solution.cpp': 'int main() { return 0; }',
+            'sub/run.sh': '#!/bin/sh\necho hello',
+        }
+        prep_dir = self.create_temp_dir(files)
+        os.chmod(f'{prep_dir}/sub/run.sh', 0o755)
+        os.makedirs(f'{prep_dir}/sub/empty/nested')
+        for i in range(1, 4):
+            self.run_command(Submit(), [
+                '--external-id', f'sol{i}',
+                '--user', str(i),
+                '--assignment', 'ass',
+                prep_dir + '/solution.cpp',
+                prep_dir + '/sub',
+            ])
+
+        tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        command = Archive()
+        self.run_command(command, ['--before', tomorrow])
+        workspace = command.workspace
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        packs = set()
+        for solution in solutions.solutions.values():
+            self.assertIsNotNone(solution.pack)
+            packs.add(solution.pack)
+            self.assertFalse(os.path.exists(workspace.get_solution_dir(solution)))
+        self.assertEqual(len(packs), 1)
+        self.assertTrue(os.path.isfile(f'{workspace.packs_dir}/{packs.pop()}'))
+        self.assertEqual(os.listdir(f'{self.rootdir}/_solutions/ass'), [])
+
+        # single solution is extracted on demand
+        solution = solutions.get_by_external_id('sol2')
+        dir = workspace.open_solution_dir(solution)
+        self.assertEqual(dir, workspace.get_solution_dir(solution))
+        for name, content in files.items():
+            self.assertEqual(self.get_file_contents(f'{dir}/{name}'), content)
+        self.assertTrue(os.stat(f'{dir}/sub/run.sh').st_mode & stat.S_IXUSR)
+        self.assertEqual(os.listdir(f'{dir}/sub/empty'), ['nested'])  # empty dirs are preserved
+        self.assertFalse(os.path.exists(workspace.get_solution_dir(solutions.get_by_external_id('sol1'))))
+
+        # re-archiving removes the extracted dir without creating another pack
+        self.run_command(Archive(), ['--older-than', '-1'])
+        self.assertFalse(os.path.exists(dir))
+        self.assertEqual(len(os.listdir(f'{workspace.packs_dir}/ass')), 1)
+
+    def test_records_saved_before_removal(self):
+        self.add_dummy_users(1)
+        prep_dir = self.create_temp_dir({'solution.cpp': 'int main() { return 0; }'})
+        self.run_command(Submit(), ['--external-id', 'sol1', '--user', '1', '--assignment', 'ass',
+                                    prep_dir + '/solution.cpp'])
+
+        command = Archive()
+        with mock.patch('components.workspace.shutil.rmtree', side_effect=OSError('busy')):
+            with self.assertRaises(OSError):
+                self.run_command(command, ['--older-than', '-1'])
+        command.solutions.close_serialization_file()
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        solution = solutions.get_by_external_id('sol1')
+        self.assertIsNotNone(solution.pack)  # the pack is recorded although the dir was not removed
+        self.assertTrue(os.path.isfile(f'{command.workspace.packs_dir}/{solution.pack}'))
+
+    def test_args_validation(self):
+        command = Archive()
+        with self.assertRaises(SystemExit), contextlib.redirect_stdout(io.StringIO()):
+            command.parse_args(['--before', 'yesterday'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import time
+import unittest
+from helpers.build_cache import BuildCache
+
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = BuildCache(self.tempdir.name + '/cache', 100)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def _stage(self, key: str, size: int) -> str:
+        staging = self.cache.get_staging_dir(key, 'job')
+        os.makedirs(staging)
+        with open(f'{staging}/artifact', 'wb') as fp:
+            fp.write(b'x' * size)
+        return staging
+
+    def test_key(self):
+        key = BuildCache.compute_key('abc', 'def', [['make']])
+        self.assertEqual(key, BuildCache.compute_key('abc', 'def', [['make']]))
+        self.assertNotEqual(key, BuildCache.compute_key('abc', 'def', [['make', 'all']]))
+        self.assertNotEqual(key, BuildCache.compute_key('abc', None, [['make']]))
+
+    def test_lookup_and_commit(self):
+        self.assertIsNone(self.cache.lookup('a'))
+        self.assertTrue(self.cache.commit('a', self._stage('a', 10)))
+        dir = self.cache.lookup('a')
+        self.assertEqual(dir, self.cache.get_entry_dir('a'))
+        self.assertTrue(os.path.isfile(f'{dir}/artifact'))
+
+        # redundant commit is discarded
+        staging = self._stage('a', 10)
+        self.assertFalse(self.cache.commit('a', staging))
+        self.assertFalse(os.path.exists(staging))
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['size'], 10)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_lru_eviction(self):
+        self.cache.commit('a', self._stage('a', 40))
+        self.cache.commit('b', self._stage('b', 40))
+        time.sleep(1.1)  # last use times have 1s resolution
+        self.assertIsNotNone(self.cache.lookup('a'))  # b becomes the least recently used
+        self.cache.commit('c', self._stage('c', 40))
+
+        self.assertFalse(os.path.exists(self.cache.get_entry_dir('b')))
+        self.assertIsNotNone(self.cache.lookup('a'))
+        self.assertIsNotNone(self.cache.lookup('c'))
+        self.assertIsNone(self.cache.lookup('b'))
+        self.assertEqual(self.cache.get_stats()['size'], 80)
+
+    def test_pinned_entries(self):
+        self.cache.commit('a', self._stage('a', 60))
+        dir = self.cache.lookup('a', pin=True)  # planned, the artifacts are copied by a test later
+        time.sleep(1.1)  # last use times have 1s resolution
+        self.cache.commit('b', self._stage('b', 30))
+        self.cache.commit('c', self._stage('c', 30))  # over the limit, a is the least recently used but pinned
+        self.assertTrue(os.path.isfile(f'{dir}/artifact'))
+        self.assertFalse(os.path.exists(self.cache.get_entry_dir('b')))
+
+        self.cache.unpin_all()  # the evaluation has finished
+        self.cache.commit('d', self._stage('d', 30))
+        self.assertFalse(os.path.exists(dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,489 @@
+import os
+import stat
+import subprocess
+import unittest
+from itertools import count
+from unittest import mock
+from components.assignments import Assignments
+from components.results import Result
+from components.solutions import Solutions, Solution
+from components.workspace import Workspace
+from commands.default import Default
+from commands.submit import Submit
+from evaluation.dag import JobGraph, JobNode
+from evaluation.engine import Engine
+from evaluation.planner import Planner, format_command
+from evaluation.steps import get_step_levels
+from slurm.fake.benchmark import activate
+from slurm.job import SlurmJob
+from slurm.slurm import Slurm
+from tests.command_tests import CommandTestsBase
+
+
+class LocalJob(SlurmJob):
+    '''
+    Test double of a SLURM job, the script (every task of an array) is executed synchronously on submission.
+    '''
+    _ids = count(1)
+
+    def _dependency_failed(self) -> bool:
+        if not self.args.has_arg('dependency'):
+            return False
+        for ref in self.args.get_arg_value('dependency').split(':')[1:]:
+            id, _, task = ref.partition('_')
+            job = self.slurm.get_job_by_id(int(id))
+            if job.task_failed(int(task)) if task else job.failed():
+                return True
+        return False
+
+    def _execute(self, task_id: int | None) -> dict:
+        env = os.environ | ({'SLURM_ARRAY_TASK_ID': str(task_id)} if task_id is not None else {})
+        output = self.args.get_arg_value('output') if self.args.has_arg('output') else '/dev/null'
+        with open(output, 'a') as out:
+            result = subprocess.run(['/bin/sh', '-c', '\n'.join(self.get_script())], stdout=out,
+                                    stderr=subprocess.STDOUT, env=env)
+        state = 'COMPLETED' if result.returncode == 0 else 'FAILED'
+        return {'state': state, 'running': False, 'exit_code': result.returncode, 'signal': 0}
+
+    def run(self) -> int:
+        self.id = next(__class__._ids)
+        self.running = True
+        self.last_update = None
+        self.slurm.submitted.append(self)
+        self._prepare_array()
+
+        if self._dependency_failed():
+            cancelled = {'state': 'CANCELLED', 'running': False, 'exit_code': 0, 'signal': 0}
+            self._result = cancelled | {'tasks': {task_id: cancelled for task_id in range(len(self.tasks))}}
+        elif self.tasks:
+            self._result = {'tasks': {task_id: self._execute(task_id) for task_id in range(len(self.tasks))}}
+        else:
+            self._result = self._execute(None)
+        return self.id
+
+
+class LocalSlurm(Slurm):
+    def __init__(self):
+        super().__init__()
+        self.submitted = []
+
+    def create_job(self, name: str) -> SlurmJob:
+        job = LocalJob(name, self.default_args)
+        job.slurm = self
+        self.jobs[name] = job
+        return job
+
+    def get_job_by_id(self, id: int) -> SlurmJob:
+        return [job for job in self.jobs.values() if job.id == id][0]
+
+    def get_task_count(self) -> int:
+        '''
+        Number of logical jobs submitted (every array task is counted).
+        '''
+        return sum([len(job.tasks) or 1 for job in self.submitted])
+
+    def get_job_steps(self, job: SlurmJob) -> dict:
+        return {}  # no accounting, steps are resolved from the records in job dirs
+
+    def update_jobs(self) -> list:
+        terminated = [job for job in self.jobs.values() if job.running]
+        for job in terminated:
+            job._process_update(job._result)
+        return terminated
+
+
+class TestEvaluation(CommandTestsBase):
+    def _create_assignments(self, overlay: str, inputs: str) -> dict:
+        return {
+            'ass': {
+                'builds': {
+                    'gen': {
+                        'overlay': overlay,
+                        'run': [['bash build.sh'], ['cat', 'solution.txt']],
+                    },
+                },
+                'tests': {
+                    'ok': {
+                        'build': 'gen',
+                        'inputs': [inputs + '/input.txt'],
+                        'run': [['cmp result.txt input.txt']],
+                    },
+                    'fail': {
+                        'build': 'gen',
+                        'run': [['test -f missing.txt']],
+                    },
+                    'plain': {
+                        'run': [['test -f solution.txt']],
+                    },
+                },
+            },
+        }
+
+    def _submit(self, files: dict) -> Solution:
+        self.add_dummy_users(1)
+        prep_dir = self.create_temp_dir(files)
+        self.run_command(Submit(), ['--user', '1', '--assignment', 'ass', prep_dir + '/solution.txt'])
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        return list(solutions.solutions.values())[0]
+
+    def test_format_command(self):
+        self.assertEqual(format_command('make all'), 'make all')
+        self.assertEqual(format_command(['make all']), 'make all')
+        self.assertEqual(format_command(['cat', 'a b']), "cat 'a b'")
+
+    def test_plan(self):
+        overlay = self.create_temp_dir({'build.sh': 'true'})
+        inputs = self.create_temp_dir({'input.txt': 'x'})
+        assignments = Assignments(self._create_assignments(overlay, inputs))
+        workspace = Workspace({'root': self.rootdir})
+        solution = Solution('1', user_id='1', assignment_id='ass')
+
+        graph = Planner(workspace, assignments).plan([solution])
+        self.assertEqual(len(graph), 4)  # one shared build and three tests
+        build = graph['ass.1.gen.build']
+        test1 = graph['ass.1.ok.test']
+        test2 = graph['ass.1.fail.test']
+        self.assertEqual(test1.deps, [build])
+        self.assertEqual(test2.deps, [build])
+        self.assertEqual(build.dependents, [test1, test2])
+        self.assertEqual(build.data['refs'], 2)
+        self.assertNotEqual(test1.data['box'], test2.data['box'])
+        self.assertEqual(test1.data['artifacts'], build.data['box'])
+        self.assertIn("cat solution.txt", build.commands)
+        self.assertEqual(graph['ass.1.plain.test'].deps, [])
+        self.assertEqual([node.name for node in graph.get_ready()], ['ass.1.gen.build', 'ass.1.plain.test'])
+
+    def test_graph_skip_failed(self):
+        graph = JobGraph()
+        a = graph.add(JobNode('a', 'build'))
+        b = graph.add(JobNode('b', 'test', deps=[a]))
+        c = graph.add(JobNode('c', 'test', deps=[b]))
+        with self.assertRaises(Exception):
+            graph.add(JobNode('d', 'test', deps=[JobNode('x', 'build')]))
+
+        a.finish(False)
+        self.assertEqual(graph.skip_failed(), [b, c])
+        self.assertTrue(graph.is_finished())
+
+    def test_engine_max_running(self):
+        graph = JobGraph()
+        for i in range(5):
+            node = JobNode(f'job{i}', 'test')
+            node.commands = ['true']
+            node.job_dir = self.create_temp_dir()
+            graph.add(node)
+
+        slurm = LocalSlurm()
+        engine = Engine(slurm, max_running=2, poll_interval=0)
+        submitted = []
+        original = engine._submit
+
+        def submit(batch):
+            submitted.append(len(engine._running) + sum([len(nodes) for _, nodes in batch]))
+            original(batch)
+
+        engine._submit = submit
+        engine.run(graph)
+        self.assertTrue(graph.is_finished())
+        self.assertEqual(len(slurm.submitted), 5)
+        self.assertLessEqual(max(submitted), 2)
+
+    def test_engine_arrays(self):
+        graph = JobGraph()
+        for i in range(5):
+            node = JobNode(f'job{i}', 'test')
+            node.commands = [f'echo job{i}', 'exit 1' if i == 3 else 'true']
+            node.job_dir = self.create_temp_dir()
+            graph.add(node)
+
+        slurm = LocalSlurm()
+        Engine(slurm, poll_interval=0, array_size=3).run(graph)
+        self.assertEqual(len(slurm.submitted), 2)
+        self.assertEqual(slurm.get_task_count(), 5)
+        self.assertEqual(slurm.submitted[0].args.get_arg_value('array'), '0-2')
+        for i in range(5):
+            node = graph[f'job{i}']
+            self.assertEqual(node.state, JobNode.FAILED if i == 3 else JobNode.COMPLETED)
+            self.assertEqual(self.get_file_contents(f'{node.job_dir}/stdout.log'), f'job{i}\n')
+        self.assertEqual(graph['job3'].exit_code, 1)
+
+    def test_evaluate_command(self):
+        overlay = self.create_temp_dir({'build.sh': 'cp solution.txt result.txt'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        self.update_config('assignments', self._create_assignments(overlay, inputs))
+        solution = self._submit({'solution.txt': 'hello'})
+
+        command = Default()
+        command.slurm = LocalSlurm()
+        self.update_config('evaluator', {'poll_interval': 0})
+        self.run_command(command, [])
+
+        result_file = f'{self.rootdir}/_results/ass/{solution.id}.json'
+        self.assertTrue(os.path.exists(result_file))
+        result = Result()
+        result.load_json(result_file)
+        self.assertEqual(result.solution_id, solution.id)
+        self.assertTrue(result.tests['ok']['passed'])
+        self.assertFalse(result.tests['fail']['passed'])
+        self.assertTrue(result.tests['plain']['passed'])
+        self.assertEqual(result.jobs[f'ass.{solution.id}.gen.build']['state'], JobNode.COMPLETED)
+        self.assertEqual(len(command.slurm.submitted), 2)  # build + plain test, array of tests using the build
+        self.assertEqual(command.slurm.get_task_count(), 4)
+
+        # inputs are hardlinked (read-only) from the input cache
+        input = f'{self.rootdir}/_jobs/ass.{solution.id}.ok.test/box/input.txt'
+        self.assertEqual(os.stat(input).st_nlink, 2)
+        self.assertFalse(os.stat(input).st_mode & stat.S_IWUSR)
+
+        # build artifacts are removed after the last test finishes, test boxes are kept
+        self.assertFalse(os.path.exists(f'{self.rootdir}/_jobs/ass.{solution.id}.gen.build/box'))
+        self.assertTrue(os.path.exists(f'{self.rootdir}/_jobs/ass.{solution.id}.ok.test/box/result.txt'))
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        self.assertIsNotNone(solutions[solution.id].evaluated_at)
+
+        # evaluated solutions are not evaluated again
+        command = Default()
+        command.slurm = LocalSlurm()
+        self.run_command(command, [])
+        self.assertEqual(len(command.slurm.submitted), 0)
+
+        # re-evaluation reuses cached builds (only tests are executed)
+        command = Default()
+        command.slurm = LocalSlurm()
+        self.run_command(command, ['--reevaluate'])
+        self.assertEqual(command.slurm.get_task_count(), 3)
+        result.load_json(result_file)
+        self.assertEqual(sorted(result.jobs), [f'ass.{solution.id}.{test}.test' for test in ['fail', 'ok', 'plain']])
+        self.assertTrue(result.tests['ok']['passed'])
+        self.assertFalse(result.tests['fail']['passed'])
+
+    def test_evaluate_steps(self):
+        overlay = self.create_temp_dir({'build.sh': 'cp solution.txt result.txt'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        self.update_config('assignments', self._create_assignments(overlay, inputs))
+        self.update_config('evaluator', {'poll_interval': 0, 'steps': 4})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        command = Default()
+        command.slurm = LocalSlurm()
+        self.run_command(command, [])
+        self.assertEqual(len(command.slurm.submitted), 1)  # one allocation for the whole solution
+        # ntasks is the widest level (build + plain test, two tests using the build)
+        self.assertEqual(command.slurm.submitted[0].args.get_arg_value('ntasks'), 2)
+
+        result = Result()
+        result.load_json(f'{self.rootdir}/_results/ass/{solution.id}.json')
+        self.assertTrue(result.tests['ok']['passed'])
+        self.assertFalse(result.tests['fail']['passed'])
+        self.assertEqual(result.tests['fail']['exit_code'], 1)
+        self.assertTrue(result.tests['plain']['passed'])
+        self.assertEqual(result.jobs[f'ass.{solution.id}.gen.build']['state'], JobNode.COMPLETED)
+
+    def test_evaluate_in_scratch(self):
+        overlay = self.create_temp_dir({'build.sh': 'cp solution.txt result.txt'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        scratch = self.create_temp_dir()
+        assignments = self._create_assignments(overlay, inputs)
+        assignments['ass']['tests']['ok']['run'].insert(0, ['mkdir -p out && echo log > out/log.txt && touch junk'])
+        assignments['ass']['tests']['ok']['outputs'] = ['result.txt', 'out/log.txt', 'missing.txt']
+        self.update_config('assignments', assignments)
+        node_cache = self.create_temp_dir()
+        self.update_config('evaluator', {'poll_interval': 0, 'scratch_dir': scratch, 'node_cache_dir': node_cache})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        command = Default()
+        command.slurm = LocalSlurm()
+        self.run_command(command, [])
+
+        result = Result()
+        result.load_json(f'{self.rootdir}/_results/ass/{solution.id}.json')
+        self.assertTrue(result.tests['ok']['passed'])
+        self.assertFalse(result.tests['fail']['passed'])
+        self.assertTrue(result.tests['plain']['passed'])
+
+        box = f'{self.rootdir}/_jobs/ass.{solution.id}.ok.test/box'
+        self.assertEqual(self.get_file_contents(f'{box}/out/log.txt'), 'log\n')
+        self.assertTrue(os.path.exists(f'{box}/result.txt'))
+        self.assertFalse(os.path.exists(f'{box}/junk'))
+        self.assertEqual(os.listdir(scratch), [])  # scratch is cleaned up
+        self.assertEqual(len(os.listdir(node_cache)), 1)  # the input is kept in node cache
+
+        self.assertFalse(os.path.exists(f'{box}/input.txt'))  # input was staged to scratch only
+        transfer = result.jobs[f'ass.{solution.id}.ok.test']['transfer']
+        self.assertGreater(transfer['staged_bytes'], 0)
+        self.assertEqual(transfer['returned_bytes'], len('hello') + len('log\n'))
+        self.assertGreaterEqual(transfer['stage_in_ms'], 0)
+        self.assertGreaterEqual(transfer['stage_out_ms'], 0)
+
+    def test_steps_skip_failed(self):
+        graph = JobGraph()
+        build = graph.add(JobNode('build', 'build'))
+        test = graph.add(JobNode('test', 'test', deps=[build]))
+        other = graph.add(JobNode('other', 'test'))
+        build.commands, test.commands, other.commands = ['exit 3'], ['true'], ['echo ok']
+        for node in [build, test, other]:
+            node.job_dir = self.create_temp_dir()
+
+        self.assertEqual(get_step_levels([build, test, other]), [[build, other], [test]])
+        Engine(LocalSlurm(), poll_interval=0, steps=2).run(graph)
+        self.assertEqual(build.state, JobNode.FAILED)
+        self.assertEqual(build.exit_code, 3)
+        self.assertEqual(test.state, JobNode.SKIPPED)
+        self.assertEqual(other.state, JobNode.COMPLETED)
+        self.assertEqual(self.get_file_contents(f'{other.job_dir}/stdout.log'), 'ok\n')
+
+    def test_steps_with_markers(self):
+        for markers in [False, True]:
+            graph = JobGraph()
+            build = graph.add(JobNode('build', 'build'))
+            test = graph.add(JobNode('test', 'test', deps=[build]))
+            build.commands, test.commands = ['true'], ['exit 2']
+            for node in [build, test]:
+                node.job_dir = self.create_temp_dir()
+
+            slurm = LocalSlurm()
+            with mock.patch.object(slurm, 'get_job_steps', return_value={}) as get_job_steps:
+                Engine(slurm, poll_interval=0, steps=2, markers=markers).run(graph)
+            slurm.close()
+            self.assertEqual(get_job_steps.called, not markers)  # no accounting query if the marker was written
+            self.assertEqual((build.state, test.state), (JobNode.COMPLETED, JobNode.FAILED))
+            self.assertEqual(test.exit_code, 2)
+
+    def test_failed_build_skips_test(self):
+        overlay = self.create_temp_dir({'build.sh': 'exit 1'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        assignments = Assignments(self._create_assignments(overlay, inputs))
+        workspace = Workspace({'root': self.rootdir})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        planner = Planner(workspace, assignments)
+        graph = planner.plan([solution])
+        slurm = LocalSlurm()
+        Engine(slurm, poll_interval=0).run(graph)
+        self.assertEqual(graph[f'ass.{solution.id}.gen.build'].state, JobNode.FAILED)
+        self.assertEqual(graph[f'ass.{solution.id}.fail.test'].state, JobNode.SKIPPED)
+        self.assertFalse(os.path.exists(graph[f'ass.{solution.id}.gen.build'].data['box']))
+        self.assertEqual(graph[f'ass.{solution.id}.ok.test'].state, JobNode.SKIPPED)
+        self.assertEqual(graph[f'ass.{solution.id}.plain.test'].state, JobNode.COMPLETED)
+
+        result = planner.collect_results(graph)[solution.id]
+        self.assertFalse(result.tests['ok']['passed'])
+        self.assertEqual(result.tests['ok']['state'], JobNode.SKIPPED)
+
+    def test_evaluate_locally(self):
+        overlay = self.create_temp_dir({'build.sh': 'cp solution.txt result.txt'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        self.update_config('assignments', self._create_assignments(overlay, inputs))
+        self.update_config('evaluator', {'poll_interval': 0, 'executor': 'local', 'local_workers': 2})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        self.run_command(Default(), [])
+        result = Result()
+        result.load_json(f'{self.rootdir}/_results/ass/{solution.id}.json')
+        self.assertTrue(result.tests['ok']['passed'])
+        self.assertFalse(result.tests['fail']['passed'])
+        self.assertTrue(result.tests['plain']['passed'])
+
+    def test_evaluate_with_fake_slurm(self):
+        overlay = self.create_temp_dir({'build.sh': 'cp solution.txt result.txt'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        self.update_config('assignments', self._create_assignments(overlay, inputs))
+        self.update_config('evaluator', {'poll_interval': 0})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        with mock.patch.dict(os.environ):
+            activate(self.create_temp_dir())  # the default executor (SLURM) uses the fake commands
+            self.run_command(Default(), [])
+        result = Result()
+        result.load_json(f'{self.rootdir}/_results/ass/{solution.id}.json')
+        self.assertTrue(result.tests['ok']['passed'])
+        self.assertFalse(result.tests['fail']['passed'])
+        self.assertTrue(result.tests['plain']['passed'])
+        dirs = os.listdir(f'{self.rootdir}/_jobs')
+        self.assertTrue(dirs)
+        self.assertTrue(all([os.path.exists(f'{self.rootdir}/_jobs/{dir}/completion.json') for dir in dirs]))
+
+    def test_box_does_not_share_archived_files(self):
+        overlay = self.create_temp_dir({'build.sh': 'true'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        assignments = Assignments(self._create_assignments(overlay, inputs))
+        self.update_config('workspace', {'dedup': True})  # archived files are read-only objects
+        solution = self._submit({'solution.txt': 'hello'})
+        workspace = Workspace({'root': self.rootdir, 'dedup': True})
+        archived = f'{workspace.get_solution_dir(solution)}/solution.txt'
+        self.assertFalse(os.stat(archived).st_mode & stat.S_IWUSR)
+
+        graph = Planner(workspace, assignments).plan([solution])
+        for node in [graph[f'ass.{solution.id}.gen.build'], graph[f'ass.{solution.id}.plain.test']]:
+            node.prepare(node)
+            file = f"{node.data['box']}/solution.txt"
+            self.assertNotEqual(os.stat(file).st_ino, os.stat(archived).st_ino)
+            os.chmod(file, 0o644)  # jobs run under the same user
+            with open(file, 'w') as fp:
+                fp.write('tampered')
+            self.assertEqual(self.get_file_contents(archived), 'hello')
+
+    def test_overlay_snapshot(self):
+        overlay = self.create_temp_dir({'build.sh': 'echo built >> config.h', 'config.h': '', 'lib/util.h': 'x'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        assignments = self._create_assignments(overlay, inputs)
+        assignments['ass']['builds']['gen']['writable'] = ['*.h']
+        assignments = Assignments(assignments)
+        workspace = Workspace({'root': self.rootdir})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        for _ in range(2):  # the second box reuses the snapshot
+            planner = Planner(workspace, assignments)
+            graph = planner.plan([solution])
+            build = graph[f'ass.{solution.id}.gen.build']
+            build.prepare(build)
+            box = build.data['box']
+            self.assertEqual(os.stat(f'{box}/build.sh').st_nlink, 1)  # never linked from the snapshot
+            self.assertFalse(os.stat(f'{box}/build.sh').st_mode & stat.S_IWUSR)
+            self.assertTrue(os.stat(f'{box}/config.h').st_mode & stat.S_IWUSR)  # writable files keep their modes
+            self.assertIsNotNone(build.data['setup_ms'])
+            subprocess.run(['sh', 'build.sh'], cwd=box, check=True)
+            self.assertEqual(self.get_file_contents(f'{box}/config.h'), 'built\n')
+
+            os.chmod(f'{box}/build.sh', 0o644)  # a build can tamper with its own copy only
+            with open(f'{box}/build.sh', 'a') as fp:
+                fp.write('\necho poisoned >> config.h\n')
+            snapshot = planner._overlay_snapshots[overlay]
+            self.assertEqual(self.get_file_contents(f'{snapshot}/build.sh'), 'echo built >> config.h')
+
+        self.assertEqual(self.get_file_contents(f'{overlay}/config.h'), '')
+        self.assertEqual(workspace.overlay_cache.get_stats()['hits'], 1)
+
+    def test_generated_inputs(self):
+        overlay = self.create_temp_dir({'build.sh': 'cp solution.txt result.txt'})
+        inputs = self.create_temp_dir({'input.txt': 'hello'})
+        log = f'{inputs}/runs.log'
+        assignments = self._create_assignments(overlay, inputs)
+        generator = {'name': 'data.txt', 'command': ['sh', '-c', f'echo run >> {log}; echo "$SEED $0"'],
+                     'params': ['big'], 'seed': 42}
+        assignments['ass']['tests']['plain']['generated'] = [generator]
+        assignments['ass']['tests']['gen'] = {'generated': [generator], 'run': [['grep -q "42 big" data.txt']]}
+        self.update_config('assignments', assignments)
+        self.update_config('evaluator', {'poll_interval': 0})
+        solution = self._submit({'solution.txt': 'hello'})
+
+        for args in [[], ['--reevaluate']]:
+            command = Default()
+            command.slurm = LocalSlurm()
+            self.run_command(command, args)
+            result = Result()
+            result.load_json(f'{self.rootdir}/_results/ass/{solution.id}.json')
+            self.assertTrue(result.tests['gen']['passed'])
+            self.assertTrue(result.tests['plain']['passed'])
+
+        # generated once (shared by both tests and both evaluations), hardlinked into the boxes
+        self.assertEqual(self.get_file_contents(log), 'run\n')
+        data = f'{self.rootdir}/_jobs/ass.{solution.id}.plain.test/box/data.txt'
+        self.assertEqual(os.stat(data).st_nlink, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
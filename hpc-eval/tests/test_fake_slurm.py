@@ -0,0 +1,263 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import slurm.aio as aio
+import slurm.api as sapi
+from slurm.args import SlurmArgs
+from slurm.fake.benchmark import activate, run_benchmark, run_call_benchmark
+from slurm.fake.cluster import FakeCluster, format_ranges, parse_exit_code, parse_ranges
+from slurm.slurm import Slurm
+
+
+def _wait(slurm: Slurm, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while any([job.running for job in slurm.jobs.values()]):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Jobs did not terminate in time.")
+        time.sleep(0.05)
+        slurm.update_jobs()
+
+
+class TestFakeSlurm(unittest.TestCase):
+    def setUp(self) -> None:
+        self.env = mock.patch.dict(os.environ)
+        self.env.start()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        os.chdir(self.root)  # sbatch records the working dir (previous tests may have removed theirs)
+        activate(self.root + '/cluster')
+        self.cluster = FakeCluster(self.root + '/cluster')
+
+    def tearDown(self) -> None:
+        self.env.stop()
+        self.tempdir.cleanup()
+
+    def test_ranges(self):
+        self.assertEqual(parse_ranges('0-2,5,7-8'), [0, 1, 2, 5, 7, 8])
+        self.assertEqual(format_ranges([8, 0, 1, 2, 5, 7]), '0-2,5,7-8')
+        self.assertEqual(parse_exit_code('3\n'), 3)
+        self.assertEqual(parse_exit_code(''), 1)
+        self.assertEqual(parse_exit_code('garbage'), 1)
+
+    def test_jobs(self):
+        self.assertTrue(sapi.is_slurm_available())
+        slurm = Slurm({'output': f'{self.root}/out.log'})
+        job = slurm.create_job('foo')
+        job.add_command('echo "hello $SLURM_JOB_ID"')
+        job.run()
+        _wait(slurm)
+        self.assertEqual(job.state, 'COMPLETED')
+        self.assertFalse(job.failed())
+        with open(f'{self.root}/out.log') as fp:
+            self.assertEqual(fp.read(), f'hello {job.get_id()}\n')
+
+    def test_arrays_dependencies_and_cancel(self):
+        self.cluster.configure(pending_time=0.2)
+        slurm = Slurm({'output': '/dev/null'})
+        array = slurm.create_job('array')
+        array.add_task('true')
+        array.add_task('exit 2')
+        array.add_task('true')
+        array.set_array_limit(1)
+        array.run()
+        states = sapi.get_job_states([array.get_id()])
+        self.assertEqual(sorted(states[array.get_id()]['tasks']), [0, 1, 2])  # reported as a pending range
+
+        ok = slurm.create_job('ok').add_args('dependency', f'afterok:{array.get_id()}_0').add_command('true')
+        skipped = slurm.create_job('skipped').add_args('dependency', f'afterok:{array.get_id()}_1')
+        skipped.add_command('true')
+        sleeping = slurm.create_job('sleeping').add_command('sleep 30')
+        for job in [ok, skipped, sleeping]:
+            job.run()
+        time.sleep(0.3)
+        slurm.update_jobs()
+        self.assertTrue(sleeping.cancel())
+        _wait(slurm)
+
+        self.assertEqual(array.state, 'FAILED')
+        self.assertEqual(array.exit_code, 2)
+        self.assertFalse(array.task_failed(2))
+        self.assertEqual(ok.state, 'COMPLETED')
+        self.assertEqual(skipped.state, 'CANCELLED')
+        self.assertTrue(sleeping.state.startswith('CANCELLED'))
+
+    def test_failure_injection(self):
+        self.cluster.configure(fail_rate=1.0, execute=False)
+        slurm = Slurm({'output': '/dev/null'})
+        job = slurm.create_job('foo').add_command('true')
+        job.run()
+        _wait(slurm)
+        self.assertEqual(job.state, 'NODE_FAIL')
+        self.assertTrue(job.failed())
+
+        self.cluster.configure(submit_fail_rate=1.0)
+        with self.assertRaises(sapi.SlurmError) as ctx:
+            slurm.create_job('bar').add_command('true').run()
+        self.assertEqual(ctx.exception.returncode, 1)
+        self.assertIn('Socket timed out', ctx.exception.stderr)
+
+        # the decisions are reproducible for the same seed
+        decisions = []
+        for dir in ['a', 'b']:
+            cluster = FakeCluster(f'{self.root}/{dir}')
+            cluster.configure(query_fail_rate=0.5, seed=42)
+            decisions.append([cluster.inject_failure('query') for _ in range(20)])
+        self.assertEqual(decisions[0], decisions[1])
+        self.assertIn(True, decisions[0])
+        self.assertIn(False, decisions[0])
+
+    def test_queue_states(self):
+        self.cluster.configure(min_job_age=60)
+        slurm = Slurm({'output': '/dev/null'})
+        done = slurm.create_job('done').add_command('true')
+        done.run()
+        _wait(slurm)
+        array = slurm.create_job('array')
+        for _ in range(3):
+            array.add_task('sleep 30')
+        array.set_array_limit(1)
+        array.run()
+        time.sleep(0.1)
+
+        with mock.patch('slurm.api._run', wraps=sapi._run) as run:
+            states = sapi.poll_job_states([done.get_id(), array.get_id()])
+        self.assertEqual(states[done.get_id()]['exit_code'], 0)
+        self.assertTrue(states[array.get_id()]['running'])
+        self.assertEqual(sorted(states[array.get_id()]['tasks']), [0, 1, 2])
+        # squeue for all jobs, sacct only for the one which left the queue
+        self.assertEqual([call.args[0] for call in run.call_args_list], ['squeue', 'sacct'])
+        self.assertEqual(run.call_args.args[1][-1], str(done.get_id()))
+        slurm.update_jobs()
+        self.assertEqual(array.state, 'RUNNING')
+        self.assertTrue(array.cancel())
+        _wait(slurm)
+        self.assertTrue(array.state.startswith('CANCELLED'))
+
+    def test_markers(self):
+        slurm = Slurm({'output': '/dev/null'})
+        slurm.watch_markers(scan_interval=60)
+        job = slurm.create_job('job').add_command('exit 2').set_marker(f'{self.root}/job.json')
+        array = slurm.create_job('array')
+        for i in range(2):
+            array.set_marker(f'{self.root}/task{i}.json', array.add_task('true'))
+        killed = slurm.create_job('killed').add_command('sleep 30').set_marker(f'{self.root}/killed.json')
+        for j in [job, array, killed]:
+            j.run()
+
+        with mock.patch('slurm.api.poll_job_states', wraps=sapi.poll_job_states) as poll:
+            terminated = slurm.update_jobs()  # the markers are watched from now on (existing ones are collected)
+            deadline = time.monotonic() + 10
+            while len(terminated) < 2 and time.monotonic() < deadline:
+                slurm.sleep(1)
+                terminated.extend(slurm.update_jobs())
+            self.assertEqual(poll.call_count, 0)  # SLURM is not polled for jobs with markers
+            self.assertEqual(sorted([j.get_name() for j in terminated]), ['array', 'job'])
+            self.assertEqual((job.state, job.exit_code), ('FAILED', 2))
+            self.assertEqual(array.state, 'COMPLETED')
+
+            # jobs killed before writing their markers are detected when they are verified by SLURM
+            killed.cancel()
+            slurm._watcher.scan_interval = 0
+            _wait(slurm)
+            self.assertTrue(killed.state.startswith('CANCELLED'))
+            self.assertGreater(poll.call_count, 0)
+
+    def test_run_jobs(self):
+        self.cluster.configure(execute=False)
+        slurm = Slurm({'output': '/dev/null'})
+        jobs = [slurm.create_job(f'job{i}').add_command('true') for i in range(4)]
+        res = slurm.run_jobs(jobs, max_parallel=4)
+        self.assertEqual(sorted(res.values()), [1, 2, 3, 4])
+        _wait(slurm)
+        self.assertTrue(all([job.state == 'COMPLETED' for job in jobs]))
+
+        self.cluster.configure(submit_fail_rate=1.0)
+        job = slurm.create_job('failing').add_command('true')
+        error = slurm.run_jobs([job], retries=1, retry_delay=0)['failing']
+        self.assertIsInstance(error, sapi.SlurmError)
+        self.assertIsNone(job.get_id())
+
+    def test_async(self):
+        self.cluster.configure(max_running=2)
+        slurm = aio.AsyncSlurm({'output': '/dev/null'}, poll_interval=0.05)
+
+        async def evaluate():
+            jobs = [slurm.create_job(f'job{i}').add_command('true') for i in range(3)]
+            sleeping = slurm.create_job('sleeping').add_command('sleep 30')
+            await asyncio.gather(*[job.submit() for job in jobs + [sleeping]])
+
+            async def collect():
+                return [job.get_name() async for job in slurm.completions()]
+
+            collector = asyncio.create_task(collect())
+            states = await asyncio.gather(jobs[0].wait(), jobs[1].wait())
+            self.assertTrue(await slurm.cancel(sleeping))
+            finished = await collector
+            self.assertFalse(await slurm.cancel(sleeping))
+            return states, finished, await jobs[2].wait()
+
+        with mock.patch('slurm.aio.poll_job_states', wraps=aio.poll_job_states) as get_job_states:
+            states, finished, last = asyncio.run(evaluate())
+        self.assertEqual(states, ['COMPLETED', 'COMPLETED'])
+        self.assertEqual(sorted(finished), ['job0', 'job1', 'job2', 'sleeping'])
+        self.assertEqual(last, 'COMPLETED')
+        self.assertTrue(slurm.get_job('sleeping').state.startswith('CANCELLED'))
+        # one shared poller (the waiting coroutines do not poll on their own)
+        ids = [call.args[0] for call in get_job_states.call_args_list]
+        self.assertTrue(all([len(set(call)) == len(call) for call in ids]))
+        self.assertLess(len(ids), 30)
+
+    def test_async_poller_error(self):
+        slurm = aio.AsyncSlurm({'output': '/dev/null'}, poll_interval=0.05)
+
+        async def evaluate():
+            job = slurm.create_job('job').add_command('sleep 30')
+            await job.submit()
+            with self.assertRaises(ValueError):  # the error is passed to the waiting coroutines
+                await job.wait()
+            with self.assertRaises(ValueError):
+                [job async for job in slurm.completions()]
+            await slurm.cancel(job)
+
+        with mock.patch('slurm.aio.poll_job_states', side_effect=ValueError('unexpected output')):
+            asyncio.run(asyncio.wait_for(evaluate(), 10))
+
+    def test_async_poll_fallback(self):
+        job_id = sapi.sbatch(SlurmArgs({'output': '/dev/null'}), ['true'])
+        with mock.patch('slurm.aio.get_queue_states', side_effect=sapi.SlurmError('squeue failed')):
+            states = asyncio.run(aio.poll_job_states([job_id]))
+        self.assertIn(job_id, states)  # sacct is used instead
+        with mock.patch('slurm.aio.get_queue_states', side_effect=TypeError('bug')):
+            with self.assertRaises(TypeError):  # other errors are not masked by the fallback
+                asyncio.run(aio.poll_job_states([job_id]))
+
+    def test_simulated_latency(self):
+        self.cluster.configure(execute=False, run_time=0.5, max_running=1)
+        slurm = Slurm({'output': '/dev/null'})
+        first = slurm.create_job('first').add_command('true')
+        second = slurm.create_job('second').add_command('true')
+        first.run()
+        second.run()
+        slurm.update_jobs()
+        self.assertEqual(first.state, 'RUNNING')
+        self.assertEqual(second.state, 'PENDING')  # the cluster is full
+        _wait(slurm)
+        self.assertEqual(second.state, 'COMPLETED')
+
+    def test_benchmark(self):
+        res = run_benchmark(self.root + '/bench', 5, 0.01)
+        self.assertEqual(res['jobs'], 5)
+        self.assertGreater(res['submit_rate'], 0)
+        self.assertGreaterEqual(res['polls'], 1)
+
+    def test_call_benchmark(self):
+        res = run_call_benchmark(self.root + '/bench', 2)
+        self.assertEqual(res['calls'], 2)
+        self.assertLess(res['cached_which_ms'], res['shell_which_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import stat
+import tempfile
+from helpers.file_copy import FileCopier, CopyStats, walk_tree
+from helpers.object_store import compute_digest
+
+
+class TestFileCopy(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = self.tmpdir.name + '/src'
+        self.dst = self.tmpdir.name + '/dst'
+        os.makedirs(self.src)
+        os.makedirs(self.dst)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+        return super().tearDown()
+
+    def create_file(self, name: str, content: str, mode: int = 0o640) -> str:
+        path = f'{self.src}/{name}'
+        with open(path, 'w') as fp:
+            fp.write(content)
+        os.chmod(path, mode)
+        return path
+
+    def get_file_contents(self, file: str) -> str:
+        with open(file, 'r') as fp:
+            return fp.read()
+
+    def test_all_methods(self):
+        for method in FileCopier.methods:
+            path = self.create_file(f'{method}.txt', f'data for {method}', 0o444)
+            copier = FileCopier(method)
+            stats = CopyStats()
+            used = copier.copy(path, f'{self.dst}/{method}.txt', stats, allow_hardlink=True)
+            self.assertIn(used, [method, 'copy'])
+            self.assertEqual(self.get_file_contents(f'{self.dst}/{method}.txt'), f'data for {method}')
+            self.assertEqual(stat.S_IMODE(os.stat(f'{self.dst}/{method}.txt').st_mode), 0o444)
+            self.assertEqual(stats.files, 1)
+            self.assertEqual(stats.bytes, len(f'data for {method}'))
+
+    def test_digests(self):
+        for method in FileCopier.methods:
+            path = self.create_file(f'{method}.txt', f'digest of {method}' * 100000, 0o444)
+            stats = CopyStats(compute_digests=True)
+            FileCopier(method).copy(path, f'{self.dst}/{method}.txt', stats)
+            self.assertEqual(stats.digests, {f'{self.dst}/{method}.txt': compute_digest(path)})
+            self.assertEqual(stat.S_IMODE(os.stat(f'{self.dst}/{method}.txt').st_mode), 0o444)
+
+    def test_writable_file_is_not_hardlinked(self):
+        path = self.create_file('writable.txt', 'data', 0o644)
+        copier = FileCopier('hardlink')
+        self.assertEqual(copier.copy(path, self.dst, allow_hardlink=True), 'copy')
+        self.assertNotEqual(os.stat(path).st_ino, os.stat(f'{self.dst}/writable.txt').st_ino)
+
+        with open(f'{self.dst}/writable.txt', 'w') as fp:
+            fp.write('modified')
+        self.assertEqual(self.get_file_contents(path), 'data')
+
+    def test_read_only_file_is_hardlinked(self):
+        path = self.create_file('readonly.txt', 'data', 0o444)
+        stats = CopyStats()
+        copier = FileCopier()
+        self.assertEqual(copier.copy(path, self.dst, stats, allow_hardlink=True), 'hardlink')
+        self.assertEqual(os.stat(path).st_ino, os.stat(f'{self.dst}/readonly.txt').st_ino)
+        self.assertEqual(stats.bytes_written, 0)
+
+        # hardlinks are used only if allowed (the source is owned by the tool)
+        self.assertNotEqual(copier.copy(path, f'{self.dst}/other.txt'), 'hardlink')
+        self.assertNotEqual(os.stat(path).st_ino, os.stat(f'{self.dst}/other.txt').st_ino)
+
+    def test_walk_tree_skips_loops(self):
+        os.makedirs(f'{self.src}/a/b')
+        self.create_file('a/b/file', 'data')
+        os.makedirs(f'{self.src}/shared')
+        self.create_file('shared/lib', 'lib')
+        os.symlink('..', f'{self.src}/a/b/loop')  # points to its own ancestor
+        os.symlink('../shared', f'{self.src}/a/shared')  # regular symlink to a dir is followed
+        walked = {os.path.relpath(dir, self.src): sorted(names) for dir, names in walk_tree(self.src)}
+        self.assertEqual(walked, {'.': [], 'a': [], 'a/b': ['file'], 'a/shared': ['lib'], 'shared': ['lib']})
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            FileCopier('teleport')
+
+
+if __name__ == '__main__':
+    unittest.main()
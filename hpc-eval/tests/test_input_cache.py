@@ -0,0 +1,59 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+import helpers.input_cache
+from helpers.input_cache import InputCache
+
+
+class TestInputCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        self.cache = InputCache(self.root + '/cache')
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def _create_file(self, name: str, content: str) -> str:
+        path = f'{self.root}/{name}'
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return path
+
+    def test_ingest(self):
+        a = self._create_file('a.txt', 'data')
+        b = self._create_file('b.txt', 'data')
+        c = self._create_file('c.txt', 'other')
+        res = self.cache.ingest([a, b, c])
+
+        self.assertEqual(res[a], res[b])  # same content is stored once
+        self.assertNotEqual(res[a][1], res[c][1])
+        digest, object = res[a]
+        with open(object) as fp:
+            self.assertEqual(fp.read(), 'data')
+        self.assertFalse(os.stat(object).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+        # originals are left intact
+        self.assertEqual(os.stat(a).st_nlink, 1)
+        self.assertTrue(os.access(a, os.W_OK))
+
+    def test_rehash_only_modified(self):
+        a = self._create_file('a.txt', 'data')
+        b = self._create_file('b.txt', 'more data')
+        self.cache.ingest([a, b])
+
+        with open(b, 'w') as fp:
+            fp.write('modified data')
+        cache = InputCache(self.root + '/cache')  # index is persistent
+        with mock.patch.object(helpers.input_cache, 'compute_digest',
+                               wraps=helpers.input_cache.compute_digest) as compute_digest:
+            res = cache.ingest([a, b])
+        compute_digest.assert_called_once_with(b)
+        with open(res[b][1]) as fp:
+            self.assertEqual(fp.read(), 'modified data')
+
+
+if __name__ == '__main__':
+    unittest.main()
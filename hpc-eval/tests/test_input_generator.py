@@ -0,0 +1,87 @@
+import os
+import stat
+import tempfile
+import unittest
+from components.assignments import Assignments
+from helpers.build_cache import BuildCache
+from helpers.input_generator import InputGenerator
+
+
+class TestInputGenerator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        self.script = f'{self.root}/gen.sh'
+        with open(self.script, 'w') as fp:
+            fp.write(f'echo run >> {self.root}/runs.log\necho "$SEED $*"\n')
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def _create_generator(self, max_size: int = 1 << 20) -> InputGenerator:
+        return InputGenerator(BuildCache(self.root + '/cache', max_size))
+
+    def _get_runs(self) -> int:
+        with open(f'{self.root}/runs.log') as fp:
+            return len(fp.readlines())
+
+    def test_generate_once(self):
+        a = {'name': 'a.txt', 'command': ['sh', self.script], 'params': ['10'], 'seed': 1}
+        b = {'name': 'b.txt', 'command': ['sh', self.script], 'params': ['10'], 'seed': 2}
+        generator = self._create_generator()
+        res = generator.generate([a, b, dict(a, name='c.txt')])
+        self.assertEqual(len(res), 2)  # the name is not a part of the key
+        self.assertEqual(self._get_runs(), 2)
+        with open(res[generator.get_key(a)]) as fp:
+            self.assertEqual(fp.read(), '1 10\n')
+        with open(res[generator.get_key(b)]) as fp:
+            self.assertEqual(fp.read(), '2 10\n')
+        self.assertFalse(os.stat(res[generator.get_key(a)]).st_mode & stat.S_IWUSR)
+
+        # outputs are memoized across evaluations
+        res = self._create_generator().generate([a, b])
+        self.assertEqual(self._get_runs(), 2)
+        self.assertEqual(len(res), 2)
+
+    def test_key_depends_on_executable(self):
+        generator = {'command': [self.script], 'params': ['10']}
+        interpreted = {'command': ['sh', self.script], 'params': ['10']}
+        key = self._create_generator().get_key(generator)
+        interpreted_key = self._create_generator().get_key(interpreted)
+        with open(self.script, 'a') as fp:
+            fp.write('echo modified\n')
+        self.assertNotEqual(key, self._create_generator().get_key(generator))
+        self.assertNotEqual(interpreted_key, self._create_generator().get_key(interpreted))
+
+    def test_relative_script(self):
+        config = {'ass': {'tests': {'t': {'generated': [{'name': 'a.txt', 'command': ['sh', 'gen.sh']}]}}}}
+        config = Assignments.get_config_schema().load(config, f'{self.root}/config.yaml')
+        generator = Assignments(config).get_generators()[0]
+        self.assertEqual(generator['command'], ['sh', self.script])  # made absolute relative to the config
+
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, os.path.dirname(self.root))  # the root is removed in tearDown()
+        # relative path given directly is resolved before the generator is executed in the staging dir
+        res = self._create_generator().generate([{'name': 'a.txt', 'command': ['sh', 'gen.sh'], 'seed': 3}])
+        with open(next(iter(res.values()))) as fp:
+            self.assertEqual(fp.read(), '3 \n')
+
+    def test_failed_generator(self):
+        generator = {'name': 'a.txt', 'command': ['sh', '-c', 'echo broken >&2; exit 3']}
+        other = {'name': 'b.txt', 'command': ['sh', self.script]}  # succeeds, but it is not committed
+        with self.assertRaisesRegex(RuntimeError, 'broken'):
+            self._create_generator().generate([generator, other])
+        self.assertEqual(os.listdir(f'{self.root}/cache/staging'), [])
+
+    def test_outputs_pinned(self):
+        generators = [{'name': 'a.txt', 'command': ['sh', self.script], 'seed': seed} for seed in range(3)]
+        generator = self._create_generator(1)  # each output exceeds the limit
+        res = generator.generate(generators)
+        self.assertTrue(all([os.path.isfile(file) for file in res.values()]))  # used by the running evaluation
+
+        generator.cache.unpin_all()  # the evaluation has finished
+        self.assertFalse(any([os.path.exists(file) for file in res.values()]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+import tempfile
+from components.manifest import Manifest
+from helpers.object_store import compute_digest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+        return super().tearDown()
+
+    def create_dir(self, name: str, files: dict) -> str:
+        root = f'{self.tmpdir.name}/{name}'
+        for file, content in files.items():
+            os.makedirs(os.path.dirname(f'{root}/{file}'), exist_ok=True)
+            with open(f'{root}/{file}', 'w') as fp:
+                fp.write(content)
+            os.chmod(f'{root}/{file}', 0o644)
+        return root
+
+    def test_from_dir(self):
+        dir = self.create_dir('a', {'main.cpp': 'int main();', 'inc/lib.hpp': '#pragma once'})
+        manifest = Manifest.from_dir(dir)
+        self.assertEqual(sorted(manifest.files), ['inc/lib.hpp', 'main.cpp'])
+        self.assertEqual(manifest.files['main.cpp'], {
+            'size': 11, 'mode': 0o644, 'hash': compute_digest(f'{dir}/main.cpp')})
+        self.assertEqual(manifest.get_size(), 11 + 12)
+
+        # precomputed digests are used
+        fake = {f'{dir}/main.cpp': 'f' * 64}
+        self.assertEqual(Manifest.from_dir(dir, fake).files['main.cpp']['hash'], 'f' * 64)
+
+    def test_tree_hash(self):
+        files = {'main.cpp': 'int main();', 'inc/lib.hpp': '#pragma once'}
+        manifest1 = Manifest.from_dir(self.create_dir('a', files))
+        manifest2 = Manifest.from_dir(self.create_dir('b', files))
+        self.assertEqual(manifest1.get_tree_hash(), manifest2.get_tree_hash())
+
+        os.chmod(f'{self.tmpdir.name}/b/main.cpp', 0o755)
+        self.assertNotEqual(manifest1.get_tree_hash(), Manifest.from_dir(f'{self.tmpdir.name}/b').get_tree_hash())
+        files['main.cpp'] = 'int main(void);'
+        self.assertNotEqual(manifest1.get_tree_hash(), Manifest.from_dir(self.create_dir('c', files)).get_tree_hash())
+
+    def test_serialization(self):
+        manifest = Manifest.from_dir(self.create_dir('a', {'main.cpp': 'int main();'}))
+        manifest2 = Manifest()
+        manifest2.deserialize(manifest.serialize())
+        self.assertEqual(manifest2.files, manifest.files)
+        self.assertEqual(manifest2.get_tree_hash(), manifest.get_tree_hash())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import unittest
+from components.solutions import Solutions
+from components.workspace import SolutionLayout
+from commands.submit import Submit
+from commands.migrate_solutions import MigrateSolutions
+from tests.command_tests import CommandTestsBase
+
+
+class TestMigrateSolutionsCommand(CommandTestsBase):
+    def test_migrate(self):
+        self.add_dummy_users(3)
+        prep_dir = self.create_temp_dir({'solution.cpp': 'int main() { return 0; }'})
+        for i in range(1, 4):
+            self.run_command(Submit(), [
+                '--external-id', f'sol{i}',
+                '--user', str(i),
+                '--assignment', 'ass',
+                prep_dir + '/solution.cpp',
+            ])
+
+        self.update_config('workspace', {'solutions_user_shards': 1, 'solutions_buckets': 'month'})
+        command = MigrateSolutions()
+        self.run_command(command, [])
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        layout = SolutionLayout(1, 'month')
+        for solution in solutions.solutions.values():
+            path = command.workspace.get_solution_dir(solution)
+            self.assertEqual(path, f'{self.rootdir}/_solutions/{layout.get_path(solution)}')
+            self.assertEqual(self.get_file_contents(f'{path}/solution.cpp'), 'int main() { return 0; }')
+            self.assertFalse(os.path.exists(f'{self.rootdir}/_solutions/ass/{solution.user_id}'))
+
+        # migration is idempotent
+        self.run_command(MigrateSolutions(), [])
+        for solution in solutions.solutions.values():
+            self.assertTrue(os.path.isdir(command.workspace.get_solution_dir(solution)))
+
+        # and it can go back
+        self.update_config('workspace', {'solutions_user_shards': 0, 'solutions_buckets': 'none'})
+        self.run_command(MigrateSolutions(), ['--from-user-shards', '1', '--from-buckets', 'month'])
+        for solution in solutions.solutions.values():
+            path = f'{self.rootdir}/_solutions/ass/{solution.user_id}/{solution.get_dir()}'
+            self.assertTrue(os.path.isdir(path))
+        self.assertEqual(sorted(os.listdir(f'{self.rootdir}/_solutions/ass')), ['1', '2', '3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
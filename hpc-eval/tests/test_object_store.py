@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+from helpers.object_store import ObjectStore, compute_digest
+
+
+class TestObjectStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ObjectStore(self.tmpdir.name + '/objects')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+        return super().tearDown()
+
+    def create_file(self, name: str, content: str, mode: int = 0o644) -> str:
+        path = f'{self.tmpdir.name}/{name}'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fp:
+            fp.write(content)
+        os.chmod(path, mode)
+        return path
+
+    def test_ingest(self):
+        file1 = self.create_file('a/file.txt', 'content')
+        file2 = self.create_file('b/file.txt', 'content')
+        file3 = self.create_file('c/file.txt', 'other content')
+        self.assertFalse(self.store.ingest(file1))
+        self.assertTrue(self.store.ingest(file2, compute_digest(file2)))
+        self.assertFalse(self.store.ingest(file3))
+
+        self.assertEqual(os.stat(file1).st_ino, os.stat(file2).st_ino)
+        self.assertNotEqual(os.stat(file1).st_ino, os.stat(file3).st_ino)
+        self.assertEqual(os.stat(file1).st_nlink, 3)
+        with open(file2, 'r') as fp:
+            self.assertEqual(fp.read(), 'content')
+        self.assertTrue(os.path.exists(self.store.get_object_path(compute_digest(file1))))
+
+    def test_executable_is_stored_separately(self):
+        file1 = self.create_file('a/run.sh', 'echo', 0o755)
+        file2 = self.create_file('b/run.sh', 'echo', 0o644)
+        self.store.ingest(file1)
+        self.store.ingest(file2)
+        self.assertNotEqual(os.stat(file1).st_ino, os.stat(file2).st_ino)
+        self.assertTrue(os.access(file1, os.X_OK))
+        self.assertFalse(os.access(file2, os.X_OK))
+
+    def test_gc_and_stats(self):
+        files = [self.create_file(f'{i}/file.txt', 'content' if i < 3 else f'content{i}') for i in range(5)]
+        for file in files:
+            self.store.ingest(file)
+
+        stats = self.store.get_stats()
+        self.assertEqual(stats['objects'], 3)
+        self.assertEqual(stats['references'], 5)
+        self.assertEqual(stats['physical_bytes'], 7 + 8 + 8)
+        self.assertEqual(stats['logical_bytes'], 3 * 7 + 8 + 8)
+
+        os.unlink(files[4])
+        self.assertEqual(self.store.gc(), (1, 8))
+        os.unlink(files[0])
+        self.assertEqual(self.store.gc(), (0, 0))
+        self.assertEqual(self.store.get_stats()['objects'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,17 @@
 import unittest
+from itertools import count
 import os
+import subprocess
 import tempfile
 import time
+from unittest import mock
 import slurm.api as sapi
 from slurm.args import SlurmArgs
+from slurm.job import SlurmJob
+from slurm.markers import CompletionWatcher, get_marker_script, read_marker
+from slurm.local import LocalExecutor, parse_count, parse_memory, parse_time_limit
 from slurm.slurm import Slurm
+from slurm.tracker import AdaptivePolling
 
 
 @unittest.skipIf(not sapi.is_slurm_available(), "SLURM client not available")
@@ -73,5 +80,354 @@ class TestSlurm(unittest.TestCase):
         tmpdir.cleanup()
 
 
+class TestSlurmArrays(unittest.TestCase):
+    def test_parse_job_states(self):
+        output = '\n'.join([
+            '100|COMPLETED|0:0',
+            '101_0|COMPLETED|0:0',
+            '101_1|FAILED|2:0',
+            '101_2|RUNNING|0:0',
+            '101_[3-4,6%2]|PENDING|0:0',
+            '999|COMPLETED|0:0',
+        ])
+        states = sapi.parse_job_states(output, [100, 101, 102])
+        self.assertEqual(states[100], {'state': 'COMPLETED', 'running': False, 'exit_code': 0, 'signal': 0})
+        self.assertIsNone(states[102])
+        self.assertNotIn(999, states)
+
+        tasks = states[101]['tasks']
+        self.assertTrue(states[101]['running'])
+        self.assertEqual(sorted(tasks), [0, 1, 2, 3, 4, 6])
+        self.assertEqual(tasks[1]['exit_code'], 2)
+        self.assertTrue(tasks[2]['running'])
+        self.assertEqual(tasks[6]['state'], 'PENDING')
+
+    def test_parse_job_steps(self):
+        output = '\n'.join([
+            '100|alloc|FAILED|1:0|20',
+            '100.batch|batch|FAILED|1:0|20',
+            '100.extern|extern|COMPLETED|0:0|20',
+            '100.0|build|COMPLETED|0:0|12',
+            '100.1|test1|FAILED|1:0|3',
+            '100.2|test2|RUNNING|0:0|5',
+        ])
+        steps = sapi.parse_job_steps(output, [100, 101])
+        self.assertEqual(steps[101], {})
+        self.assertEqual(sorted(steps[100]), ['build', 'test1', 'test2'])
+        self.assertEqual(steps[100]['build']['elapsed'], 12)
+        self.assertEqual(steps[100]['test1']['exit_code'], 1)
+        self.assertTrue(steps[100]['test2']['running'])
+
+    def test_parse_queue_states(self):
+        output = '\n'.join([
+            '100|RUNNING',
+            '101_0|COMPLETING',
+            '101_1|PENDING',
+            '102|COMPLETED',
+        ])
+        states = sapi.parse_queue_states(output, [100, 101, 102, 103])
+        self.assertEqual(states[100], {'state': 'RUNNING', 'running': True})
+        self.assertTrue(states[101]['running'])
+        self.assertEqual(sorted(states[101]['tasks']), [0, 1])
+        self.assertIsNone(states[102])  # terminated jobs are resolved by sacct
+        self.assertIsNone(states[103])
+
+    def test_array_job(self):
+        job = SlurmJob('arr')
+        job.add_command('cd /tmp')
+        self.assertEqual(job.add_task('echo 0'), 0)
+        self.assertEqual(job.add_task(['echo 1', 'false']), 1)
+        job.set_array_limit(4)
+        job._prepare_array()
+        self.assertEqual(job.args.get_arg_value('array'), '0-1%4')
+
+        script = job.get_script()
+        self.assertEqual(script[:2], ['cd /tmp', 'case "$SLURM_ARRAY_TASK_ID" in'])
+        self.assertEqual(script[script.index('1)') + 1:script.index('1)') + 3], ['echo 1', 'false'])
+        self.assertEqual(script[-1], 'esac')
+
+        completed = {'state': 'COMPLETED', 'running': False, 'exit_code': 0, 'signal': 0}
+        failed = {'state': 'FAILED', 'running': False, 'exit_code': 1, 'signal': 0}
+        job._process_update({'state': None, 'running': True, 'tasks': {0: completed}})
+        self.assertTrue(job.running)
+        self.assertEqual(job.state, 'PENDING')
+
+        job._process_update({'state': None, 'running': False, 'tasks': {0: completed, 1: failed}})
+        self.assertFalse(job.running)
+        self.assertEqual(job.state, 'FAILED')
+        self.assertEqual(job.exit_code, 1)
+        self.assertFalse(job.task_failed(0))
+        self.assertTrue(job.task_failed(1))
+
+
+class TestTracker(unittest.TestCase):
+    def test_split_ids(self):
+        self.assertEqual(sapi.split_ids([1, 22, 333, 4], 5), [[1, 22], [333], [4]])
+        self.assertEqual(sapi.split_ids([1, 2, 3]), [[1, 2, 3]])
+        self.assertGreater(sapi.get_arg_limit(), 1024)
+
+    def test_adaptive_polling(self):
+        polling = AdaptivePolling(1, 5, 2)
+        self.assertEqual([polling.update(False) for _ in range(4)], [2, 4, 5, 5])
+        self.assertEqual(polling.update(True), 1)
+        self.assertEqual(AdaptivePolling(0, 0).update(False), 0)
+
+    def test_update_jobs(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        slurm = Slurm({'output': '/dev/null'})
+        slurm.set_polling(1, 8)
+        jobs = [slurm.create_job(f'job{i}').add_command('true') for i in range(4)]
+        with mock.patch('slurm.api.sbatch', side_effect=[10, 11, 12]):
+            for job in jobs[:3]:
+                job.run()
+
+        def states(ids: list) -> dict:
+            return {id: {'state': 'COMPLETED', 'running': False, 'exit_code': 0, 'signal': 0} if id == 10
+                    else {'state': 'RUNNING', 'running': True} for id in ids}
+
+        with mock.patch('slurm.api.poll_job_states', side_effect=states) as get_job_states:
+            self.assertEqual(slurm.update_jobs(), [jobs[0]])
+            self.assertEqual(slurm.get_poll_interval(), 1)
+            self.assertEqual(slurm.update_jobs(), [])  # only the running jobs are queried
+            self.assertEqual(slurm.get_poll_interval(), 2)
+            self.assertEqual([call.args[0] for call in get_job_states.call_args_list], [[10, 11, 12], [11, 12]])
+
+            self.assertIs(slurm.get_job_by_id(11), jobs[1])
+            self.assertIs(slurm.release('job2'), jobs[2])
+            self.assertIsNone(slurm.get_job_by_id(12))
+            slurm.update_jobs()
+            self.assertEqual(get_job_states.call_args.args[0], [11])
+
+            # a job replaced behind the tracker's back (the number of jobs is the same)
+            replaced = SlurmJob('job1', slurm.default_args)
+            replaced.id, replaced.running = 13, True
+            slurm.jobs['job1'] = replaced
+            self.assertIs(slurm.get_job_by_id(13), replaced)
+            self.assertIsNone(slurm.get_job_by_id(11))
+            slurm.update_jobs()
+            self.assertEqual(get_job_states.call_args.args[0], [13])
+            slurm.jobs['job1'] = jobs[1]
+
+            # the index is rebuilt after deserialization
+            slurm.set_serialization_file(tmpdir.name + '/slurm.json')
+            slurm.save_json()
+            slurm2 = Slurm()
+            slurm2.set_serialization_file(tmpdir.name + '/slurm.json')
+            slurm2.load_json()
+            self.assertEqual(slurm2.get_job_by_id(11).get_name(), 'job1')
+            slurm2.update_jobs()
+            self.assertEqual(get_job_states.call_args.args[0], [11])
+        tmpdir.cleanup()
+
+
+class TestMarkers(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_marker_script(self):
+        marker = f'{self.root}/done.json'
+        script = get_marker_script(['echo hello', 'exit 3', 'echo unreachable'], marker)
+        result = subprocess.run(['/bin/sh', '-c', '\n'.join(script)], capture_output=True, text=True, cwd=self.root)
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, 'hello\n')
+        state = read_marker(marker)
+        self.assertEqual((state['state'], state['exit_code'], state['running']), ('FAILED', 3, False))
+        self.assertLessEqual(state['started'], state['finished'])
+        self.assertFalse(os.path.exists(marker + '.tmp'))
+        self.assertIsNone(read_marker(f'{self.root}/missing.json'))
+
+        script = get_marker_script(["sh -c 'kill -TERM $$'"], marker)  # the command is killed by a signal
+        subprocess.run(['/bin/sh', '-c', '\n'.join(script)], cwd=self.root)
+        state = read_marker(marker)
+        self.assertEqual((state['state'], state['exit_code'], state['signal']), ('FAILED', 143, 15))
+
+    def test_watcher(self):
+        for use_inotify in [True, False]:
+            watcher = CompletionWatcher(scan_interval=60, use_inotify=use_inotify)
+            os.makedirs(f'{self.root}/{use_inotify}')
+            marker = f'{self.root}/{use_inotify}/done.json'
+            watcher.add(marker, 'key')
+            self.assertEqual(watcher.collect(), [])
+            with open(f'{self.root}/{use_inotify}/stdout.log', 'w') as fp:
+                fp.write('unrelated')
+            subprocess.run(['/bin/sh', '-c', '\n'.join(get_marker_script(['true'], marker))], cwd=self.root)
+
+            start = time.monotonic()
+            watcher.wait(0.5 if not use_inotify else 10)
+            if use_inotify and watcher.uses_inotify():
+                self.assertLess(time.monotonic() - start, 5)  # woken up by the marker
+            res = watcher.collect()
+            self.assertEqual([(key, state['state']) for key, state in res], [('key', 'COMPLETED')])
+            self.assertEqual(watcher.collect(), [])  # no longer watched
+            watcher.close()
+            self.assertFalse(watcher.uses_inotify())
+
+    def test_slurm_close(self):
+        slurm = Slurm()
+        slurm.watch_markers()
+        watcher = slurm._watcher
+        slurm.close()
+        self.assertIsNone(slurm._watcher)
+        self.assertFalse(watcher.uses_inotify())  # the descriptor is released
+
+        executor = LocalExecutor()
+        executor.watch_markers()  # terminations are taken from the processes
+        self.assertIsNone(executor._watcher)
+
+
+class TestRunJobs(unittest.TestCase):
+    def test_retries(self):
+        slurm = Slurm({'output': '/dev/null'})
+        jobs = [slurm.create_job(name).add_command('true') for name in ['a', 'b']]
+        errors = [sapi.SlurmError('failed', returncode=1, stderr='sbatch: error: Socket timed out on send/recv'),
+                  sapi.SlurmError('failed', returncode=1, stderr='sbatch: error: Invalid account')]
+        with mock.patch('slurm.api.sbatch', side_effect=[errors[0], 42, errors[1]]) as sbatch:
+            res = slurm.run_jobs(jobs, retry_delay=0)
+        self.assertEqual(res, {'a': 42, 'b': errors[1]})  # only the transient error is retried
+        self.assertEqual(sbatch.call_count, 3)
+        self.assertEqual(jobs[0].get_id(), 42)
+        self.assertIsNone(jobs[1].get_id())
+
+    def test_parallel_and_rate(self):
+        slurm = Slurm({'output': '/dev/null'})
+        jobs = [slurm.create_job(f'job{i}').add_command('true') for i in range(6)]
+        ids = count(1)
+        with mock.patch('slurm.api.sbatch', side_effect=lambda args, commands: next(ids)):
+            start = time.monotonic()
+            res = slurm.run_jobs(jobs, max_parallel=3, submit_rate=20)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)  # 6 submissions at 20/s
+        self.assertEqual(sorted(res.values()), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(sorted([job.get_id() for job in jobs]), [1, 2, 3, 4, 5, 6])
+
+
+class TestLocalExecutor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def _read(self, file: str) -> str:
+        with open(f'{self.root}/{file}') as fp:
+            return fp.read()
+
+    def test_parse_limits(self):
+        self.assertEqual(parse_time_limit('5'), 300)
+        self.assertEqual(parse_time_limit('1:30'), 90)
+        self.assertEqual(parse_time_limit('1:00:05'), 3605)
+        self.assertEqual(parse_time_limit('1-2'), 93600)
+        self.assertEqual(parse_time_limit('1-0:01:01'), 86461)
+        self.assertIsNone(parse_time_limit('UNLIMITED'))
+        self.assertEqual(parse_memory('100'), 100 << 20)
+        self.assertEqual(parse_memory('2G'), 2 << 30)
+        self.assertEqual(parse_memory('512K'), 512 << 10)
+        self.assertEqual(parse_count(4), 4)
+        self.assertEqual(parse_count('4'), 4)
+        self.assertEqual(parse_count('--cpus-per-task=4'), 4)
+        self.assertEqual(parse_count('many'), 1)
+
+    def test_jobs(self):
+        slurm = LocalExecutor({'output': f'{self.root}/out.log', 'chdir': self.root})
+        job = slurm.create_job("foo")
+        job.add_command(['echo hello', 'echo err >&2'])
+        job.run()
+        self.assertIsNotNone(job.get_id())
+
+        while job.is_running(state_timeout=1):
+            time.sleep(0.05)
+
+        self.assertFalse(job.is_running())
+        self.assertFalse(job.failed())
+        self.assertEqual(job.exit_code, 0)
+        self.assertEqual(self._read('out.log'), 'hello\nerr\n')
+        self.assertEqual(slurm.update_jobs(), [job])  # termination is reported once
+        self.assertEqual(slurm.update_jobs(), [])
+
+    def test_arrays_and_dependencies(self):
+        slurm = LocalExecutor({'output': f'{self.root}/%A_%a.log', 'chdir': self.root}, workers=2)
+        array = slurm.create_job('array')
+        array.add_task('echo $SLURM_ARRAY_TASK_ID')
+        array.add_task('exit 3')
+        array.set_array_limit(1)
+        array.run()
+        ok = slurm.create_job('ok').add_args('dependency', f'afterok:{array.get_id()}_0')
+        ok.add_command('true').run()
+        skipped = slurm.create_job('skipped').add_args('dependency', f'afterok:{array.get_id()}')
+        skipped.add_command(f'touch {self.root}/skipped').run()
+        slurm.wait()
+
+        self.assertEqual(array.state, 'FAILED')
+        self.assertEqual(array.exit_code, 3)
+        self.assertEqual(self._read(f'{array.get_id()}_0.log'), '0\n')
+        self.assertEqual(ok.state, 'COMPLETED')
+        self.assertEqual(skipped.state, 'CANCELLED')
+        self.assertFalse(os.path.exists(f'{self.root}/skipped'))
+        self.assertEqual(sorted([job.get_name() for job in slurm.update_jobs()]), ['array', 'ok', 'skipped'])
+
+    def test_limits(self):
+        slurm = LocalExecutor({'output': f'{self.root}/out.log', 'chdir': self.root, 'mem': '512M',
+                               'time': '0:01'})
+        job = slurm.create_job('limits')
+        job.add_command(['ulimit -v', 'nproc', 'sleep 10'])
+        start = time.monotonic()
+        job.run()
+        slurm.wait()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(job.state, 'TIMEOUT')
+        self.assertTrue(job.failed())
+        self.assertEqual(self._read('out.log').split(), [str(512 << 10), '1'])  # ulimit -v is in KiB
+
+        if len(os.sched_getaffinity(0)) > 1:
+            job = slurm.create_job('cpus').add_command('nproc')
+            job.args.args['cpus-per-task'] = '--cpus-per-task=2'  # e.g., taken over from a raw sbatch option
+            job.args.args['time'] = '1'
+            job.run()
+            slurm.wait()
+            self.assertEqual(job.state, 'COMPLETED')
+            self.assertEqual(self._read('out.log').split()[-1], '2')
+
+    def test_queries_do_not_start_jobs(self):
+        slurm = LocalExecutor({'output': '/dev/null'}, workers=1)
+        first = slurm.create_job('first').add_command('true')
+        second = slurm.create_job('second').add_command('true')
+        first.run()
+        second.run()
+        while first.is_running(state_timeout=1):
+            time.sleep(0.05)
+        self.assertTrue(second.is_running(state_timeout=1))
+        self.assertEqual(second.get_state(state_timeout=1), 'PENDING')  # the worker is free, but nothing started
+        self.assertEqual(slurm.update_jobs(), [first])
+        self.assertEqual(second.state, 'RUNNING')
+        slurm.wait()
+        self.assertEqual(second.state, 'COMPLETED')
+
+    def test_run_jobs_rate(self):
+        slurm = LocalExecutor({'output': '/dev/null'})
+        jobs = [slurm.create_job(f'job{i}').add_command('true') for i in range(4)]
+        start = time.monotonic()
+        res = slurm.run_jobs(jobs, max_parallel=4, submit_rate=20)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)  # 4 submissions at 20/s
+        self.assertEqual(sorted(res.values()), [1, 2, 3, 4])
+        slurm.wait()
+
+    def test_cancel(self):
+        slurm = LocalExecutor({'output': '/dev/null'}, workers=1)
+        running = slurm.create_job('running').add_command('sleep 10')
+        queued = slurm.create_job('queued').add_command('true')
+        running.run()
+        queued.run()
+        self.assertTrue(queued.cancel())
+        self.assertTrue(running.cancel())
+        slurm.wait()
+        self.assertEqual(running.state, 'CANCELLED')
+        self.assertEqual(queued.state, 'CANCELLED')
+        self.assertFalse(running.cancel())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,15 @@
+import io
 import os
+import tarfile
 import unittest
+import shutil
 import zipfile
+from unittest import mock
+import helpers.file_copy
 from components.solutions import Solutions
+from helpers.archive import ArchiveError
 from commands.submit import Submit
+from commands.gc import Gc
 from tests.command_tests import CommandTestsBase
 
 
@@ -40,6 +47,13 @@ class TestSubmitCommand(CommandTestsBase):
             self.assertTrue(os.path.exists(path))
             self.assertEqual(self.get_file_contents(path), content)
 
+        manifest = command.workspace.load_manifest(solution.manifest)
+        self.assertIsNotNone(manifest)
+        self.assertEqual(manifest.get_tree_hash(), solution.manifest)
+        self.assertEqual(sorted(manifest.files), sorted(files))
+        for name, content in files.items():
+            self.assertEqual(manifest.files[name]['size'], len(content))
+
     def test_submit_with_subdirs(self):
         self.add_dummy_users(2)
         files = {
@@ -160,6 +174,176 @@ class TestSubmitCommand(CommandTestsBase):
             self.assertTrue(os.path.exists(path))
             self.assertEqual(self.get_file_contents(path), content)
 
+    def test_tar_gz_submit(self):
+        self.add_dummy_users(1)
+        files = {
+            'solution.hpp': '#define N 42',
+            'src/solution.cpp': '#include "solution.hpp";\nint main() { return N; }',
+        }
+        prep_dir = self.create_temp_dir()
+        with tarfile.open(prep_dir + '/submit.tar.gz', 'w:gz') as tar:
+            for file, content in files.items():
+                info = tarfile.TarInfo(file)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content.encode('utf-8')))
+
+        command = Submit()
+        self.run_command(command, [
+            '--external-id', 'sol1',
+            '--user', '1',
+            '--assignment', 'ass',
+            '--extract',
+            prep_dir + '/submit.tar.gz',
+        ])
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        solution = solutions.get_by_external_id('sol1')
+        self.assertIsNotNone(solution)
+        for name, content in files.items():
+            path = f'{self.rootdir}/_solutions/ass/1/{solution.get_dir()}/{name}'
+            self.assertEqual(self.get_file_contents(path), content)
+
+    def test_zip_bomb_submit(self):
+        self.add_dummy_users(1)
+        self.update_config('workspace', {'extract_max_size': 1 << 20})
+        prep_dir = self.create_temp_dir()
+        with zipfile.ZipFile(prep_dir + '/submit.zip', 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr('zeros.bin', '\0' * (1 << 22))
+
+        command = Submit()
+        command.parse_args(['--external-id', 'sol1', '--user', '1', '--assignment', 'ass', '--extract',
+                            prep_dir + '/submit.zip'])
+        command.load_config()
+        command.load_state()
+        with self.assertRaises(ArchiveError):
+            command.execute()
+        command.save_state()
+
+        self.assertEqual(os.listdir(command.workspace.tmp_dir), [])
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        self.assertEqual(len(solutions), 0)
+
+    def test_submit_many_files_parallel(self):
+        self.add_dummy_users(1)
+        self.update_config('workspace', {'copy_workers': 8})
+        files = {f'src/mod{i}/file{j}.cpp': f'int f{i}_{j}() {{ return {i * j}; }}'
+                 for i in range(5) for j in range(20)}
+        prep_dir = self.create_temp_dir(files)
+        os.makedirs(f'{prep_dir}/src/empty')
+
+        command = Submit()
+        self.run_command(command, [
+            '--external-id', 'sol1',
+            '--user', '1',
+            '--assignment', 'ass',
+            prep_dir + '/src/',
+        ])
+        self.assertEqual(command.workspace.copy_workers, 8)
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        solution = solutions.get_by_external_id('sol1')
+        self.assertIsNotNone(solution)
+        box = f'{self.rootdir}/_solutions/ass/1/{solution.get_dir()}'
+        self.assertTrue(os.path.isdir(f'{box}/src/empty'))
+        for name, content in files.items():
+            self.assertEqual(self.get_file_contents(f'{box}/{name}'), content)
+
+    def test_submit_failed_staging(self):
+        self.add_dummy_users(1)
+        self.update_config('workspace', {'copy_method': 'copy'})
+        files = {f'file{i}.txt': str(i) for i in range(10)}
+        prep_dir = self.create_temp_dir(files)
+
+        original_copy = helpers.file_copy._copy
+
+        def failing_copy(src, dst, hash=None):
+            if src.endswith('file7.txt'):
+                raise OSError("Simulated I/O error.")
+            return original_copy(src, dst, hash)
+
+        command = Submit()
+        command.parse_args(['--external-id', 'sol1', '--user', '1', '--assignment', 'ass', prep_dir])
+        command.load_config()
+        command.load_state()
+        with mock.patch('helpers.file_copy._copy', failing_copy):
+            with self.assertRaises(OSError):
+                command.execute()
+        command.save_state()
+
+        self.assertEqual(os.listdir(command.workspace.tmp_dir), [])  # staging dir was removed
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        self.assertEqual(len(solutions), 0)
+
+    def test_submitted_files_are_not_linked(self):
+        self.add_dummy_users(1)
+        prep_dir = self.create_temp_dir({'solution.cpp': 'int main() { return 0; }'})
+        source = prep_dir + '/solution.cpp'
+        os.chmod(source, 0o444)  # read-only file of the submitter on the same device
+        command = Submit()
+        self.run_command(command, ['--external-id', 'sol1', '--user', '1', '--assignment', 'ass', source])
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        archived = f"{command.workspace.get_solution_dir(solutions.get_by_external_id('sol1'))}/solution.cpp"
+        self.assertNotEqual(os.stat(source).st_ino, os.stat(archived).st_ino)
+        os.chmod(source, 0o644)  # the submitter modifies the file after the deadline
+        with open(source, 'w') as fp:
+            fp.write('modified')
+        self.assertEqual(self.get_file_contents(archived), 'int main() { return 0; }')
+
+    def test_submit_symlink_loop(self):
+        self.add_dummy_users(1)
+        prep_dir = self.create_temp_dir({'src/a/b/solution.cpp': 'int main() { return 0; }'})
+        os.symlink('..', prep_dir + '/src/a/b/loop')
+        command = Submit()
+        self.run_command(command, ['--external-id', 'sol1', '--user', '1', '--assignment', 'ass', prep_dir + '/src'])
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        solution_dir = command.workspace.get_solution_dir(solutions.get_by_external_id('sol1'))
+        self.assertEqual(self.get_file_contents(f'{solution_dir}/src/a/b/solution.cpp'), 'int main() { return 0; }')
+        self.assertFalse(os.path.exists(f'{solution_dir}/src/a/b/loop'))
+
+    def test_dedup_submits(self):
+        self.add_dummy_users(2)
+        self.update_config('workspace', {'dedup': True})
+        files = {
+            'solution.hpp': '#define N 42',
+            'solution.cpp': '#include "solution.hpp";\nint main() { return N; }',
+        }
+        prep_dir = self.create_temp_dir(files)
+
+        for i in range(1, 3):
+            self.run_command(Submit(), [
+                '--external-id', f'sol{i}',
+                '--user', str(i),
+                '--assignment', 'ass',
+                prep_dir + '/solution.hpp',
+                prep_dir + '/solution.cpp',
+            ])
+
+        solutions = Solutions({'file': f'{self.rootdir}/_solutions/solutions.json'})
+        solutions.load_json()
+        boxes = [f'{self.rootdir}/_solutions/ass/{i}/{solutions.get_by_external_id(f"sol{i}").get_dir()}'
+                 for i in range(1, 3)]
+        for name, content in files.items():
+            self.assertEqual(self.get_file_contents(f'{boxes[0]}/{name}'), content)
+            self.assertEqual(os.stat(f'{boxes[0]}/{name}').st_ino, os.stat(f'{boxes[1]}/{name}').st_ino)
+            self.assertEqual(os.stat(f'{boxes[0]}/{name}').st_nlink, 3)
+
+        # objects are collected only after all references are gone
+        command = Gc()
+        shutil.rmtree(boxes[0])
+        self.run_command(command, [])
+        self.assertEqual(command.workspace.object_store.get_stats()['objects'], 2)
+        shutil.rmtree(boxes[1])
+        self.run_command(command, [])
+        self.assertEqual(command.workspace.object_store.get_stats()['objects'], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+import calendar
+import unittest
+import os
+import tempfile
+import time
+from unittest import mock
+from components.solutions import Solution
+from components.workspace import Workspace, SolutionLayout
+
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workspace = Workspace({'root': self.tmpdir.name})
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+        return super().tearDown()
+
+    def test_create_tmp_dir(self):
+        dirs = set([self.workspace.create_tmp_dir('submit') for _ in range(100)])
+        self.assertEqual(len(dirs), 100)
+        for dir in dirs:
+            self.assertTrue(os.path.isdir(dir))
+            self.assertEqual(os.path.dirname(dir), self.workspace.tmp_dir)
+            self.assertTrue(os.path.basename(dir).startswith('submit'))
+
+    def test_cleanup_tmp_dirs(self):
+        fresh = self.workspace.create_tmp_dir()
+        stale = self.workspace.create_tmp_dir()
+        in_use = self.workspace.create_tmp_dir()
+        old = time.time() - 2 * self.workspace.tmp_max_age
+        for dir in [stale, in_use]:
+            os.makedirs(f'{dir}/sub')
+            with open(f'{dir}/sub/file.txt', 'w') as fp:
+                fp.write('data')
+            for path in [f'{dir}/sub/file.txt', f'{dir}/sub', dir]:
+                os.utime(path, (old, old))
+        with open(f'{in_use}/sub/file.txt', 'a') as fp:  # written deep in the tree, the dirs are not touched
+            fp.write('more data')
+
+        self.assertEqual(self.workspace.cleanup_tmp_dirs(), 1)
+        self.assertTrue(os.path.isdir(fresh))
+        self.assertTrue(os.path.isdir(in_use))
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(self.workspace.cleanup_tmp_dirs(), 0)
+
+    def test_cleanup_rate_limited(self):
+        old = time.time() - 2 * self.workspace.tmp_max_age
+        stale = [self.workspace.create_tmp_dir() for _ in range(2)]
+        os.utime(stale[0], (old, old))
+        self.assertEqual(self.workspace.cleanup_tmp_dirs_if_due(), 1)
+        self.assertFalse(os.path.exists(stale[0]))
+
+        os.utime(stale[1], (old, old))
+        self.assertEqual(self.workspace.cleanup_tmp_dirs_if_due(), 0)  # the interval has not passed yet
+        self.assertTrue(os.path.isdir(stale[1]))
+        self.assertEqual(self.workspace.cleanup_tmp_dirs(), 1)  # explicit cleanup (gc) is not limited
+        self.assertEqual(os.listdir(self.workspace.tmp_dir), ['.last-cleanup'])
+
+    def test_cleanup_missing_tmp_zone(self):
+        self.assertEqual(self.workspace.cleanup_tmp_dirs(), 0)
+
+    def test_solution_layouts(self):
+        solution = Solution('42', user_id='u1', assignment_id='a1')
+        solution.submitted_at = calendar.timegm((2024, 3, 31, 23, 30, 0))  # UTC, the next day in eastern zones
+        name = solution.get_dir()
+
+        self.assertEqual(SolutionLayout().get_path(solution), f'a1/u1/{name}')
+        self.assertEqual(SolutionLayout(buckets='month').get_path(solution), f'a1/u1/2024-03/{name}')
+        path = SolutionLayout(2, 'year').get_path(solution).split('/')
+        self.assertEqual(len(path), 6)
+        self.assertEqual(path[0], 'a1')
+        self.assertEqual([len(p) for p in path[1:3]], [2, 2])
+        self.assertEqual(path[3:], ['u1', '2024', name])
+        with mock.patch.dict(os.environ, {'TZ': 'Asia/Tokyo'}):
+            time.tzset()
+            self.assertEqual(SolutionLayout(buckets='month').get_path(solution), f'a1/u1/2024-03/{name}')
+        time.tzset()
+
+        workspace = Workspace({'root': self.tmpdir.name, 'solutions_user_shards': 1, 'solutions_buckets': 'day'})
+        self.assertEqual(workspace.get_solution_dir(solution),
+                         f'{workspace.solutions_dir}/{SolutionLayout(1, "day").get_path(solution)}')
+
+
+if __name__ == '__main__':
+    unittest.main()